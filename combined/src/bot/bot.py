@@ -1,16 +1,29 @@
-import telebot
+import asyncio
 import os
 import tempfile
 import logging
+import uuid
+from typing import Optional
 from dotenv import load_dotenv
-from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
-from src.bot.utils import extract_archive, get_project_structure, parse_review_tags
+from telebot.async_telebot import AsyncTeleBot
+from src.bot.jobs import (
+    RESULTS_BUCKET,
+    QueueFullError,
+    ReviewJob,
+    make_job_backend,
+    result_object_name,
+)
+from src.bot.messages import (
+    count_pages,
+    create_pagination_keyboard,
+    create_review_message,
+    page_range,
+)
+from src.bot.sessions import ReviewSession, SessionStore
 from telebot.handler_backends import State, StatesGroup
-from telebot.storage import StateMemoryStorage
+from telebot.asyncio_storage import StateMemoryStorage
 from src.bot.storage import MinioStorage
 from datetime import datetime
-from src.review.review import ProjectReviewer, FileReviewer
-from pathlib import Path
 
 # Setup logging
 logging.basicConfig(
@@ -24,135 +37,97 @@ BOT_TOKEN = os.getenv("BOT_TOKEN")
 
 # Initialize bot with state storage
 state_storage = StateMemoryStorage()
-bot = telebot.TeleBot(BOT_TOKEN, state_storage=state_storage)
+bot = AsyncTeleBot(BOT_TOKEN, state_storage=state_storage)
 
 # Initialize MinIO storage
 storage = MinioStorage()
 
-# Store review results globally (in-memory storage)
-review_results = {}
-
-
-class ReviewStates(StatesGroup):
-    viewing_reviews = State()
-    current_page = State()
-
-
-def create_review_message(reviews: list, page: int, total_pages: int) -> str:
-    """Create a formatted review message for the current page."""
-    REVIEWS_PER_PAGE = 3
-    start_idx = (page - 1) * REVIEWS_PER_PAGE
-    end_idx = start_idx + REVIEWS_PER_PAGE
-    current_reviews = reviews[start_idx:end_idx]
-
-    message_parts = [f"📝 Обзоры кода (Страница {page}/{total_pages})\n"]
-
-    for review in current_reviews:
-        # Escape special characters in the review text
-        review_text = review['review'].replace('_', '\\_').replace('*', '\\*').replace('`', '\\`')
-
-        message_parts.extend([
-            f"\n📄 {review['file']} (line {review['line_number']})",
-            f"💡 Ревью: {review_text}",
-            f"\nТекущий код:",
-            f"```\n{review['code'].strip()}\n```",
-        ])
-
-        if review.get("suggested_code"):
-            message_parts.append(f"Предлагаемый код:")
-            message_parts.append(f"```\n{review['suggested_code'].strip()}\n```")
-
-        message_parts.append("─" * 40)
+# Reviews are run by the review workers, see `src.bot.worker`
+job_backend = make_job_backend()
 
-    message_parts.append(
-        "\nИспользуй кнопки ниже для навигации по страницам или скачай полный отчет."
-    )
 
-    # Join all parts and ensure proper escaping
-    return "\n".join(message_parts)
+def load_stored_results(job_id: str) -> Optional[dict]:
+    """Results of a job saved by the review worker, None if there are none."""
+    try:
+        return storage.load_json(RESULTS_BUCKET, result_object_name(job_id))
+    except Exception as e:
+        logger.warning(f"Could not load results of job {job_id}: {e}")
+        return None
 
 
-def create_pagination_keyboard(
-    current_page: int, total_pages: int, user_id: int
-) -> InlineKeyboardMarkup:
-    """Create pagination keyboard with download button."""
-    keyboard = InlineKeyboardMarkup(row_width=5)
-    buttons = []
+# Results of finished jobs by job id, bounded and expiring, see `src.bot.sessions`
+sessions = SessionStore(loader=load_stored_results)
 
-    # First page
-    if current_page > 1:
-        buttons.append(InlineKeyboardButton("⏮️", callback_data=f"page_{user_id}_1"))
 
-    # Previous page
-    if current_page > 1:
-        buttons.append(
-            InlineKeyboardButton("◀️", callback_data=f"page_{user_id}_{current_page-1}")
-        )
-
-    # Current page indicator
-    buttons.append(
-        InlineKeyboardButton(f"{current_page}/{total_pages}", callback_data="noop")
-    )
+class ReviewStates(StatesGroup):
+    viewing_reviews = State()
+    current_page = State()
 
-    # Next page
-    if current_page < total_pages:
-        buttons.append(
-            InlineKeyboardButton("▶️", callback_data=f"page_{user_id}_{current_page+1}")
-        )
 
-    # Last page
-    if current_page < total_pages:
-        buttons.append(
-            InlineKeyboardButton("⏭️", callback_data=f"page_{user_id}_{total_pages}")
+async def set_status(job: ReviewJob, text: str) -> None:
+    """Show the state of a job in its status message."""
+    try:
+        await bot.edit_message_text(
+            text, chat_id=job.chat_id, message_id=job.status_message_id
         )
+    except Exception as e:
+        logger.warning(f"Could not update status of job {job.id}: {e}")
 
-    # Add navigation buttons row
-    keyboard.add(*buttons)
 
-    # Add download button in new row
-    keyboard.add(
-        InlineKeyboardButton(
-            "📥 Скачать полный отчет", callback_data=f"download_{user_id}_all"
-        )
-    )
-
-    return keyboard
+async def load_session(job_id: str, user_id: int) -> Optional[ReviewSession]:
+    """Results of a finished job of the user, None if there are none or they expired."""
+    session = await asyncio.to_thread(sessions.get, job_id)
+    # Buttons of a forwarded message must not open the results of another user
+    if session is None or session.user_id != user_id:
+        return None
+    return session
 
 
 @bot.callback_query_handler(func=lambda call: call.data.startswith("page_"))
-def handle_pagination(call):
+async def handle_pagination(call):
     """Handle pagination button clicks."""
     try:
-        _, user_id, page = call.data.split("_")
+        _, job_id, page = call.data.split("_")
         page = int(page)
-        user_id = int(user_id)
 
-        if str(user_id) not in review_results:
-            bot.answer_callback_query(
+        session = await load_session(job_id, call.from_user.id)
+        if session is None:
+            await bot.answer_callback_query(
                 call.id, "Сессия проверки закончена. Отправь архив снова."
             )
             return
 
-        reviews = review_results[str(user_id)]["reviews"]
-        total_pages = review_results[str(user_id)]["total_pages"]
+        total_pages = count_pages(session.total)
+        # Only the blocks of this page are decompressed
+        reviews = session.records(*page_range(page))
 
         message = create_review_message(reviews, page, total_pages)
         keyboard = create_pagination_keyboard(
-            page, total_pages, user_id
+            page, total_pages, job_id
         )  # Now includes download button
 
-        bot.edit_message_text(
-            message,
-            chat_id=call.message.chat.id,
-            message_id=call.message.message_id,
-            reply_markup=keyboard,
-            parse_mode="Markdown",
-        )
-        bot.answer_callback_query(call.id)
+        try:
+            await bot.edit_message_text(
+                message,
+                chat_id=call.message.chat.id,
+                message_id=call.message.message_id,
+                reply_markup=keyboard,
+                parse_mode="Markdown",
+            )
+        except Exception as e:
+            # Telegram refuses Markdown it can't parse, e.g. in a code snippet
+            logger.warning(f"Showing page {page} of job {job_id} as plain text: {e}")
+            await bot.edit_message_text(
+                message,
+                chat_id=call.message.chat.id,
+                message_id=call.message.message_id,
+                reply_markup=keyboard,
+            )
+        await bot.answer_callback_query(call.id)
 
     except Exception as e:
         logger.error(f"Error handling pagination: {e}", exc_info=True)
-        bot.answer_callback_query(
+        await bot.answer_callback_query(
             call.id, "❌ Не удалось перейти на другую страницу. Попробуйте снова."
         )
 
@@ -199,7 +174,7 @@ def is_supported_file(file_name: str) -> tuple[bool, str]:
 
 
 @bot.message_handler(commands=["start", "help"])
-def send_welcome(message):
+async def send_welcome(message):
     """Handle the /start and /help commands."""
     welcome_text = (
         "Привет! Я помогу найти и проверить твой код на соответствие стандартам.\n\n"
@@ -208,34 +183,50 @@ def send_welcome(message):
         "2. Отдельные файлы с кодом (Python, JavaScript, TypeScript и др.)\n\n"
         "Я проанализирую базу знаний и покажу, что нужно изменить."
     )
-    bot.reply_to(message, welcome_text)
+    await bot.reply_to(message, welcome_text)
+
+
+@bot.message_handler(commands=["status"])
+async def send_status(message):
+    """Report the load of the review queue."""
+    counts = await asyncio.to_thread(job_backend.counts)
+    await bot.reply_to(
+        message,
+        f"⏳ В очереди: {counts.get('queued', 0)}, "
+        f"проверяется: {counts.get('running', 0)}.",
+    )
 
 
 @bot.callback_query_handler(func=lambda call: call.data.startswith("download_"))
-def handle_download(call):
+async def handle_download(call):
     """Handle download button clicks."""
     try:
-        _, user_id, _ = call.data.split("_")
-        user_id = int(user_id)
+        _, job_id, _ = call.data.split("_")
+        user_id = call.from_user.id
 
-        if str(user_id) not in review_results:
-            bot.answer_callback_query(
+        session = await load_session(job_id, user_id)
+        if session is None:
+            await bot.answer_callback_query(
                 call.id, "Сессия проверки закончена. Отправь архив снова."
             )
             return
 
         # Get ALL reviews and original filename
-        all_reviews = review_results[str(user_id)]["reviews"]
-        original_filename = review_results[str(user_id)].get("original_filename")
+        all_reviews = await asyncio.to_thread(session.records)
+        original_filename = session.file_name
 
-        # Generate report with all reviews
-        object_name = storage.generate_review_report(all_reviews, user_id, original_filename)
+        # The report is rendered and uploaded off the event loop
+        object_name = await asyncio.to_thread(
+            storage.generate_review_report, all_reviews, user_id, original_filename
+        )
 
         # Get download URL
-        download_url = storage.get_presigned_url("reports", object_name)
+        download_url = await asyncio.to_thread(
+            storage.get_presigned_url, "reports", object_name
+        )
 
-        bot.answer_callback_query(call.id)
-        bot.send_message(
+        await bot.answer_callback_query(call.id)
+        await bot.send_message(
             call.message.chat.id,
             f"📥 [Скачать полный отчет]({download_url})",
             parse_mode="Markdown",
@@ -243,184 +234,95 @@ def handle_download(call):
 
     except Exception as e:
         logger.error(f"Error generating review report: {e}", exc_info=True)
-        bot.answer_callback_query(
+        await bot.answer_callback_query(
             call.id, "❌ Не удалось сгенерировать отчет. Попробуйте снова."
         )
 
 
 @bot.message_handler(content_types=["document"])
-def handle_document(message):
-    """Handle incoming documents (both archives and individual files)."""
+async def handle_document(message):
+    """Store an incoming document and queue its review for the review workers."""
     try:
         file_name = message.document.file_name
         file_size = message.document.file_size
 
         # Check file size (Telegram's limit is 50MB)
         if file_size > 20 * 1024 * 1024 - 128:  # 20MB in bytes
-            bot.reply_to(message, "❌ Файл слишком большой. Максимальный размер 20MB.")
+            await bot.reply_to(message, "❌ Файл слишком большой. Максимальный размер 20MB.")
             return
 
         is_supported, file_type = is_supported_file(file_name)
 
         if not is_supported:
-            bot.reply_to(
+            await bot.reply_to(
                 message,
                 "❌ Неподдерживаемый тип файла. Отправь файл с кодом или архив (ZIP, RAR, 7z).",
             )
             return
 
         # Show progress for large files
-        status_message = bot.reply_to(message, "📥 Скачивание файла...")
+        status_message = await bot.reply_to(message, "📥 Скачивание файла...")
+        job_id = uuid.uuid4().hex
+        job = ReviewJob(
+            user_id=message.from_user.id,
+            chat_id=message.chat.id,
+            file_name=file_name,
+            # Queued uploads of the same file must not overwrite each other
+            upload_object=f"uploads/{message.from_user.id}/{job_id}/{file_name}",
+            file_type=file_type,
+            status_message_id=status_message.message_id,
+            id=job_id,
+        )
 
         try:
-            # Download file in chunks for large files
-            file_info = bot.get_file(message.document.file_id)
+            file_info = await bot.get_file(message.document.file_id)
+            file_stream = await bot.download_file(file_info.file_path)
 
             with tempfile.TemporaryDirectory() as tmpdir:
                 file_path = os.path.join(tmpdir, file_name)
-
-                # Download in chunks
                 with open(file_path, "wb") as f:
-                    file_stream = bot.download_file(file_info.file_path)
                     f.write(file_stream)
 
-                # Upload to MinIO
-                object_name = f"uploads/{message.from_user.id}/{file_name}"
-                storage.upload_file(
+                # Workers take the upload from MinIO
+                await asyncio.to_thread(
+                    storage.upload_file,
                     file_path,
                     "uploads",
-                    object_name,
-                    metadata={
-                        "user_id": str(message.from_user.id),
-                        "chat_id": str(message.chat.id),
+                    job.upload_object,
+                    {
+                        "user_id": str(job.user_id),
+                        "chat_id": str(job.chat_id),
                         "file_name": file_name,
                         "timestamp": datetime.now().isoformat(),
                     },
                 )
 
-                # Create review directories
-                review_dir = Path(tmpdir) / "review_output"
-                review_dir.mkdir(parents=True, exist_ok=True)
-
-                # Update status
-                bot.edit_message_text(
-                    "📦 Извлечение файлов..."
-                    if file_type == "archive"
-                    else "📄 Обработка файла...",
-                    chat_id=status_message.chat.id,
-                    message_id=status_message.message_id,
-                )
-
-                if file_type == "archive":
-                    extract_dir = os.path.join(tmpdir, "extracted")
-                    os.makedirs(extract_dir, exist_ok=True)
-
-                    logger.info(f"Attempting to extract {file_name} to {extract_dir}")
-                    if not extract_archive(file_path, extract_dir):
-                        bot.edit_message_text(
-                            "❌ Не удалось извлечь архив. Пожалуйста, убедитесь, что он не поврежден.",
-                            chat_id=status_message.chat.id,
-                            message_id=status_message.message_id,
-                        )
-                        return
-
-                    # Verify the extraction directory has content and find the root project directory
-                    extracted_items = list(Path(extract_dir).iterdir())
-                    if not extracted_items:
-                        bot.edit_message_text(
-                            "❌ Архив оказался пустым.",
-                            chat_id=status_message.chat.id,
-                            message_id=status_message.message_id,
-                        )
-                        return
-
-                    # If there's a single directory at the root, use that as project root
-                    project_root = (
-                        extracted_items[0]
-                        if len(extracted_items) == 1 and extracted_items[0].is_dir()
-                        else Path(extract_dir)
-                    )
-
-                    try:
-                        project_reviewer = ProjectReviewer(
-                            project_path=project_root, result_path=review_dir
-                        )
-                        project_reviewer.review()
-                    except Exception as e:
-                        logger.error(f"Project review failed: {str(e)}", exc_info=True)
-                        bot.edit_message_text(
-                            "❌ Не удалось обработать содержимое архива. Пожалуйста, убедитесь, что структура архива корректна.",
-                            chat_id=status_message.chat.id,
-                            message_id=status_message.message_id,
-                        )
-                        return
-                else:
-                    # Use FileReviewer for single files
-                    result_file = review_dir / file_name
-                    file_reviewer = FileReviewer(
-                        file_path=Path(file_path), result_path=result_file
-                    )
-                    file_reviewer.review()
-
-                # Parse review tags from the output
-                reviews = parse_review_tags(review_dir)
-
-                # Update status
-                bot.edit_message_text(
-                    "✅ Обработка завершена!",
-                    chat_id=status_message.chat.id,
-                    message_id=status_message.message_id,
-                )
-
-                if reviews:
-                    # Store results for pagination
-                    chat_id = str(message.chat.id)
-                    REVIEWS_PER_PAGE = 3
-                    total_pages = (
-                        len(reviews) + REVIEWS_PER_PAGE - 1
-                    ) // REVIEWS_PER_PAGE
-
-                    review_results[chat_id] = {
-                        "reviews": reviews,
-                        "total_pages": total_pages,
-                        "original_filename": file_name
-                    }
-
-                    # Send first page with download button
-                    message_text = create_review_message(reviews, 1, total_pages)
-                    keyboard = create_pagination_keyboard(
-                        1, total_pages, message.from_user.id
-                    )
-
-                    bot.send_message(
-                        message.chat.id,
-                        message_text,
-                        reply_markup=keyboard,
-                        parse_mode="Markdown",
-                    )
-                else:
-                    bot.send_message(message.chat.id, "✅ Ничего не найдено.")
-
-        except Exception as e:
-            logger.error(f"Error downloading/processing file: {e}", exc_info=True)
-            bot.edit_message_text(
-                "❌ Не удалось обработать файл. Попробуйте снова.",
-                chat_id=status_message.chat.id,
-                message_id=status_message.message_id,
+            position = await asyncio.to_thread(job_backend.put, job)
+        except QueueFullError:
+            await set_status(
+                job,
+                "❌ Слишком много файлов в очереди. Дождись окончания текущих проверок.",
             )
+            return
+        except Exception as e:
+            logger.error(f"Error downloading/queueing file: {e}", exc_info=True)
+            await set_status(job, "❌ Не удалось обработать файл. Попробуйте снова.")
+            return
+
+        await set_status(job, f"⏳ Файл поставлен в очередь, перед ним: {position}")
 
     except Exception as e:
         logger.error(f"Error processing file: {e}", exc_info=True)
-        bot.reply_to(
+        await bot.reply_to(
             message,
             "❌ Произшла ошибка при обработке файла. Попробуйте снова.",
         )
 
 
 @bot.message_handler(func=lambda message: True)
-def echo_all(message):
+async def echo_all(message):
     """Handle all other messages."""
-    bot.reply_to(
+    await bot.reply_to(
         message, "Отправь мне файл с кодом или архив (ZIP, RAR, 7z) для проверки."
     )
 
@@ -429,7 +331,7 @@ def run_bot():
     """Entry point for the bot"""
     try:
         logger.info("Starting bot...")
-        bot.infinity_polling()
+        asyncio.run(bot.infinity_polling())
     except Exception as e:
         logger.error(f"Error occurred: {e}", exc_info=True)
         raise
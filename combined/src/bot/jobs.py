@@ -0,0 +1,348 @@
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Optional
+
+
+JOB_BACKENDS = ["sqlite"]
+JOB_BACKEND = os.getenv("JOB_BACKEND", "sqlite")
+# Queue database of the sqlite backend, shared by the bot and the review workers
+JOB_QUEUE_PATH = os.getenv(
+    "JOB_QUEUE_PATH",
+    str(Path(tempfile.gettempdir()) / "telegram-review-bot" / "jobs.sqlite3"),
+)
+
+# Reviews running at the same time in one worker process
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))
+# Reviews of one user running at the same time, the rest wait in the queue
+USER_CONCURRENCY = int(os.getenv("USER_CONCURRENCY", 1))
+# Running and queued reviews of one user, new uploads are refused above it
+USER_MAX_JOBS = int(os.getenv("USER_MAX_JOBS", 3))
+# Seconds a job stays claimed without a heartbeat, then another worker retries it
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", 300))
+# Claims of a job before it is given up, a worker dying on it counts as a claim
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))
+# Finished jobs are kept for their status this long
+JOB_RETENTION_HOURS = float(os.getenv("JOB_RETENTION_HOURS", 24 * 7))
+
+# Review results of a job are stored as `result_object_name(job.id)` in this bucket
+RESULTS_BUCKET = "reports"
+
+
+def result_object_name(job_id: str) -> str:
+    return f"results/{job_id}.json"
+
+
+class QueueFullError(Exception):
+    pass
+
+
+@dataclass
+class ReviewJob:
+    """
+    Uploaded file waiting for its review
+    """
+
+    user_id: int
+    chat_id: int
+    file_name: str
+    # Object of the upload in the "uploads" bucket
+    upload_object: str
+    # "archive" or "code", see `is_supported_file`
+    file_type: str
+    # Message edited with the progress of the review
+    status_message_id: int
+    # Keyword arguments of the reviewer, e.g. {"use_cache": False}
+    options: dict = field(default_factory=dict)
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self), ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, payload: str) -> "ReviewJob":
+        return cls(**json.loads(payload))
+
+
+class JobBackend(ABC):
+    """
+    Durable queue of review jobs shared by the bot and the review workers
+
+    Jobs are queued, running or finished ("done" or "failed"). A worker
+    claims a job for `lease` seconds and extends the lease while it works,
+    jobs of workers that died are claimed again when the lease runs out.
+    Only the worker holding the claim can extend or finish a job, a worker
+    whose job was claimed again gets False and stops.
+    """
+
+    @abstractmethod
+    def put(self, job: ReviewJob, user_max_jobs: int = USER_MAX_JOBS) -> int:
+        """
+        Queue `job`, returns the number of jobs waiting before it
+
+        Raises `QueueFullError` when the user has `user_max_jobs` unfinished jobs.
+        """
+
+    @abstractmethod
+    def claim(
+        self,
+        worker: str,
+        user_concurrency: int = USER_CONCURRENCY,
+        lease: float = JOB_LEASE_SECONDS,
+    ) -> Optional[ReviewJob]:
+        """
+        Oldest queued job of a user with less than `user_concurrency`
+        running jobs, None when there is none
+        """
+
+    @abstractmethod
+    def sweep(self) -> list[ReviewJob]:
+        """
+        Fail the jobs of dead workers that ran out of attempts, returns them
+        so their users can be told
+        """
+
+    @abstractmethod
+    def heartbeat(
+        self, job_id: str, worker: str, lease: float = JOB_LEASE_SECONDS
+    ) -> bool:
+        """
+        Extend the lease of a running job to `lease` seconds from now,
+        False when `worker` no longer holds the job
+        """
+
+    @abstractmethod
+    def complete(
+        self, job_id: str, worker: str, result_object: Optional[str]
+    ) -> bool:
+        """
+        `result_object` -- object with the review results, None when nothing was found
+
+        False when `worker` no longer holds the job
+        """
+
+    @abstractmethod
+    def fail(self, job_id: str, worker: str, error: str) -> bool:
+        """
+        Finish a job without results, `error` is kept for its status
+
+        False when `worker` no longer holds the job
+        """
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[dict]:
+        """
+        Status, result object and error of a job
+        """
+
+    @abstractmethod
+    def counts(self) -> dict[str, int]:
+        """
+        Jobs by status
+        """
+
+
+class SQLiteJobBackend(JobBackend):
+    """
+    Queue in one SQLite database, for the bot and workers of one host
+    sharing a volume, and for tests
+
+    SQLite locking does not work over network file systems, so workers
+    scale out on one host only; more hosts need a networked `JobBackend`.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        max_attempts: int = JOB_MAX_ATTEMPTS,
+        retention_hours: float = JOB_RETENTION_HOURS,
+    ):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_attempts = max_attempts
+        self.retention = retention_hours * 3600
+        self._lock = threading.Lock()
+        # Transactions are explicit, writers of other processes wait for the lock
+        self._connection = sqlite3.connect(
+            str(path), timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                user_id INTEGER NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                worker TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                lease_until REAL,
+                result_object TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)"
+        )
+
+    def _transaction(self, fn):
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self._connection)
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+            return result
+
+    def put(self, job: ReviewJob, user_max_jobs: int = USER_MAX_JOBS) -> int:
+        def put(connection: sqlite3.Connection) -> int:
+            unfinished = connection.execute(
+                "SELECT COUNT(*) FROM jobs WHERE user_id = ? "
+                "AND status IN ('queued', 'running')",
+                (job.user_id,),
+            ).fetchone()[0]
+            if unfinished >= user_max_jobs:
+                raise QueueFullError(
+                    f"User {job.user_id} has {user_max_jobs} reviews queued"
+                )
+            position = connection.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued'"
+            ).fetchone()[0]
+            now = time.time()
+            connection.execute(
+                "INSERT INTO jobs (id, user_id, payload, status, created_at, updated_at) "
+                "VALUES (?, ?, ?, 'queued', ?, ?)",
+                (job.id, job.user_id, job.to_json(), now, now),
+            )
+            return position
+
+        return self._transaction(put)
+
+    def claim(
+        self,
+        worker: str,
+        user_concurrency: int = USER_CONCURRENCY,
+        lease: float = JOB_LEASE_SECONDS,
+    ) -> Optional[ReviewJob]:
+        def claim(connection: sqlite3.Connection) -> Optional[ReviewJob]:
+            now = time.time()
+            connection.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?",
+                (now - self.retention,),
+            )
+            # Jobs of dead workers, those out of attempts are left to `sweep`
+            connection.execute(
+                "UPDATE jobs SET status = 'queued', worker = NULL, updated_at = ? "
+                "WHERE status = 'running' AND lease_until < ? AND attempts < ?",
+                (now, now, self.max_attempts),
+            )
+
+            row = connection.execute(
+                """
+                SELECT id, payload FROM jobs
+                WHERE status = 'queued' AND user_id NOT IN (
+                    SELECT user_id FROM jobs WHERE status = 'running'
+                    GROUP BY user_id HAVING COUNT(*) >= ?
+                )
+                ORDER BY created_at, rowid
+                LIMIT 1
+                """,
+                (user_concurrency,),
+            ).fetchone()
+            if row is None:
+                return None
+            connection.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, "
+                "attempts = attempts + 1, lease_until = ?, updated_at = ? WHERE id = ?",
+                (worker, now + lease, now, row[0]),
+            )
+            return ReviewJob.from_json(row[1])
+
+        return self._transaction(claim)
+
+    def sweep(self) -> list[ReviewJob]:
+        def sweep(connection: sqlite3.Connection) -> list[ReviewJob]:
+            now = time.time()
+            rows = connection.execute(
+                "SELECT id, payload FROM jobs WHERE status = 'running' "
+                "AND lease_until < ? AND attempts >= ?",
+                (now, self.max_attempts),
+            ).fetchall()
+            connection.executemany(
+                "UPDATE jobs SET status = 'failed', error = 'Review was interrupted', "
+                "worker = NULL, lease_until = NULL, updated_at = ? WHERE id = ?",
+                [(now, row[0]) for row in rows],
+            )
+            return [ReviewJob.from_json(row[1]) for row in rows]
+
+        return self._transaction(sweep)
+
+    def heartbeat(
+        self, job_id: str, worker: str, lease: float = JOB_LEASE_SECONDS
+    ) -> bool:
+        now = time.time()
+        cursor = self._transaction(
+            lambda connection: connection.execute(
+                "UPDATE jobs SET lease_until = ?, updated_at = ? "
+                "WHERE id = ? AND worker = ? AND status = 'running'",
+                (now + lease, now, job_id, worker),
+            )
+        )
+        return cursor.rowcount > 0
+
+    def _finish(
+        self, job_id: str, worker: str, status: str, result_object, error
+    ) -> bool:
+        cursor = self._transaction(
+            lambda connection: connection.execute(
+                "UPDATE jobs SET status = ?, result_object = ?, error = ?, "
+                "lease_until = NULL, updated_at = ? "
+                "WHERE id = ? AND worker = ? AND status = 'running'",
+                (status, result_object, error, time.time(), job_id, worker),
+            )
+        )
+        return cursor.rowcount > 0
+
+    def complete(
+        self, job_id: str, worker: str, result_object: Optional[str]
+    ) -> bool:
+        return self._finish(job_id, worker, "done", result_object, None)
+
+    def fail(self, job_id: str, worker: str, error: str) -> bool:
+        return self._finish(job_id, worker, "failed", None, error)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT status, result_object, error FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        return {"status": row[0], "result_object": row[1], "error": row[2]}
+
+    def counts(self) -> dict[str, int]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT status, COUNT(*) FROM jobs GROUP BY status"
+            ).fetchall()
+        return dict(rows)
+
+
+def make_job_backend(
+    name: str = JOB_BACKEND, path: str = JOB_QUEUE_PATH
+) -> JobBackend:
+    if name == "sqlite":
+        return SQLiteJobBackend(Path(path))
+    raise ValueError(f"Unknown job backend {name}, expected one of {JOB_BACKENDS}")
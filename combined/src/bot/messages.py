@@ -0,0 +1,116 @@
+from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+from src.review.records import STRUCTURE_FILE
+
+
+REVIEWS_PER_PAGE = 3
+
+# Telegram limits how often a message can be edited
+PROGRESS_UPDATE_SECONDS = 3
+
+
+def page_range(page: int) -> tuple[int, int]:
+    """First and past-the-end index of the reviews on a page."""
+    start_idx = (page - 1) * REVIEWS_PER_PAGE
+    return start_idx, start_idx + REVIEWS_PER_PAGE
+
+
+def count_pages(total: int) -> int:
+    return (total + REVIEWS_PER_PAGE - 1) // REVIEWS_PER_PAGE
+
+
+def escape_markdown(text: str) -> str:
+    """Escape the characters Telegram Markdown treats as formatting."""
+    return str(text).replace('_', '\\_').replace('*', '\\*').replace('`', '\\`').replace('[', '\\[')
+
+
+def describe_file(file: str) -> str:
+    """Name of the reviewed file shown to the user."""
+    return "Структура проекта" if file == STRUCTURE_FILE else file
+
+
+def create_review_message(current_reviews: list, page: int, total_pages: int) -> str:
+    """Create a formatted review message from the reviews of the current page."""
+    message_parts = [f"📝 Обзоры кода (Страница {page}/{total_pages})\n"]
+
+    for review in current_reviews:
+        # Escape special characters in the review text and the file name
+        review_text = escape_markdown(review.comment)
+
+        message_parts.extend([
+            f"\n📄 {escape_markdown(describe_file(review.file))} (line {review.line})",
+            f"💡 Ревью: {review_text}",
+            f"\nТекущий код:",
+            f"```\n{review.snippet.strip()}\n```",
+        ])
+
+        if review.suggested_code:
+            message_parts.append(f"Предлагаемый код:")
+            message_parts.append(f"```\n{review.suggested_code.strip()}\n```")
+
+        message_parts.append("─" * 40)
+
+    message_parts.append(
+        "\nИспользуй кнопки ниже для навигации по страницам или скачай полный отчет."
+    )
+
+    # Join all parts and ensure proper escaping
+    return "\n".join(message_parts)
+
+
+def create_preview_message(reviews: list) -> str:
+    """Create a short message with the first findings of a running review."""
+    message_parts = ["🔎 Первые замечания (проверка продолжается):"]
+    for review in reviews[:3]:
+        message_parts.extend([
+            f"\n📄 {describe_file(review.file)} (line {review.line})",
+            f"💡 {review.comment}",
+        ])
+    return "\n".join(message_parts)
+
+
+def create_pagination_keyboard(
+    current_page: int, total_pages: int, job_id: str
+) -> InlineKeyboardMarkup:
+    """Create pagination keyboard with download button for the results of a job."""
+    keyboard = InlineKeyboardMarkup(row_width=5)
+    buttons = []
+
+    # First page
+    if current_page > 1:
+        buttons.append(InlineKeyboardButton("⏮️", callback_data=f"page_{job_id}_1"))
+
+    # Previous page
+    if current_page > 1:
+        buttons.append(
+            InlineKeyboardButton("◀️", callback_data=f"page_{job_id}_{current_page-1}")
+        )
+
+    # Current page indicator
+    buttons.append(
+        InlineKeyboardButton(f"{current_page}/{total_pages}", callback_data="noop")
+    )
+
+    # Next page
+    if current_page < total_pages:
+        buttons.append(
+            InlineKeyboardButton("▶️", callback_data=f"page_{job_id}_{current_page+1}")
+        )
+
+    # Last page
+    if current_page < total_pages:
+        buttons.append(
+            InlineKeyboardButton("⏭️", callback_data=f"page_{job_id}_{total_pages}")
+        )
+
+    # Add navigation buttons row
+    keyboard.add(*buttons)
+
+    # Add download button in new row
+    keyboard.add(
+        InlineKeyboardButton(
+            "📥 Скачать полный отчет", callback_data=f"download_{job_id}_all"
+        )
+    )
+
+    return keyboard
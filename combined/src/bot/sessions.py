@@ -0,0 +1,221 @@
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Optional
+
+from src.review.cache import DiskCache
+from src.review.records import ReviewRecord
+
+
+# Results stop being paged this long after the review finished
+SESSION_TTL_HOURS = float(os.getenv("SESSION_TTL_HOURS", 24))
+# Compressed sessions kept in memory, least recently used ones are dropped above it
+SESSION_CACHE_MB = int(os.getenv("SESSION_CACHE_MB", 64))
+# SQLite file keeping the sessions across restarts, empty keeps them in memory only
+SESSION_STORE_PATH = os.getenv("SESSION_STORE_PATH", "")
+SESSION_STORE_MB = int(os.getenv("SESSION_STORE_MB", 512))
+# Records compressed together, a page of results decompresses one or two blocks
+SESSION_BLOCK_RECORDS = 16
+
+
+class ReviewSession:
+    """
+    Review records of one finished job, compressed in blocks
+    of `SESSION_BLOCK_RECORDS` so a page is read without the rest
+    """
+
+    __slots__ = ("user_id", "file_name", "created_at", "total", "_blocks")
+
+    def __init__(
+        self,
+        user_id: int,
+        file_name: str,
+        created_at: float,
+        total: int,
+        blocks: list[bytes],
+    ):
+        self.user_id = user_id
+        self.file_name = file_name
+        # Unix time the review finished
+        self.created_at = created_at
+        self.total = total
+        self._blocks = blocks
+
+    @classmethod
+    def from_records(
+        cls,
+        user_id: int,
+        file_name: str,
+        created_at: float,
+        records: list[ReviewRecord],
+    ) -> "ReviewSession":
+        blocks = [
+            zlib.compress(
+                json.dumps(
+                    [
+                        record.to_dict()
+                        for record in records[start : start + SESSION_BLOCK_RECORDS]
+                    ],
+                    ensure_ascii=False,
+                ).encode("utf-8")
+            )
+            for start in range(0, len(records), SESSION_BLOCK_RECORDS)
+        ]
+        return cls(user_id, file_name, created_at, len(records), blocks)
+
+    @property
+    def size(self) -> int:
+        return sum(len(block) for block in self._blocks)
+
+    def records(self, start: int = 0, end: Optional[int] = None) -> list[ReviewRecord]:
+        """
+        Records `start` to `end`, only the blocks holding them are decompressed
+        """
+        end = self.total if end is None else min(end, self.total)
+        records = []
+        for i in range(start // SESSION_BLOCK_RECORDS, -(-end // SESSION_BLOCK_RECORDS)):
+            block = json.loads(zlib.decompress(self._blocks[i]))
+            offset = i * SESSION_BLOCK_RECORDS
+            records.extend(
+                ReviewRecord.from_dict(record)
+                for record in block[max(0, start - offset) : end - offset]
+            )
+        return records
+
+    def to_bytes(self) -> bytes:
+        header = json.dumps(
+            {
+                "user_id": self.user_id,
+                "file_name": self.file_name,
+                "created_at": self.created_at,
+                "total": self.total,
+                "blocks": [len(block) for block in self._blocks],
+            },
+            ensure_ascii=False,
+        ).encode("utf-8")
+        return struct.pack("<I", len(header)) + header + b"".join(self._blocks)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "ReviewSession":
+        (header_size,) = struct.unpack_from("<I", data)
+        header = json.loads(data[4 : 4 + header_size])
+        blocks = []
+        offset = 4 + header_size
+        for size in header["blocks"]:
+            blocks.append(data[offset : offset + size])
+            offset += size
+        return cls(
+            header["user_id"],
+            header["file_name"],
+            header["created_at"],
+            header["total"],
+            blocks,
+        )
+
+
+class SessionStore:
+    """
+    Review sessions by job id: compressed in memory up to `max_bytes`,
+    in an optional SQLite store, and loaded from the stored job results
+    by `loader` when both miss. Sessions older than `ttl_hours` are gone.
+    """
+
+    def __init__(
+        self,
+        loader: Optional[Callable[[str], Optional[dict]]] = None,
+        ttl_hours: float = SESSION_TTL_HOURS,
+        max_bytes: int = SESSION_CACHE_MB * 1024 * 1024,
+        path: Optional[Path] = Path(SESSION_STORE_PATH) if SESSION_STORE_PATH else None,
+        store_bytes: int = SESSION_STORE_MB * 1024 * 1024,
+    ):
+        """
+        `loader` -- results of a job as saved by the review worker, None if there are none
+        """
+        self.loader = loader
+        self.ttl = ttl_hours * 3600
+        self.max_bytes = max_bytes
+        self.disk = DiskCache(path, store_bytes, ttl=self.ttl) if path else None
+
+        self._sessions: OrderedDict[str, ReviewSession] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def _expired(self, created_at: float) -> bool:
+        return time.time() - created_at > self.ttl
+
+    def _remember(self, job_id: str, session: ReviewSession) -> None:
+        with self._lock:
+            previous = self._sessions.pop(job_id, None)
+            if previous is not None:
+                self._size -= previous.size
+            self._sessions[job_id] = session
+            self._size += session.size
+            for expired in [
+                key
+                for key, value in self._sessions.items()
+                if self._expired(value.created_at)
+            ]:
+                self._size -= self._sessions.pop(expired).size
+            while self._size > self.max_bytes and len(self._sessions) > 1:
+                _, dropped = self._sessions.popitem(last=False)
+                self._size -= dropped.size
+
+    def _forget(self, job_id: str) -> None:
+        with self._lock:
+            session = self._sessions.pop(job_id, None)
+            if session is not None:
+                self._size -= session.size
+
+    def put(self, job_id: str, session: ReviewSession) -> None:
+        self._remember(job_id, session)
+        if self.disk is not None:
+            self.disk.put(job_id, session.to_bytes())
+
+    def get(self, job_id: str) -> Optional[ReviewSession]:
+        with self._lock:
+            session = self._sessions.get(job_id)
+            if session is not None:
+                self._sessions.move_to_end(job_id)
+
+        if session is not None:
+            if self._expired(session.created_at):
+                self._forget(job_id)
+                return None
+            return session
+
+        if self.disk is not None:
+            data = self.disk.get(job_id)
+            if data is not None:
+                session = ReviewSession.from_bytes(data)
+                if self._expired(session.created_at):
+                    return None
+                self._remember(job_id, session)
+                return session
+
+        if self.loader is None:
+            return None
+        results = self.loader(job_id)
+        if results is None:
+            return None
+        created_at = datetime.fromisoformat(results["created_at"]).timestamp()
+        # Expired results are not decoded nor stored again
+        if self._expired(created_at):
+            return None
+        session = ReviewSession.from_records(
+            results["user_id"],
+            results["file_name"],
+            created_at,
+            [ReviewRecord.from_dict(review) for review in results["reviews"]],
+        )
+        self.put(job_id, session)
+        return session
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"sessions": len(self._sessions), "bytes": self._size}
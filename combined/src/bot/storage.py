@@ -19,7 +19,11 @@ from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.lib.fonts import addMapping
 import requests
 import tempfile
+import io
 from pathlib import Path
+from typing import Optional
+
+from src.bot.messages import describe_file
 
 load_dotenv()
 
@@ -107,6 +111,42 @@ class MinioStorage:
         except S3Error as e:
             raise Exception(f"Error uploading to MinIO: {e}")
 
+    def download_file(self, bucket: str, object_name: str, file_path: str) -> None:
+        """Download a MinIO object to a local file"""
+        try:
+            self.client.fget_object(bucket, object_name, file_path)
+        except S3Error as e:
+            raise Exception(f"Error downloading from MinIO: {e}")
+
+    def save_json(self, bucket: str, object_name: str, data: dict) -> None:
+        """Store a JSON document in MinIO"""
+        payload = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        try:
+            self.client.put_object(
+                bucket,
+                object_name,
+                io.BytesIO(payload),
+                length=len(payload),
+                content_type="application/json",
+            )
+        except S3Error as e:
+            raise Exception(f"Error uploading to MinIO: {e}")
+
+    def load_json(self, bucket: str, object_name: str) -> Optional[dict]:
+        """Load a JSON document from MinIO, None if it doesn't exist"""
+        try:
+            response = self.client.get_object(bucket, object_name)
+        except S3Error as e:
+            if e.code == "NoSuchKey":
+                return None
+            raise Exception(f"Error downloading from MinIO: {e}")
+
+        try:
+            return json.loads(response.read())
+        finally:
+            response.close()
+            response.release_conn()
+
     def get_presigned_url(
         self, bucket: str, object_name: str, expires: int = 3600
     ) -> str:
@@ -229,7 +269,7 @@ class MinioStorage:
         # Group reviews by file for better organization
         reviews_by_file = {}
         for review in reviews:
-            file_path = review["file"]
+            file_path = review.file
             if file_path not in reviews_by_file:
                 reviews_by_file[file_path] = []
             reviews_by_file[file_path].append(review)
@@ -237,26 +277,26 @@ class MinioStorage:
         # Process reviews grouped by file
         for file_path, file_reviews in reviews_by_file.items():
             # Add file header
-            elements.append(Paragraph(f"Файл: {file_path}", heading_style))
+            elements.append(Paragraph(f"Файл: {describe_file(file_path)}", heading_style))
             elements.append(Spacer(1, 0.1 * inch))
 
             # Sort reviews by line number
-            file_reviews.sort(key=lambda x: x["line_number"])
+            file_reviews.sort(key=lambda x: x.line)
 
             for review in file_reviews:
                 elements.append(
-                    Paragraph(f"Строка {review['line_number']}", normal_style)
+                    Paragraph(f"Строка {review.line}", normal_style)
                 )
 
                 # Review comment
                 elements.append(Paragraph("• Комментарий:", heading_style))
-                escaped_review = html.escape(review["review"])  # Escape HTML tags
+                escaped_review = html.escape(review.comment)  # Escape HTML tags
                 elements.append(Paragraph(escaped_review, normal_style))
 
                 # Current code section
                 elements.append(Paragraph("• Текущий код:", heading_style))
                 try:
-                    current_code = review["code"].strip()
+                    current_code = review.snippet.strip()
                     current_code = html.unescape(current_code)
                     current_code = current_code.replace("\t", "    ")
                     # Remove line numbers and the separator character
@@ -289,20 +329,20 @@ class MinioStorage:
                     elements.append(Preformatted(current_code, code_style))
                 except Exception as e:
                     logger.error(f"Error processing code block: {e}")
-                    elements.append(Preformatted(review["code"], code_style))
+                    elements.append(Preformatted(review.snippet, code_style))
 
                 # Suggested code section (if present)
-                if review.get("suggested_code"):
+                if review.suggested_code:
                     elements.append(Paragraph("• Предлагаемый код:", heading_style))
                     try:
-                        suggested_code = review["suggested_code"].strip()
+                        suggested_code = review.suggested_code.strip()
                         suggested_code = html.unescape(suggested_code)
                         suggested_code = suggested_code.replace("\t", "    ")
                         elements.append(Preformatted(suggested_code, code_style))
                     except Exception as e:
                         logger.error(f"Error processing suggested code block: {e}")
                         elements.append(
-                            Preformatted(review["suggested_code"], code_style)
+                            Preformatted(review.suggested_code, code_style)
                         )
 
                 # Add separator between reviews
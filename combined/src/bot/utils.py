@@ -1,288 +1,203 @@
-from asyncio.log import logger
-import os
-import re
-import patoolib
 import logging
+import os
 import py7zr
 import shutil
-import tempfile
-from src.review.review import FileReviewer
-from pathlib import Path
+import zipfile
+from pathlib import Path, PurePosixPath
+from typing import Iterator
 
+from src.review.parsers.project_parser import is_skipped_directory
+from src.review.review import FILE_EXTENSIONS
 
-def extract_archive(file_path: str, extract_dir: str) -> bool:
-    """Extract archive files to the specified directory."""
-    try:
-        # Create extraction directory if it doesn't exist
-        os.makedirs(extract_dir, exist_ok=True)
-        logger.info(f"Extracting {file_path} to {extract_dir}")
+logger = logging.getLogger(__name__)
 
-        file_path_lower = file_path.lower()
+# Files extracted from an archive at most, files that are not reviewed do not count
+ARCHIVE_MAX_FILES = int(os.getenv("ARCHIVE_MAX_FILES", 5000))
+# Uncompressed size of the extracted files at most
+ARCHIVE_MAX_MB = int(os.getenv("ARCHIVE_MAX_MB", 100))
+# Uncompressed size of the decompressed files to the size of the archive at most
+ARCHIVE_MAX_RATIO = int(os.getenv("ARCHIVE_MAX_RATIO", 100))
+COPY_BLOCK_BYTES = 1024 * 1024
 
-        if file_path_lower.endswith(".7z"):
-            # Use py7zr for .7z files
-            with py7zr.SevenZipFile(file_path, mode="r") as z:
-                z.extractall(path=extract_dir)
-        elif file_path_lower.endswith(".zip"):
-            import zipfile
 
-            with zipfile.ZipFile(file_path, "r") as z:
-                z.extractall(extract_dir)
-        elif file_path_lower.endswith(".rar"):
-            import rarfile
+class ArchiveError(Exception):
+    """Archive can't be read."""
 
-            try:
-                rarfile.UNRAR_TOOL = "unrar"  # Specify the unrar tool path
-                with rarfile.RarFile(file_path, "r") as z:
-                    z.extractall(extract_dir)
-            except rarfile.BadRarFile as e:
-                logger.error(f"RAR extraction failed. Please ensure 'unrar' is installed: {str(e)}")
-                return False
-            except Exception as e:
-                logger.error(f"RAR extraction failed: {str(e)}")
-                return False
-
-        # Verify extraction was successful
-        extracted_contents = list(Path(extract_dir).rglob("*"))
-        if not extracted_contents:
-            logger.error(f"No files were extracted to {extract_dir}")
-            return False
 
-        logger.info(
-            f"Successfully extracted {len(extracted_contents)} items to {extract_dir}"
-        )
-        return True
+class ArchiveLimitError(ArchiveError):
+    """Archive exceeds `ARCHIVE_MAX_FILES`, `ARCHIVE_MAX_MB` or `ARCHIVE_MAX_RATIO`."""
 
-    except Exception as e:
-        logger.error(f"Failed to extract archive: {str(e)}", exc_info=True)
-        return False
 
-
-def get_project_structure(directory: str) -> str:
+def _member_path(name: str):
     """
-    Generates a tree-like structure of the project directory.
+    Path of a member inside the archive, None for paths escaping the extraction directory
     """
-    structure = []
-    for root, dirs, files in os.walk(directory):
-        level = root.replace(directory, "").count(os.sep)
-        indent = "│   " * level + "├── " if level > 0 else ""
-        structure.append(f"{indent}{os.path.basename(root)}/")
-        sub_indent = "│   " * (level + 1) + "├── "
-        for file in files:
-            structure.append(f"{sub_indent}{file}")
-    return "\n".join(structure)
+    path = PurePosixPath(name.replace("\\", "/"))
+    if path.is_absolute() or ".." in path.parts or not path.parts:
+        return None
+    return path
 
 
-def find_block_end(lines: list[str], start_idx: int) -> int:
-    """
-    Find the end of a code block starting from a given line.
-    Returns the index of the last line in the block.
+class ProjectArchive:
     """
-    # Stack to keep track of opening and closing brackets
-    stack = []
-    # Opening and closing bracket pairs
-    brackets = {
-        "{": "}",
-        "(": ")",
-        "[": "]",
-        "function": "}",  # For JavaScript/TypeScript functions
-        "class": "}",  # For class definitions
-        "if": "}",  # For if statements
-        "for": "}",  # For loops
-        "while": "}",  # For while loops
-    }
-
-    # Check if the line contains any opening brackets or keywords
-    first_line = lines[start_idx].strip()
-
-    # Add initial brackets/keywords to stack
-    for bracket in brackets:
-        if bracket in first_line:
-            stack.append(brackets[bracket])
-
-    # If no brackets found, return just this line
-    if not stack:
-        return start_idx
-
-    # Process subsequent lines
-    current_idx = start_idx
-    while current_idx < len(lines) - 1 and stack:
-        current_idx += 1
-        line = lines[current_idx].strip()
+    Uploaded zip, 7z or rar archive of a project
 
-        # Add new opening brackets to stack
-        for bracket in brackets:
-            if bracket in line:
-                stack.append(brackets[bracket])
-
-        # Remove closing brackets from stack
-        for closing in brackets.values():
-            if closing in line:
-                if stack and stack[-1] == closing:
-                    stack.pop()
-
-        # Break if we've found all closing brackets
-        if not stack:
-            break
-
-    return current_idx
-
-
-def find_code_block(lines: list[str], start_idx: int) -> tuple[int, str]:
-    """
-    Find a complete code block starting from a given line.
-    Returns tuple of (end_line_index, block_content).
+    The member list is read when the archive is opened and the limits are
+    checked against the sizes it declares before anything is extracted.
+    `extract` writes only the files with `FILE_EXTENSIONS` outside of vendored
+    and hidden directories, the rest of the members only show up in `files`.
     """
-    block_lines = []
-    current_idx = start_idx
-
-    # Skip empty lines at the start
-    while current_idx < len(lines) and not lines[current_idx].strip():
-        current_idx += 1
-
-    if current_idx >= len(lines):
-        return start_idx, ""
-
-    # Get initial line and its indentation
-    first_line = lines[current_idx]
-    base_indent = len(first_line) - len(first_line.lstrip())
-
-    # Check for special cases in the first line
-    first_line_stripped = first_line.strip()
-    is_type_def = first_line_stripped.startswith(
-        "type "
-    ) or first_line_stripped.startswith("interface ")
-    is_export = first_line_stripped.startswith("export ")
-
-    while current_idx < len(lines):
-        current_line = lines[current_idx]
-        current_stripped = current_line.strip()
-
-        # Skip empty lines at the start
-        if not block_lines and not current_stripped:
-            current_idx += 1
-            continue
-
-        # Add line to block
-        if current_stripped:
-            current_indent = len(current_line) - len(current_line.lstrip())
 
-            # Stop conditions:
-            # 1. Found another review tag
-            if "<REVIEW>" in current_line:
-                break
-
-            # 2. Found end of type definition
-            if is_type_def and current_stripped.endswith(";"):
-                block_lines.append(current_line)
-                break
-
-            # 3. Found end of export statement
-            if is_export and current_stripped.endswith(";"):
-                block_lines.append(current_line)
-                break
-
-            # 4. Found closing brace at base indentation
-            if current_stripped == "}" and current_indent <= base_indent:
-                block_lines.append(current_line)
-                break
-
-            # 5. Next line has same or less indentation and current block is complete
-            if block_lines and current_indent <= base_indent:
-                # Check if current line starts a new block/statement
-                if any(
-                    current_stripped.startswith(keyword)
-                    for keyword in [
-                        "type",
-                        "interface",
-                        "export",
-                        "function",
-                        "class",
-                        "const",
-                        "let",
-                        "var",
-                    ]
-                ):
-                    break
-
-        block_lines.append(current_line)
-        current_idx += 1
-
-    # Handle case where we reached end of file
-    if current_idx == len(lines) and block_lines:
-        current_idx -= 1
-
-    return current_idx, "".join(block_lines)
-
-
-def parse_review_tags(directory: str) -> list:
-    """
-    Parses files for <REVIEW>content</REVIEW> tags and returns the reviews with code context.
-    """
-    reviews = []
-    review_pattern = re.compile(
-        r"(?:\/\/|\/\*|\#|\{\/\*|\{\#)?\s*<REVIEW>(.*?)<\/REVIEW>"
-    )
-
-    def process_file(file_path: Path, base_dir: Path) -> None:
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self.kind = Path(file_path).suffix.lower()
         try:
-            rel_path = file_path.relative_to(base_dir)
-            with open(file_path, "r", encoding="utf-8") as f:
-                lines = f.readlines()
-
-            i = 0
-            while i < len(lines):
-                line = lines[i]
-                match = review_pattern.search(line)
-                if match:
-                    review_content = match.group(1).strip()
-
-                    # Get preceding 3 lines, excluding REVIEW comments
-                    code_lines = []
-                    start_idx = max(0, i - 3)
-                    for idx in range(start_idx, i):
-                        if "<REVIEW>" not in lines[idx]:
-                            code_lines.append(lines[idx])
-
-                    # Add following 2 lines, excluding REVIEW comments
-                    end_idx = min(i + 3, len(lines))
-                    for idx in range(i + 1, end_idx):
-                        if "<REVIEW>" not in lines[idx]:
-                            code_lines.append(lines[idx])
-
-                    code_block = "".join(code_lines)
+            self._archive, members = self._open()
+        except Exception as e:
+            raise ArchiveError(f"Can't read {file_path}: {e}") from e
 
-                    # Extract suggested code if present
-                    suggested_code = None
-                    if "`" in review_content:
-                        code_match = re.search(r"`(.*?)`", review_content)
-                        if code_match:
-                            suggested_code = code_match.group(1)
+        try:
+            self._select(members)
+            self._check_limits(members)
+        except BaseException:
+            self.close()
+            raise
+
+    def _select(self, members: list[tuple[str, int]]) -> None:
+        # member name -> declared uncompressed size
+        self.selected: dict[str, int] = {}
+        paths = []
+        for name, size in members:
+            path = _member_path(name)
+            if path is None:
+                logger.warning(f"Skipping {name} of {self.file_path}: unsafe path")
+                continue
+            paths.append(path)
+            if any(is_skipped_directory(part) for part in path.parts[:-1]):
+                continue
+            if path.suffix[1:].lower() in FILE_EXTENSIONS:
+                self.selected[name] = size
+
+        # Directory holding every member, stripped from the project paths
+        tops = {path.parts[0] for path in paths}
+        self.root = (
+            tops.pop()
+            if len(tops) == 1 and all(len(path.parts) > 1 for path in paths)
+            else ""
+        )
+        # Paths of all files relative to the project root, for the structure review
+        self.files = [
+            (path.relative_to(self.root) if self.root else path).as_posix()
+            for path in paths
+        ]
+
+    def _open(self):
+        """
+        Open the archive, returns it with the names and sizes of its files
+        """
+        if self.kind == ".zip":
+            archive = zipfile.ZipFile(self.file_path, "r")
+            return archive, [
+                (info.filename, info.file_size)
+                for info in archive.infolist()
+                if not info.is_dir()
+            ]
+        if self.kind == ".7z":
+            archive = py7zr.SevenZipFile(self.file_path, mode="r")
+            return archive, [
+                (info.filename, info.uncompressed)
+                for info in archive.list()
+                if not info.is_directory
+            ]
+        if self.kind == ".rar":
+            import rarfile
 
-                    reviews.append({
-                        "file": str(rel_path),
-                        "line_number": i + 2,  # +2 because we want to show the actual code line number
-                        "review": review_content,
-                        "code": code_block,
-                        "suggested_code": suggested_code
-                    })
-                i += 1
+            rarfile.UNRAR_TOOL = "unrar"  # Specify the unrar tool path
+            archive = rarfile.RarFile(self.file_path, "r")
+            return archive, [
+                (info.filename, info.file_size)
+                for info in archive.infolist()
+                if not info.is_dir()
+            ]
+        raise ValueError(f"Unsupported archive type {self.kind}")
+
+    def _check_limits(self, members: list[tuple[str, int]]) -> None:
+        if len(self.selected) > ARCHIVE_MAX_FILES:
+            raise ArchiveLimitError(
+                f"{len(self.selected)} files to review, at most {ARCHIVE_MAX_FILES}"
+            )
+        size = sum(self.selected.values())
+        if size > ARCHIVE_MAX_MB * 1024 * 1024:
+            raise ArchiveLimitError(
+                f"{size // (1024 * 1024)} MB to extract, at most {ARCHIVE_MAX_MB} MB"
+            )
+        # Solid 7z blocks are decompressed whole, skipped files included
+        if self.kind == ".7z":
+            size = sum(member_size for _, member_size in members)
+        ratio = size / max(1, os.path.getsize(self.file_path))
+        if ratio > ARCHIVE_MAX_RATIO:
+            raise ArchiveLimitError(
+                f"Compression ratio {ratio:.0f}, at most {ARCHIVE_MAX_RATIO}"
+            )
+
+    def project_path(self, extract_dir: Path) -> Path:
+        """Root of the project once extracted to `extract_dir`."""
+        return extract_dir / self.root if self.root else extract_dir
+
+    def extract(self, extract_dir: Path) -> Iterator[Path]:
+        """
+        Extract the selected files, yielding each one as soon as it is written
+
+        A member that fails to extract or is larger than declared is skipped.
+        7z files are yielded after the whole archive is decompressed, a 7z
+        member larger than declared stops the extraction with `ArchiveLimitError`.
+        """
+        if self.kind == ".7z":
+            try:
+                # py7zr stops every member at the size declared in the headers
+                self._archive.extract(path=extract_dir, targets=list(self.selected))
+            except Exception as e:
+                logger.error(f"Failed to extract {self.file_path}: {e}", exc_info=True)
+                return
+            targets = []
+            for name, size in self.selected.items():
+                target = extract_dir / _member_path(name)
+                if not target.is_file():
+                    continue
+                # Checked again so the limits do not depend on the py7zr version
+                if target.stat().st_size > size:
+                    shutil.rmtree(extract_dir, ignore_errors=True)
+                    raise ArchiveLimitError(f"{name} is larger than declared")
+                targets.append(target)
+            yield from targets
+            return
+
+        for name, size in self.selected.items():
+            target = extract_dir / _member_path(name)
+            try:
+                target.parent.mkdir(parents=True, exist_ok=True)
+                with self._archive.open(name) as source, open(target, "wb") as f:
+                    # One byte past the declared size tells a forged header
+                    remaining = size + 1
+                    while remaining > 0:
+                        block = source.read(min(COPY_BLOCK_BYTES, remaining))
+                        if not block:
+                            break
+                        f.write(block)
+                        remaining -= len(block)
+                if remaining == 0:
+                    raise ArchiveError("larger than declared")
+            except Exception as e:
+                logger.warning(f"Skipping {name} of {self.file_path}: {e}")
+                target.unlink(missing_ok=True)
+                continue
+            yield target
 
-        except Exception as e:
-            logger.warning(f"Could not process file {file_path}: {e}")
+    def close(self) -> None:
+        self._archive.close()
 
-    # Process directory or single file
-    directory_path = Path(directory)
-    if directory_path.is_file():
-        process_file(directory_path, directory_path.parent)
-    else:
-        for file_path in directory_path.rglob("*"):
-            if file_path.is_file():
-                try:
-                    content = file_path.read_text(encoding="utf-8")
-                    if "<REVIEW>" in content:
-                        process_file(file_path, directory_path)
-                except Exception as e:
-                    logger.warning(f"Could not read file {file_path}: {e}")
+    def __enter__(self) -> "ProjectArchive":
+        return self
 
-    return reviews
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,362 @@
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import telebot
+from dotenv import load_dotenv
+
+from src.bot.jobs import (
+    JOB_LEASE_SECONDS,
+    JOB_WORKERS,
+    RESULTS_BUCKET,
+    JobBackend,
+    ReviewJob,
+    make_job_backend,
+    result_object_name,
+)
+from src.bot.messages import (
+    PROGRESS_UPDATE_SECONDS,
+    count_pages,
+    create_pagination_keyboard,
+    create_preview_message,
+    create_review_message,
+    page_range,
+)
+from src.bot.storage import MinioStorage
+from src.bot.utils import (
+    ARCHIVE_MAX_FILES,
+    ARCHIVE_MAX_MB,
+    ArchiveError,
+    ArchiveLimitError,
+    ProjectArchive,
+)
+from src.review.records import ReviewRecord
+from src.review.review import DATA, FileReviewer, ProjectReviewer
+
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+BOT_TOKEN = os.getenv("BOT_TOKEN")
+
+# Seconds between polls of an empty queue
+WORKER_POLL_SECONDS = float(os.getenv("WORKER_POLL_SECONDS", 2))
+
+
+class ReviewFailed(Exception):
+    """Review ended early, the message is shown to the user."""
+
+
+class JobLost(Exception):
+    """The lease of the job ran out and another worker claimed it."""
+
+
+class ReviewWorker:
+    """
+    Claims review jobs from the queue and runs them
+
+    The upload comes from and the results go to the storage, the user is
+    answered through the Telegram API, so workers keep no state and any
+    number of them can run side by side.
+    """
+
+    def __init__(
+        self, name: str, backend: JobBackend, storage: MinioStorage, bot: telebot.TeleBot
+    ):
+        self.name = name
+        self.backend = backend
+        self.storage = storage
+        self.bot = bot
+        # Set when another worker takes over the running job
+        self.lost = threading.Event()
+
+    def set_status(self, job: ReviewJob, text: str) -> None:
+        """Show the state of a job in its status message."""
+        try:
+            self.bot.edit_message_text(
+                text, chat_id=job.chat_id, message_id=job.status_message_id
+            )
+        except Exception as e:
+            logger.warning(f"Could not update status of job {job.id}: {e}")
+
+    def send_message(self, job: ReviewJob, text: str, **kwargs) -> None:
+        """Send a message to the chat of a job, a failed send does not fail the job."""
+        try:
+            self.bot.send_message(job.chat_id, text, **kwargs)
+            return
+        except Exception as e:
+            if kwargs.pop("parse_mode", None) is None:
+                logger.warning(f"Could not send a message of job {job.id}: {e}")
+                return
+            # Telegram refuses Markdown it can't parse, e.g. in a code snippet
+            logger.warning(f"Sending a message of job {job.id} as plain text: {e}")
+        try:
+            self.bot.send_message(job.chat_id, text, **kwargs)
+        except Exception as e:
+            logger.warning(f"Could not send a message of job {job.id}: {e}")
+
+    def _fail(self, job: ReviewJob, text: str, error: str) -> None:
+        """Fail a job and show `text` in its status message, unless another worker took it."""
+        if self.backend.fail(job.id, self.name, error):
+            self.set_status(job, text)
+        else:
+            logger.warning(f"Job {job.id} was claimed by another worker")
+
+    def run(self, stop: threading.Event) -> None:
+        while not stop.is_set():
+            try:
+                # Jobs of dead workers that will not be retried any more
+                for interrupted in self.backend.sweep():
+                    logger.warning(f"Job {interrupted.id} ran out of attempts")
+                    self.set_status(
+                        interrupted, "❌ Проверка прервалась. Попробуйте снова."
+                    )
+                job = self.backend.claim(self.name)
+            except Exception as e:
+                logger.error(f"Could not claim a review job: {e}", exc_info=True)
+                job = None
+            if job is None:
+                stop.wait(WORKER_POLL_SECONDS)
+                continue
+            try:
+                self.process(job)
+            except Exception as e:
+                # An unfinished job is retried when its lease runs out, the worker goes on
+                logger.error(f"Error finishing job {job.id}: {e}", exc_info=True)
+
+    def _keep_claimed(self, job: ReviewJob, finished: threading.Event) -> None:
+        # Other workers retry the job only when this one stops renewing its lease
+        while not finished.wait(JOB_LEASE_SECONDS / 3):
+            try:
+                if not self.backend.heartbeat(job.id, self.name):
+                    logger.warning(f"Job {job.id} was claimed by another worker")
+                    self.lost.set()
+                    return
+            except Exception as e:
+                logger.warning(f"Could not renew the lease of job {job.id}: {e}")
+
+    def process(self, job: ReviewJob) -> None:
+        """Review one job and answer the user, the job is finished either way."""
+        logger.info(f"Worker {self.name} reviews {job.upload_object} (job {job.id})")
+        finished = threading.Event()
+        self.lost.clear()
+        threading.Thread(
+            target=self._keep_claimed, args=(job, finished), daemon=True
+        ).start()
+        try:
+            self._process(job)
+        finally:
+            finished.set()
+
+    def _process(self, job: ReviewJob) -> None:
+        try:
+            reviews = self._review(job)
+        except JobLost:
+            logger.warning(f"Worker {self.name} stopped job {job.id}")
+            return
+        except ReviewFailed as e:
+            self._fail(job, str(e), str(e))
+            return
+        except Exception as e:
+            logger.error(f"Error processing job {job.id}: {e}", exc_info=True)
+            self._fail(job, "❌ Не удалось обработать файл. Попробуйте снова.", str(e))
+            return
+
+        if not reviews:
+            if not self.backend.complete(job.id, self.name, None):
+                logger.warning(f"Job {job.id} was claimed by another worker")
+                return
+            self.set_status(job, "✅ Обработка завершена!")
+            self.send_message(job, "✅ Ничего не найдено.")
+            return
+
+        # Pages and the report are served by the bot from the stored results
+        object_name = result_object_name(job.id)
+        self.storage.save_json(
+            RESULTS_BUCKET,
+            object_name,
+            {
+                "user_id": job.user_id,
+                "file_name": job.file_name,
+                "created_at": datetime.now().isoformat(),
+                "reviews": [review.to_dict() for review in reviews],
+            },
+        )
+        if not self.backend.complete(job.id, self.name, object_name):
+            logger.warning(f"Job {job.id} was claimed by another worker")
+            return
+        self.set_status(job, "✅ Обработка завершена!")
+
+        total_pages = count_pages(len(reviews))
+        start, end = page_range(1)
+        message = create_review_message(reviews[start:end], 1, total_pages)
+        keyboard = create_pagination_keyboard(1, total_pages, job.id)
+        self.send_message(job, message, reply_markup=keyboard, parse_mode="Markdown")
+
+    def _review(self, job: ReviewJob) -> list[ReviewRecord]:
+        self.set_status(job, "📥 Скачивание файла...")
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            file_path = os.path.join(tmpdir, job.file_name)
+            self.storage.download_file("uploads", job.upload_object, file_path)
+
+            if not DATA.is_ready():
+                self.set_status(
+                    job, "⏳ Загружается база примеров, проверка начнется после загрузки..."
+                )
+                DATA.get()
+
+            # Declaration hashes and findings of the last review of this upload
+            manifest_object = f"manifests/{job.user_id}/{job.file_name}.json"
+
+            if job.file_type != "archive":
+                self.set_status(job, "📄 Обработка файла...")
+                previous_manifest = self._load_manifest(manifest_object) or {}
+                file_reviewer = FileReviewer(
+                    file_path=Path(file_path),
+                    previous=previous_manifest.get("files", {}).get(job.file_name),
+                    **job.options,
+                )
+                reviews = file_reviewer.review()
+                self._save_manifest(
+                    manifest_object, {"files": {job.file_name: file_reviewer.manifest}}
+                )
+                return reviews
+
+            self.set_status(job, "📦 Извлечение файлов...")
+            extract_dir = Path(tmpdir) / "extracted"
+            too_large = (
+                f"❌ Архив слишком большой для проверки: не больше {ARCHIVE_MAX_FILES} "
+                f"файлов с кодом и {ARCHIVE_MAX_MB} MB после распаковки."
+            )
+
+            try:
+                archive = ProjectArchive(file_path)
+            except ArchiveLimitError as e:
+                logger.warning(f"Archive of job {job.id} refused: {e}")
+                raise ReviewFailed(too_large)
+            except ArchiveError as e:
+                logger.error(f"Could not open archive of job {job.id}: {e}")
+                raise ReviewFailed(
+                    "❌ Не удалось извлечь архив. Пожалуйста, убедитесь, что он не поврежден."
+                )
+
+            with archive:
+                if not archive.selected:
+                    raise ReviewFailed("❌ В архиве не найдено файлов с кодом для проверки.")
+
+                logger.info(
+                    f"Extracting {len(archive.selected)} of {len(archive.files)} "
+                    f"files of {job.file_name} to {extract_dir}"
+                )
+                try:
+                    # Files are parsed as they are extracted, only the listing
+                    # of the archive is used for the project structure
+                    project_reviewer = ProjectReviewer(
+                        project_path=archive.project_path(extract_dir),
+                        files=archive.extract(extract_dir),
+                        project_files=archive.files,
+                        previous_manifest=self._load_manifest(manifest_object),
+                        **job.options,
+                    )
+                    reviews = self._stream_project_review(project_reviewer, job)
+                    self._save_manifest(manifest_object, project_reviewer.manifest)
+                except ArchiveLimitError as e:
+                    logger.warning(f"Archive of job {job.id} refused: {e}")
+                    raise ReviewFailed(too_large)
+                except JobLost:
+                    raise
+                except Exception as e:
+                    logger.error(f"Project review failed: {str(e)}", exc_info=True)
+                    raise ReviewFailed(
+                        "❌ Не удалось обработать содержимое архива. Пожалуйста, убедитесь, что структура архива корректна."
+                    )
+            return reviews
+
+    def _stream_project_review(
+        self, project_reviewer: ProjectReviewer, job: ReviewJob
+    ) -> list[ReviewRecord]:
+        """Review a project, reporting progress and the first findings as files finish."""
+        reviews = []
+        preview_sent = False
+        last_update = 0.0
+
+        for file_review in project_reviewer.iter_review():
+            if self.lost.is_set():
+                raise JobLost(job.id)
+            reviews.extend(file_review.items)
+
+            if file_review.items and not preview_sent:
+                preview_sent = True
+                self.send_message(job, create_preview_message(file_review.items))
+
+            now = time.monotonic()
+            if now - last_update >= PROGRESS_UPDATE_SECONDS:
+                last_update = now
+                self.set_status(
+                    job,
+                    f"🔍 Проверено файлов: {file_review.done}/{file_review.total}. "
+                    f"Найдено замечаний: {len(reviews)}",
+                )
+
+        return reviews
+
+    def _load_manifest(self, object_name: str):
+        """Load the manifest of the previous review, None if there is none."""
+        try:
+            return self.storage.load_json("uploads", object_name)
+        except Exception as e:
+            logger.warning(f"Could not load review manifest {object_name}: {e}")
+            return None
+
+    def _save_manifest(self, object_name: str, manifest: dict) -> None:
+        """Store the manifest so the next upload only reviews changed declarations."""
+        try:
+            self.storage.save_json("uploads", object_name, manifest)
+        except Exception as e:
+            logger.warning(f"Could not save review manifest {object_name}: {e}")
+
+
+def run_worker():
+    """Entry point for a review worker"""
+    logging.basicConfig(
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+        level=logging.INFO,
+    )
+    logger.info(f"Starting review worker with {JOB_WORKERS} jobs at a time...")
+
+    # Load review examples before the first job arrives
+    DATA.warm_up()
+    backend = make_job_backend()
+    storage = MinioStorage()
+    # Only sends messages, updates are polled by the bot
+    bot = telebot.TeleBot(BOT_TOKEN)
+
+    stop = threading.Event()
+    prefix = f"{socket.gethostname()}-{os.getpid()}"
+    threads = [
+        threading.Thread(
+            target=ReviewWorker(f"{prefix}-{i}", backend, storage, bot).run,
+            args=(stop,),
+            name=f"review-worker-{i}",
+        )
+        for i in range(JOB_WORKERS)
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            thread.join()
+    except KeyboardInterrupt:
+        # Running jobs finish, their leases would hand them to other workers otherwise
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+
+if __name__ == "__main__":
+    run_worker()
@@ -1,7 +1,10 @@
 import os
 import requests
+from requests.adapters import HTTPAdapter
 
 from src.review.prompt import PromptGenerator
+from src.review.engine import LLM_CONCURRENCY
+from src.review.client import ModelClient, RetryableError, parse_retry_after
 
 from dotenv import load_dotenv
 
@@ -9,6 +12,41 @@ load_dotenv()
 
 MODEL_API_KEY = os.getenv("MODEL_API_KEY")
 URL = "http://84.201.152.196:8020/v1/completions"
+ENDPOINT = URL
+MODEL = "mistral-nemo-instruct-2407"
+TEMPERATURE = 0.3
+
+# Keep-alive connections shared by all requests, one per concurrent request
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(pool_maxsize=LLM_CONCURRENCY))
+SESSION.mount("https://", HTTPAdapter(pool_maxsize=LLM_CONCURRENCY))
+
+CLIENT = ModelClient(
+    ENDPOINT, retry_on=(requests.Timeout, requests.ConnectionError)
+)
+
+
+def _error_message(response: requests.Response) -> str:
+    try:
+        return response.json()["error"]["message"]
+    except (ValueError, KeyError, TypeError):
+        return f"{response.status_code} {response.text[:200]}"
+
+
+def _post(data: dict, headers: dict, timeout: float) -> str:
+    response = SESSION.post(URL, headers=headers, json=data, timeout=timeout)
+
+    if response.status_code == 200:
+        return response.json()["choices"][0]["message"]["content"]
+
+    if response.status_code == 429 or response.status_code >= 500:
+        raise RetryableError(
+            _error_message(response),
+            status_code=response.status_code,
+            retry_after=parse_retry_after(response.headers.get("Retry-After")),
+        )
+
+    raise RuntimeError(_error_message(response))
 
 
 def get_response(
@@ -24,15 +62,10 @@ def get_response(
     messages.append({"role": "user", "content": user_prompt})
 
     data = {
-        "model": "mistral-nemo-instruct-2407",
+        "model": MODEL,
         "messages": messages,
         "max_tokens": 1024,
-        "temperature": 0.3,
+        "temperature": TEMPERATURE,
     }
 
-    response = requests.post(URL, headers=headers, json=data)
-
-    if response.status_code == 200:
-        return response.json()["choices"][0]["message"]["content"]
-
-    raise RuntimeError(response.json()["error"]["message"])
+    return CLIENT.call(_post, data, headers)
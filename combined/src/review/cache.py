@@ -0,0 +1,159 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+
+# Reads of a `DiskCache` are written back in batches of this many keys,
+# or after this many seconds, so a hit does not cost a write
+ACCESS_FLUSH_ITEMS = 256
+ACCESS_FLUSH_SECONDS = 30.0
+
+
+class LRUCache:
+    """
+    In-memory cache dropping the least recently used entries above `max_items`
+    """
+
+    def __init__(self, max_items: int):
+        self.max_items = max_items
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key: str, value: bytes) -> None:
+        if self.max_items <= 0:
+            return
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class DiskCache:
+    """
+    SQLite key-value store dropping the least recently used entries
+    once the stored values exceed `max_bytes`, and entries older
+    than `ttl` seconds when it is set
+
+    The store may be shared by several processes, so the size is read
+    from the database on every eviction. Access times are kept in memory
+    and written in batches, see `ACCESS_FLUSH_ITEMS`.
+    """
+
+    def __init__(self, path: Path, max_bytes: int, ttl: Optional[float] = None):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(str(path), check_same_thread=False)
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                accessed_at REAL NOT NULL,
+                created_at REAL NOT NULL DEFAULT 0
+            )
+            """
+        )
+        columns = [
+            row[1] for row in self._connection.execute("PRAGMA table_info(cache)")
+        ]
+        if "created_at" not in columns:
+            # Stores created before entries had an age
+            self._connection.execute(
+                "ALTER TABLE cache ADD COLUMN created_at REAL NOT NULL DEFAULT 0"
+            )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS cache_created_at ON cache (created_at)"
+        )
+        self._connection.commit()
+        # key -> last read, not yet written
+        self._accessed = {}
+        self._flushed_at = time.monotonic()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value, created_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if self.ttl is not None and time.time() - row[1] > self.ttl:
+                self._connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self._connection.commit()
+                self._accessed.pop(key, None)
+                return None
+            self._accessed[key] = time.time()
+            if (
+                len(self._accessed) >= ACCESS_FLUSH_ITEMS
+                or time.monotonic() - self._flushed_at >= ACCESS_FLUSH_SECONDS
+            ):
+                self._flush_accessed()
+                self._connection.commit()
+            return row[0]
+
+    def put(self, key: str, value: bytes) -> None:
+        with self._lock:
+            now = time.time()
+            self._connection.execute(
+                "INSERT OR REPLACE INTO cache (key, value, accessed_at, created_at) "
+                "VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            self._accessed.pop(key, None)
+            # Evictions go by the reads of this process too
+            self._flush_accessed()
+            self._evict()
+            self._connection.commit()
+
+    def _flush_accessed(self) -> None:
+        if self._accessed:
+            # Another process may have read the entry later
+            self._connection.executemany(
+                "UPDATE cache SET accessed_at = MAX(accessed_at, ?) WHERE key = ?",
+                [(accessed_at, key) for key, accessed_at in self._accessed.items()],
+            )
+            self._accessed = {}
+        self._flushed_at = time.monotonic()
+
+    def _evict(self) -> None:
+        if self.ttl is not None:
+            self._connection.execute(
+                "DELETE FROM cache WHERE created_at < ?", (time.time() - self.ttl,)
+            )
+
+        size = self._connection.execute(
+            "SELECT COALESCE(SUM(LENGTH(value)), 0) FROM cache"
+        ).fetchone()[0]
+        while size > self.max_bytes:
+            rows = self._connection.execute(
+                "SELECT key, LENGTH(value) FROM cache ORDER BY accessed_at LIMIT 64"
+            ).fetchall()
+            if not rows:
+                return
+            for key, value_size in rows:
+                self._connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+                size -= value_size
+                if size <= self.max_bytes:
+                    return
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
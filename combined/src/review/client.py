@@ -0,0 +1,269 @@
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Callable, Optional
+
+
+# Requests per second allowed to start, lowered on throttling and restored on success
+LLM_RATE = float(os.getenv("LLM_RATE", 5))
+LLM_BURST = int(os.getenv("LLM_BURST", 10))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 5))
+# Seconds per request
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 120))
+
+
+class RetryableError(Exception):
+    """
+    Transient endpoint failure: throttling, server error, timeout
+    """
+
+    def __init__(
+        self,
+        message: str,
+        status_code: Optional[int] = None,
+        retry_after: Optional[float] = None,
+    ):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Seconds to wait from a `Retry-After` header (seconds or HTTP date)
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class TokenBucket:
+    """
+    Adaptive token bucket: the rate is halved when the endpoint throttles
+    and grows back by `recovery` requests per second on every success
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        capacity: int,
+        min_rate: float = 0.1,
+        recovery: float = 0.05,
+    ):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.recovery = recovery
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def acquire(self) -> float:
+        """
+        Block until a request may start, returns the time waited
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self._paused_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = max(
+                    self._paused_until - now, (1 - self._tokens) / self.rate
+                )
+            time.sleep(delay)
+            waited += delay
+
+    def on_success(self) -> None:
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.recovery)
+
+    def on_throttle(self, retry_after: Optional[float] = None) -> None:
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = min(self._tokens, 0.0)
+            if retry_after:
+                # Nobody starts a request before the endpoint allows it
+                self._paused_until = max(
+                    self._paused_until, time.monotonic() + retry_after
+                )
+
+
+class CircuitBreaker:
+    """
+    Rejects requests for `reset_timeout` seconds after `failure_threshold`
+    consecutive failures, then lets a single trial request through
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return "half-open"
+            return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                return False
+            if self._trial:
+                return False
+            self._trial = True
+            return True
+
+    def on_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def on_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._trial or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial = False
+
+    def on_release(self) -> None:
+        """
+        The request ended without telling whether the endpoint is healthy,
+        e.g. it was throttled or refused as invalid; the next one may be the trial
+        """
+        with self._lock:
+            self._trial = False
+
+
+class ModelClient:
+    """
+    Rate limiting, retries with jittered exponential backoff and
+    a circuit breaker around the requests to one model endpoint
+    """
+
+    def __init__(
+        self,
+        name: str,
+        rate: float = LLM_RATE,
+        burst: int = LLM_BURST,
+        max_retries: int = LLM_MAX_RETRIES,
+        timeout: float = LLM_TIMEOUT,
+        base_delay: float = 1,
+        max_delay: float = 60,
+        retry_on: tuple = (),
+    ):
+        """
+        `retry_on` -- exception types retried besides `RetryableError`
+        """
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker()
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_on = (RetryableError, *retry_on)
+
+        self._lock = threading.Lock()
+        self._metrics = {
+            "requests": 0,
+            "successes": 0,
+            "failures": 0,
+            "retries": 0,
+            "throttled": 0,
+            "rejected": 0,
+            "rate_wait_seconds": 0.0,
+        }
+
+    def _count(self, metric: str, value: float = 1) -> None:
+        with self._lock:
+            self._metrics[metric] += value
+
+    def metrics(self) -> dict:
+        with self._lock:
+            metrics = dict(self._metrics)
+        metrics["rate"] = self.bucket.rate
+        metrics["circuit"] = self.breaker.state
+        return metrics
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    def call(self, fn: Callable, *args, **kwargs):
+        """
+        Call `fn(*args, timeout=..., **kwargs)` until it succeeds,
+        raises a non-retryable error or runs out of retries
+        """
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                self._count("rejected")
+                raise CircuitOpenError(f"{self.name} is unavailable, circuit is open")
+
+            self._count("rate_wait_seconds", self.bucket.acquire())
+            self._count("requests")
+            try:
+                result = fn(*args, timeout=self.timeout, **kwargs)
+            except self.retry_on as e:
+                retry_after = getattr(e, "retry_after", None)
+                if getattr(e, "status_code", None) == 429:
+                    # Throttling is handled by the token bucket, the endpoint is up
+                    self.breaker.on_release()
+                    self._count("throttled")
+                    self.bucket.on_throttle(retry_after)
+                else:
+                    self.breaker.on_failure()
+
+                if attempt == self.max_retries:
+                    self._count("failures")
+                    raise
+
+                self._count("retries")
+                time.sleep(max(retry_after or 0, self._backoff(attempt)))
+                continue
+            except Exception:
+                self.breaker.on_release()
+                self._count("failures")
+                raise
+
+            self.breaker.on_success()
+            self.bucket.on_success()
+            self._count("successes")
+            return result
@@ -0,0 +1,213 @@
+import hashlib
+import json
+from argparse import ArgumentParser
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+
+# Directory under `data/review` holding the examples for every extension
+REVIEW_LANGUAGES = {"py": "py", "ts": "ts", "tsx": "ts", "cs": "cs"}
+
+CORPUS_DTYPES = {"float32": np.float32, "float16": np.float16}
+
+
+def corpus_hash(review_dir: Path) -> str:
+    """
+    Hash of every example file (path and content) under `review_dir`
+    """
+    digest = hashlib.sha256()
+    for file_path in sorted(review_dir.rglob("*.json")):
+        digest.update(str(file_path.relative_to(review_dir)).encode("utf-8"))
+        digest.update(file_path.read_bytes())
+    return digest.hexdigest()
+
+
+def load_review_examples(review_dir: Path) -> list[dict]:
+    """
+    Load review examples with their precomputed embeddings
+
+    Every `*.json` file under `review_dir` holds one chunk with
+    `query`, `answer` and `embedding` keys, its relative path is used as id.
+    """
+    examples = []
+    for file_path in sorted(review_dir.rglob("*.json")):
+        with open(file_path, "r") as f:
+            example = json.load(f)
+        example["id"] = str(file_path.relative_to(review_dir))
+        examples.append(example)
+    return examples
+
+
+class Corpus:
+    """
+    Review examples of one language
+
+    `embeddings` is a (n, dim) matrix, `text` is a utf-8 blob with all
+    queries and answers and `offsets` is a (n, 4) table of
+    (query_start, query_end, answer_start, answer_end) byte offsets into it.
+    When opened from a converted corpus directory both matrices are
+    memory-mapped, so worker processes share one page-cache copy.
+    """
+
+    def __init__(
+        self,
+        ids: list[str],
+        embeddings: np.ndarray,
+        text: np.ndarray,
+        offsets: np.ndarray,
+        version: str,
+    ):
+        self.ids = ids
+        self.embeddings = embeddings
+        self.text = text
+        self.offsets = offsets
+        self.version = version
+        self._id_index = {id_: i for i, id_ in enumerate(ids)}
+
+    @classmethod
+    def from_examples(cls, examples: list[dict], version: str) -> "Corpus":
+        blob = bytearray()
+        offsets = np.zeros((len(examples), 4), dtype=np.int64)
+        for i, example in enumerate(examples):
+            for j, key in enumerate(["query", "answer"]):
+                offsets[i, 2 * j] = len(blob)
+                blob += example[key].encode("utf-8")
+                offsets[i, 2 * j + 1] = len(blob)
+
+        embeddings = np.array(
+            [example["embedding"] for example in examples], dtype=np.float32
+        )
+        return cls(
+            ids=[example["id"] for example in examples],
+            embeddings=embeddings,
+            text=np.frombuffer(bytes(blob), dtype=np.uint8),
+            offsets=offsets,
+            version=version,
+        )
+
+    @classmethod
+    def from_review_dir(cls, review_dir: Path) -> "Corpus":
+        """
+        Load the corpus from the `data/review/<language>` directory layout
+        """
+        if not review_dir.exists():
+            return cls.from_examples([], version="")
+        return cls.from_examples(
+            load_review_examples(review_dir), version=corpus_hash(review_dir)
+        )
+
+    @classmethod
+    def open(cls, corpus_dir: Path, language: str) -> "Corpus":
+        """
+        Memory-map a corpus written by `Corpus.save`
+        """
+        with open(corpus_dir / f"{language}.json", "r") as f:
+            meta = json.load(f)
+
+        return cls(
+            ids=meta["ids"],
+            embeddings=np.load(corpus_dir / f"{language}.npy", mmap_mode="r"),
+            text=np.memmap(corpus_dir / f"{language}.text", dtype=np.uint8, mode="r")
+            if meta["text_size"]
+            else np.zeros(0, dtype=np.uint8),
+            offsets=np.load(corpus_dir / f"{language}.offsets.npy", mmap_mode="r"),
+            version=meta["corpus_hash"],
+        )
+
+    @staticmethod
+    def exists(corpus_dir: Path, language: str) -> bool:
+        return (corpus_dir / f"{language}.json").exists()
+
+    def save(self, corpus_dir: Path, language: str, dtype: str = "float32") -> None:
+        corpus_dir.mkdir(parents=True, exist_ok=True)
+
+        embeddings = np.asarray(self.embeddings, dtype=CORPUS_DTYPES[dtype])
+        np.save(corpus_dir / f"{language}.npy", embeddings)
+        np.save(corpus_dir / f"{language}.offsets.npy", np.asarray(self.offsets))
+        (corpus_dir / f"{language}.text").write_bytes(self.text.tobytes())
+
+        with open(corpus_dir / f"{language}.json", "w") as f:
+            json.dump(
+                {
+                    "corpus_hash": self.version,
+                    "dtype": dtype,
+                    "dim": int(embeddings.shape[1]) if embeddings.ndim == 2 else 0,
+                    "text_size": int(self.text.size),
+                    "ids": self.ids,
+                },
+                f,
+            )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def index(self, id_: str) -> int:
+        return self._id_index[id_]
+
+    def _text(self, start: int, end: int) -> str:
+        return self.text[start:end].tobytes().decode("utf-8")
+
+    def example(self, i: int) -> dict:
+        query_start, query_end, answer_start, answer_end = self.offsets[i]
+        return {
+            "id": self.ids[i],
+            "query": self._text(query_start, query_end),
+            "answer": self._text(answer_start, answer_end),
+        }
+
+
+def load_corpus(path_to_data: Path, language: str) -> Corpus:
+    """
+    Open the converted corpus from `path_to_data / "corpus"` when it exists,
+    otherwise fall back to the json files in `path_to_data / "review"`
+
+    A converted corpus whose `corpus_hash` differs from the json files
+    is stale, the json files are loaded instead until it is converted again
+    """
+    corpus_dir = path_to_data / "corpus"
+    review_dir = path_to_data / "review" / language
+    if Corpus.exists(corpus_dir, language):
+        corpus = Corpus.open(corpus_dir, language)
+        if not review_dir.exists() or corpus.version == corpus_hash(review_dir):
+            return corpus
+        print(
+            f"Corpus {corpus_dir / language} is older than {review_dir}, "
+            "loading the json files"
+        )
+    return Corpus.from_review_dir(review_dir)
+
+
+def convert_corpus(
+    review_dir: Path, corpus_dir: Path, dtype: str = "float32"
+) -> None:
+    """
+    Convert `review_dir/<language>/**/*.json` into the binary corpus format
+    """
+    for language in sorted(set(REVIEW_LANGUAGES.values())):
+        corpus = Corpus.from_review_dir(review_dir / language)
+        corpus.save(corpus_dir, language, dtype=dtype)
+        print(f"{language}: {len(corpus)} examples")
+
+
+def main(args: Optional[list[str]] = None) -> None:
+    parser = ArgumentParser(description="Convert review examples to binary corpus")
+    parser.add_argument(
+        "-i", "--input", type=str, help="Path to data/review directory", required=True
+    )
+    parser.add_argument(
+        "-o", "--output", type=str, help="Path to output directory", required=True
+    )
+    parser.add_argument(
+        "--dtype", choices=list(CORPUS_DTYPES), default="float32"
+    )
+    parsed = parser.parse_args(args)
+
+    convert_corpus(
+        Path(parsed.input).resolve(), Path(parsed.output).resolve(), parsed.dtype
+    )
+
+
+if __name__ == "__main__":
+    main()
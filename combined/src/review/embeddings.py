@@ -0,0 +1,301 @@
+import hashlib
+import os
+import tempfile
+import threading
+from argparse import ArgumentParser
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from chromadb import Documents, EmbeddingFunction, Embeddings
+
+from src.review.cache import DiskCache, LRUCache
+from src.review.corpus import REVIEW_LANGUAGES, load_corpus
+
+
+MODEL_NAME = "jinaai/jina-embeddings-v2-base-code"
+
+# torch -- transformers model in fp32
+# onnx -- the same model exported to ONNX Runtime
+# onnx-int8 -- ONNX model with dynamically quantized int8 weights
+EMBEDDING_BACKENDS = ["torch", "onnx", "onnx-int8"]
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+
+# Exported ONNX models are cached here, export takes a while
+ONNX_MODEL_PATH = Path(
+    os.getenv(
+        "ONNX_MODEL_PATH",
+        Path(tempfile.gettempdir()) / "telegram-review-bot" / "onnx",
+    )
+)
+
+# Texts per forward pass, larger batches only pay off with more cores
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 4 * (os.cpu_count() or 1)))
+
+# Embeddings of query chunks are cached by content, empty path disables the cache
+EMBEDDING_CACHE_PATH = os.getenv(
+    "EMBEDDING_CACHE_PATH",
+    str(Path(tempfile.gettempdir()) / "telegram-review-bot" / "embeddings.sqlite3"),
+)
+EMBEDDING_CACHE_ITEMS = int(os.getenv("EMBEDDING_CACHE_ITEMS", 10_000))
+EMBEDDING_CACHE_MB = int(os.getenv("EMBEDDING_CACHE_MB", 512))
+
+
+def normalize_chunk(text: str) -> str:
+    """
+    Drop differences that do not change the code: line endings,
+    trailing whitespace and blank lines around the chunk
+    """
+    lines = text.replace("\r\n", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip("\n")
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache: an LRU tier in memory
+    in front of a size-bounded SQLite store on disk
+    """
+
+    def __init__(
+        self,
+        model_id: str,
+        path: Optional[Path] = None,
+        max_items: int = EMBEDDING_CACHE_ITEMS,
+        max_bytes: int = EMBEDDING_CACHE_MB * 1024 * 1024,
+    ):
+        self.model_id = model_id
+        self.memory = LRUCache(max_items)
+        self.disk = DiskCache(path, max_bytes) if path is not None else None
+
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def key(self, text: str) -> str:
+        digest = hashlib.sha256(self.model_id.encode("utf-8"))
+        digest.update(b"\0")
+        digest.update(normalize_chunk(text).encode("utf-8"))
+        return digest.hexdigest()
+
+    def get(self, text: str) -> Optional[np.ndarray]:
+        key = self.key(text)
+
+        value = self.memory.get(key)
+        if value is not None:
+            self._count("memory_hits")
+            return np.frombuffer(value, dtype=np.float32)
+
+        if self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self._count("disk_hits")
+                self.memory.put(key, value)
+                return np.frombuffer(value, dtype=np.float32)
+
+        self._count("misses")
+        return None
+
+    def put(self, text: str, embedding: np.ndarray) -> None:
+        key = self.key(text)
+        value = np.asarray(embedding, dtype=np.float32).tobytes()
+        self.memory.put(key, value)
+        if self.disk is not None:
+            self.disk.put(key, value)
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "memory_items": len(self.memory),
+            "disk_items": len(self.disk) if self.disk is not None else 0,
+        }
+
+
+def default_embedding_cache(backend: str) -> Optional[EmbeddingCache]:
+    if not EMBEDDING_CACHE_PATH:
+        return None
+    return EmbeddingCache(f"{MODEL_NAME}:{backend}", Path(EMBEDDING_CACHE_PATH))
+
+
+class TorchEncoder:
+    def __init__(self, model_name: str):
+        from transformers import AutoModel
+
+        self.model = AutoModel.from_pretrained(model_name, trust_remote_code=True)
+
+    def encode(self, texts: list[str], batch_size: int) -> np.ndarray:
+        return np.array(self.model.encode(texts, batch_size=batch_size))
+
+
+class OnnxEncoder:
+    """
+    ONNX Runtime version of the jina `encode`: mean pooling
+    of the last hidden state over non-padding tokens
+    """
+
+    def __init__(self, model_name: str, model_dir: Path, quantize: bool = False):
+        from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+        from transformers import AutoTokenizer
+
+        export_dir = model_dir / "fp32"
+        if not (export_dir / "model.onnx").exists():
+            model = ORTModelForFeatureExtraction.from_pretrained(
+                model_name, export=True, trust_remote_code=True
+            )
+            model.save_pretrained(export_dir)
+            AutoTokenizer.from_pretrained(model_name).save_pretrained(export_dir)
+
+        if quantize:
+            quantized_dir = model_dir / "int8"
+            if not (quantized_dir / "model_quantized.onnx").exists():
+                quantizer = ORTQuantizer.from_pretrained(export_dir)
+                quantizer.quantize(
+                    save_dir=quantized_dir,
+                    quantization_config=AutoQuantizationConfig.avx2(
+                        is_static=False, per_channel=True
+                    ),
+                )
+            self.model = ORTModelForFeatureExtraction.from_pretrained(
+                quantized_dir, file_name="model_quantized.onnx"
+            )
+        else:
+            self.model = ORTModelForFeatureExtraction.from_pretrained(export_dir)
+
+        self.tokenizer = AutoTokenizer.from_pretrained(export_dir)
+        # Same truncation as the jina `encode`
+        self.max_length = self.tokenizer.init_kwargs.get("model_max_length", 2048)
+
+    def encode(self, texts: list[str], batch_size: int) -> np.ndarray:
+        embeddings = []
+        for start in range(0, len(texts), batch_size):
+            tokens = self.tokenizer(
+                texts[start : start + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.max_length,
+                return_tensors="np",
+            )
+            hidden_state = np.asarray(self.model(**tokens).last_hidden_state)
+
+            mask = tokens["attention_mask"][..., None].astype(hidden_state.dtype)
+            embeddings.append(
+                (hidden_state * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            )
+        return np.concatenate(embeddings).astype(np.float32)
+
+
+def load_encoder(backend: str, model_name: str = MODEL_NAME):
+    if backend == "torch":
+        return TorchEncoder(model_name)
+    if backend in ["onnx", "onnx-int8"]:
+        return OnnxEncoder(
+            model_name, ONNX_MODEL_PATH, quantize=backend == "onnx-int8"
+        )
+    raise ValueError(
+        f"Unknown embedding backend {backend}, expected one of {EMBEDDING_BACKENDS}"
+    )
+
+
+class MyEmbeddingFunction(EmbeddingFunction):
+    def __init__(
+        self,
+        backend: str = EMBEDDING_BACKEND,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        cache: Optional[EmbeddingCache] = None,
+    ):
+        """
+        `cache` -- embedding cache, `default_embedding_cache(backend)` if omitted.
+        `embed(texts, use_cache=False)` bypasses it.
+        """
+        self.backend = backend
+        self.encoder = load_encoder(backend)
+        self.batch_size = batch_size
+        self.cache = cache if cache is not None else default_embedding_cache(backend)
+
+    def __call__(self, input: Documents) -> Embeddings:
+        return self.embed(list(input))
+
+    def embed(self, texts: list[str], use_cache: bool = True) -> np.ndarray:
+        if self.cache is None or not use_cache:
+            return self.encoder.encode(texts, batch_size=self.batch_size)
+
+        cached = [self.cache.get(text) for text in texts]
+        missing = [i for i, embedding in enumerate(cached) if embedding is None]
+
+        if missing:
+            # Only chunks never seen before go through the model
+            computed = self.encoder.encode(
+                [texts[i] for i in missing], batch_size=self.batch_size
+            )
+            for i, embedding in zip(missing, computed):
+                self.cache.put(texts[i], embedding)
+                cached[i] = embedding
+
+        return np.stack(cached).astype(np.float32)
+
+
+def check_parity(
+    path_to_data: Path, backend: str, limit: Optional[int] = None
+) -> dict[str, float]:
+    """
+    Cosine similarity between `backend` embeddings of the corpus queries
+    and the shipped embeddings, which were computed by the PyTorch model
+    """
+    embedding_fn = MyEmbeddingFunction(backend)
+    similarities = []
+
+    for language in sorted(set(REVIEW_LANGUAGES.values())):
+        corpus = load_corpus(path_to_data, language)
+        count = len(corpus) if limit is None else min(limit, len(corpus))
+        if count == 0:
+            continue
+
+        expected = np.asarray(corpus.embeddings[:count], dtype=np.float32)
+        actual = embedding_fn.embed(
+            [corpus.example(i)["query"] for i in range(count)], use_cache=False
+        )
+
+        similarities.append(
+            (expected * actual).sum(axis=1)
+            / (np.linalg.norm(expected, axis=1) * np.linalg.norm(actual, axis=1))
+        )
+
+    similarities = np.concatenate(similarities)
+    return {
+        "count": int(similarities.size),
+        "mean": float(similarities.mean()),
+        "min": float(similarities.min()),
+    }
+
+
+def main(args: Optional[list[str]] = None) -> None:
+    parser = ArgumentParser(
+        description="Compare embeddings of a backend with the shipped corpus"
+    )
+    parser.add_argument("-d", "--data", type=str, help="Path to data directory", required=True)
+    parser.add_argument("--backend", choices=EMBEDDING_BACKENDS, default="onnx")
+    parser.add_argument("--limit", type=int, help="Examples per language")
+    parser.add_argument(
+        "--min-similarity", type=float, default=0.99,
+        help="Fail when any example is less similar",
+    )
+    parsed = parser.parse_args(args)
+
+    result = check_parity(Path(parsed.data).resolve(), parsed.backend, parsed.limit)
+    print(result)
+
+    if result["min"] < parsed.min_similarity:
+        raise SystemExit(
+            f"{parsed.backend} embeddings diverge: min similarity {result['min']:.4f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
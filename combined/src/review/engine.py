@@ -0,0 +1,59 @@
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Iterable
+
+
+# Requests in flight per model endpoint
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", 8))
+
+
+class RequestEngine:
+    """
+    Runs model requests on one thread pool per endpoint,
+    the pool size is the concurrency limit of the endpoint
+    """
+
+    def __init__(self, default_concurrency: int = LLM_CONCURRENCY):
+        self.default_concurrency = default_concurrency
+        self._concurrency: dict[str, int] = {}
+        self._executors: dict[str, ThreadPoolExecutor] = {}
+        self._lock = threading.Lock()
+
+    def set_concurrency(self, endpoint: str, concurrency: int) -> None:
+        """
+        Must be called before the first request to `endpoint`
+        """
+        with self._lock:
+            self._concurrency[endpoint] = concurrency
+
+    def _executor(self, endpoint: str) -> ThreadPoolExecutor:
+        with self._lock:
+            if endpoint not in self._executors:
+                self._executors[endpoint] = ThreadPoolExecutor(
+                    max_workers=self._concurrency.get(
+                        endpoint, self.default_concurrency
+                    ),
+                    thread_name_prefix="llm",
+                )
+            return self._executors[endpoint]
+
+    def submit(self, endpoint: str, fn: Callable, *args, **kwargs) -> Future:
+        return self._executor(endpoint).submit(fn, *args, **kwargs)
+
+    def map(
+        self, endpoint: str, fn: Callable, *iterables: Iterable
+    ) -> list[Future]:
+        """
+        Submit `fn` for every item, the futures are in the order of the items
+        """
+        return [self.submit(endpoint, fn, *args) for args in zip(*iterables)]
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            for executor in self._executors.values():
+                executor.shutdown(wait=wait)
+            self._executors.clear()
+
+
+ENGINE = RequestEngine()
@@ -1,15 +1,29 @@
 import os
 import requests
-from openai import OpenAI
+from openai import (
+    OpenAI,
+    APIConnectionError,
+    APIStatusError,
+    APITimeoutError,
+)
 
 from src.review.prompt import PromptGenerator
+from src.review.client import ModelClient, RetryableError, parse_retry_after
+
 
+ENDPOINT = "https://api.vsegpt.ru/v1"
+# MODEL = "qwen/qwen-2.5-coder-32b-instruct"
+MODEL = "google/gemma-2-27b-it"
+TEMPERATURE = 0.15
 
+# Retries are done by CLIENT
 client = OpenAI(
-    api_key=os.environ["VSE_GPT_API_KEY"], base_url="https://api.vsegpt.ru/v1"
+    api_key=os.environ["VSE_GPT_API_KEY"], base_url=ENDPOINT, max_retries=0
 )
 # client = OpenAI(api_key=os.environ["DEEPSEEK_API_KEY"], base_url="https://api.deepseek.com")
 
+CLIENT = ModelClient(ENDPOINT, retry_on=(APITimeoutError, APIConnectionError))
+
 
 def get_response(
     system_prompt: str, user_prompt: str, context: dict[str, list[str]]
@@ -21,12 +35,25 @@ def get_response(
 
     messages.append({"role": "user", "content": user_prompt})
 
-    response = client.chat.completions.create(
-        # model="qwen/qwen-2.5-coder-32b-instruct",
-        model="google/gemma-2-27b-it",
-        messages=messages,
-        stream=False,
-        temperature=0.15,
-    )
+    return CLIENT.call(_create, messages)
+
+
+def _create(messages: list[dict], timeout: float) -> str:
+    try:
+        response = client.chat.completions.create(
+            model=MODEL,
+            messages=messages,
+            stream=False,
+            temperature=TEMPERATURE,
+            timeout=timeout,
+        )
+    except APIStatusError as e:
+        if e.status_code == 429 or e.status_code >= 500:
+            raise RetryableError(
+                e.message,
+                status_code=e.status_code,
+                retry_after=parse_retry_after(e.response.headers.get("Retry-After")),
+            ) from e
+        raise
 
     return response.choices[0].message.content
@@ -0,0 +1,88 @@
+import os
+import re
+from typing import Sequence
+
+from src.review.parsers.make_chunks import Chunk
+from src.review.utils import estimate_tokens
+
+
+# Code tokens of the declarations packed into one request,
+# declarations above the budget are reviewed alone. 0 disables packing
+PACK_TOKEN_BUDGET = int(os.getenv("PACK_TOKEN_BUDGET", 1536))
+# Keeps the answer of a packed request within its `max_tokens`
+PACK_MAX_DECLARATIONS = int(os.getenv("PACK_MAX_DECLARATIONS", 8))
+
+
+def chunk_line_range(chunk: Chunk) -> tuple[int, int]:
+    """
+    First and last line number of the chunk as numbered in the prompt
+    """
+    start = chunk.get_start_line() + 1
+    return start, start + str(chunk).count("\n")
+
+
+def drop_context_comments(review: dict, chunk: Chunk) -> dict:
+    """
+    Review without the comments on the lines a window repeats
+    from the previous window as context
+    """
+    first_line = chunk.get_start_line() + chunk.context_lines + 1
+    kept = {}
+    for key, comment in review.items():
+        match = re.match(r"^\d+", key)
+        if match is None or int(match.group()) >= first_line:
+            kept[key] = comment
+    return kept
+
+
+def pack_chunks(
+    chunks: Sequence[Chunk],
+    indices: Sequence[int],
+    token_budget: int = PACK_TOKEN_BUDGET,
+    max_chunks: int = PACK_MAX_DECLARATIONS,
+) -> list[list[int]]:
+    """
+    Group `chunks[i]` for `i` in `indices` into packs of neighbouring chunks
+    whose code fits into `token_budget`, order is kept
+    """
+    packs = []
+    pack, pack_tokens = [], 0
+    for i in indices:
+        tokens = estimate_tokens(str(chunks[i]))
+        if pack and (
+            pack_tokens + tokens > token_budget or len(pack) >= max_chunks
+        ):
+            packs.append(pack)
+            pack, pack_tokens = [], 0
+        pack.append(i)
+        pack_tokens += tokens
+    if pack:
+        packs.append(pack)
+    return packs
+
+
+def split_review(review: dict, ranges: Sequence[tuple[int, int]]) -> list[dict]:
+    """
+    Split a review of several chunks by the line ranges of the chunks
+
+    Comments keyed outside of every range go to the closest chunk above.
+    """
+    reviews = [{} for _ in ranges]
+    for key, comment in review.items():
+        match = re.match(r"^\d+", key)
+        line = int(match.group()) if match else ranges[0][0]
+
+        owner = 0
+        for i, (start, _) in enumerate(ranges):
+            if start <= line:
+                owner = i
+        for i, (start, end) in enumerate(ranges):
+            if start <= line <= end:
+                owner = i
+                break
+
+        if key in reviews[owner]:
+            reviews[owner][key] += comment
+        else:
+            reviews[owner][key] = comment
+    return reviews
@@ -1,4 +1,7 @@
-from tree_sitter import Language, Parser
+import threading
+from pathlib import Path
+
+from tree_sitter import Language, Parser, Query
 import tree_sitter_python as ts_python
 import tree_sitter_c_sharp as ts_csharp
 import tree_sitter_typescript as ts_typescript
@@ -10,13 +13,31 @@ LANGUAGE = {
     "ts": Language(ts_typescript.language_typescript()),
 }
 
+# Parsers are not thread-safe, every thread keeps one per language
+_parsers = threading.local()
+
+
+def get_parser(extension: str) -> Parser:
+    parsers = getattr(_parsers, "parsers", None)
+    if parsers is None:
+        parsers = _parsers.parsers = {}
+    if extension not in parsers:
+        parsers[extension] = Parser(LANGUAGE[extension])
+    return parsers[extension]
+
+
+# Captures: @declaration with its @name, @body, @member, @statement, @import,
+# @module with the names @imported from it, @namespace
+QUERIES_PATH = Path(__file__).parent / "queries"
+
+QUERY_FILES = {
+    "py": "python.scm",
+    "cs": "csharp.scm",
+    "tsx": "typescript.scm",
+    "ts": "typescript.scm",
+}
 
-IMPORTANT_NODES = {
-    "py": [
-        "import_statement",
-        "import_as_statement",
-        "import_from_statement",
-        "class_decloration",
-        "function_decloration",
-    ]
+QUERIES = {
+    extension: Query(LANGUAGE[extension], (QUERIES_PATH / file_name).read_text())
+    for extension, file_name in QUERY_FILES.items()
 }
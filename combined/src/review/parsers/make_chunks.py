@@ -1,177 +1,305 @@
-from src.review.parsers.language import LANGUAGE
-from tree_sitter import Parser
+from src.review.parsers.language import QUERIES, get_parser
+from src.review.utils import estimate_tokens
+from tree_sitter import QueryCursor
 
 import json
+import os
 
 from pathlib import Path
 
 
-DECLARATION = {
-    "py": ["class_definition", "function_definition"],
-    "cs": [
-        "class_declaration",
-        "method_declaration",
-        "function_declaration",
-        "interface_declaration",
-    ],
-    "ts": [
-        "class_declaration",
-        "function_declaration",
-        "interface_declaration",
-        "type_alias_declaration",
-        "variable_declarator",
-    ],
-    "tsx": [
-        "class_declaration",
-        "function_declaration",
-        "interface_declaration",
-        "type_alias_declaration",
-        "variable_declarator",
-    ],
-}
-
-EXPORT = {
-    "py": ["export_statement"],
-    "cs": ["export_statement"],
-    "ts": ["export_statement"],
-    "tsx": ["export_statement"],
-}
-
-IMPORT = {
-    "py": ["import_statement", "import_as_statement", "import_from_statement"],
-    "cs": ["using_statement"],
-    "ts": ["import_statement", "import_as_statement", "import_from_statement"],
-    "tsx": ["import_statement", "import_as_statement", "import_from_statement"],
-}
-
-STATEMENT = {
-    "py": ["block"],
-    "cs": ["block"],
-    "ts": ["statement_block", "interface_body"],
-    "tsx": ["statement_block", "interface_body"],
-}
-
-
-def chunk_code(code: str, extension: str):
-    tree = Parser(LANGUAGE[extension]).parse(bytes(code, "utf-8"))
-
-    code_lines = code.split("\n")
-    base_chunk = Chunk(code_lines)
-
+# Declarations above the budget are split into windows reviewed separately
+MAX_CHUNK_TOKENS = int(os.getenv("MAX_CHUNK_TOKENS", 2048))
+# Lines of the previous window repeated at the top of the next one
+CHUNK_OVERLAP_LINES = int(os.getenv("CHUNK_OVERLAP_LINES", 5))
+
+
+def outermost(nodes):
+    """
+    Nodes not inside another node of `nodes`, in document order
+    """
+    result = []
+    end = -1
+    for node in sorted(nodes, key=lambda node: (node.start_byte, -node.end_byte)):
+        if node.start_byte >= end:
+            result.append(node)
+            end = node.end_byte
+    return result
+
+
+def query_code(node, extension):
+    """
+    Run the query of the language over the subtree of `node` in one pass
+
+    Returns a dict of:
+    - "declarations" -- (declaration node, name node) pairs
+    - "modules" -- (module node, imported name node or None) pairs
+    - "bodies", "members", "statements", "imports", "namespaces" -- nodes
+    """
+    found = {
+        "declarations": [],
+        "modules": [],
+        "bodies": [],
+        "members": [],
+        "statements": [],
+        "imports": [],
+        "namespaces": [],
+    }
+    for _, match in QueryCursor(QUERIES[extension]).matches(node):
+        if "declaration" in match:
+            found["declarations"].append((match["declaration"][0], match["name"][0]))
+        if "module" in match:
+            imported = match.get("imported")
+            found["modules"].append(
+                (match["module"][0], imported[0] if imported else None)
+            )
+        for capture, key in (
+            ("body", "bodies"),
+            ("member", "members"),
+            ("statement", "statements"),
+            ("import", "imports"),
+            ("namespace", "namespaces"),
+        ):
+            found[key].extend(match.get(capture, []))
+    return found
+
+
+def chunk_code(code: str, extension: str, max_tokens: int = MAX_CHUNK_TOKENS):
+    """
+    Outline of the file with declaration bodies replaced by `<BODY name>`
+    and the top-level declarations by name, oversized ones split into windows
+    """
+    source = Source(code)
+    tree = get_parser(extension).parse(source.data)
+    found = query_code(tree.root_node, extension)
+    return chunk_tree(source, tree, found, extension, max_tokens)
+
+
+def chunk_tree(source, tree, found, extension: str, max_tokens: int = MAX_CHUNK_TOKENS):
+    """
+    `chunk_code` of a parsed file, `found` is `query_code` of its root
+    """
+    names = {node.id: name for node, name in found["declarations"]}
+    top_level = outermost([node for node, _ in found["declarations"]])
+    bodies = outermost(found["bodies"])
+
+    base_chunk = Chunk(source)
     declarations = dict()
 
-    def chunk(node):
-        nonlocal base_chunk
-        nonlocal declarations
-
-        base_chunk.consume(node.start_point)
-
-        if node.type in DECLARATION[extension]:
-            # Special handling for TypeScript arrow functions
-            if extension in ["ts", "tsx"] and node.type == "variable_declarator":
-                if any([child.type == "arrow_function" for child in node.children]):
-                    identifier, declaration_chunk = chunk_declaration(
-                        node, base_chunk, extension
-                    )
-                    declarations[str(identifier)] = declaration_chunk
-            else:
-                identifier, declaration_chunk = chunk_declaration(
-                    node, base_chunk, extension
-                )
-                declarations[str(identifier)] = declaration_chunk
-
-        elif not node.children:
-            base_chunk.consume(node.end_point)
-        else:
-            for child in node.children:
-                chunk(child)
-
-    chunk(tree.root_node)
-
-    return base_chunk, declarations
+    i = 0
+    for node in top_level:
+        identifier = source.text(names[node.id].start_byte, names[node.id].end_byte)
 
+        while i < len(bodies) and bodies[i].start_byte < node.start_byte:
+            i += 1
+        while i < len(bodies) and bodies[i].end_byte <= node.end_byte:
+            base_chunk.consume(bodies[i].start_point)
+            base_chunk.add_tag(f"<BODY {identifier}>")
+            base_chunk.skip(bodies[i].end_point)
+            i += 1
 
-def chunk_declaration(node, base_chunk, extension):
-    identifier = None
-    declaration_chunk = base_chunk.fork()
+        declaration_chunk = Chunk(source, node.start_point)
+        declaration_chunk.consume(node.end_point)
 
-    def chunk(node):
-        nonlocal identifier
-        nonlocal declaration_chunk
+        if estimate_tokens(str(declaration_chunk)) <= max_tokens:
+            declarations[identifier] = declaration_chunk
+            continue
 
-        base_chunk.consume(node.start_point)
-        declaration_chunk.consume(node.start_point)
+        windows = split_declaration(node, source, extension, max_tokens)
+        for k, window in enumerate(windows):
+            declarations[f"{identifier}[{k + 1}/{len(windows)}]"] = window
 
-        if "identifier" in node.type and identifier is None:
-            identifier = base_chunk.fork()
-            identifier.consume(node.end_point)
-            base_chunk.consume(node.end_point)
-            declaration_chunk.consume(node.end_point)
+    base_chunk.consume(tree.root_node.end_point)
 
-            return
+    return base_chunk, declarations
 
-        if node.type in STATEMENT[extension]:
-            base_chunk.add_tag(f"<BODY {identifier}>")
-            declaration_chunk.consume(node.end_point)
-            base_chunk.skip(node.end_point)
 
-            return
+def split_boundaries(node, extension):
+    """
+    Lines inside a declaration where a nested declaration or a member starts
+    and lines where a statement starts
+    """
+    found = query_code(node, extension)
+
+    # A decorated definition ends with the definition, cut above the decorators
+    starts = {}
+    for declaration, _ in found["declarations"]:
+        row = declaration.start_point[0]
+        starts[declaration.end_byte] = min(row, starts.get(declaration.end_byte, row))
+
+    declarations = set(starts.values())
+    declarations.update(member.start_point[0] for member in found["members"])
+    statements = {statement.start_point[0] for statement in found["statements"]}
+    return declarations, statements
+
+
+def split_declaration(
+    node, source, extension, max_tokens, overlap=CHUNK_OVERLAP_LINES
+):
+    """
+    Split an oversized declaration into windows of whole lines fitting
+    `max_tokens`, preferably cut where a nested declaration or a statement
+    starts. Every window after the first repeats `overlap` lines of the
+    previous one as context.
+    """
+    first_line = node.start_point[0]
+    last_line = node.end_point[0]
+    boundaries = split_boundaries(node, extension)
+
+    line_tokens = {
+        row: estimate_tokens(source.line(row) + "\n")
+        for row in range(first_line, last_line + 1)
+    }
+
+    windows = []
+    start = first_line
+    while start <= last_line:
+        context_start = max(first_line, start - overlap) if windows else start
+        # The context is shortened or dropped when it leaves no room for the next line
+        tokens = sum(line_tokens[row] for row in range(context_start, start + 1))
+        while context_start < start and tokens > max_tokens:
+            tokens -= line_tokens[context_start]
+            context_start += 1
+
+        # Longest run of lines within the budget, at least one line
+        end = start + 1
+        while end <= last_line:
+            tokens += line_tokens[end]
+            if tokens > max_tokens:
+                break
+            end += 1
+
+        if end <= last_line:
+            # Nested declarations are kept whole when possible
+            for lines in boundaries:
+                cuts = [line for line in lines if start < line <= end]
+                if cuts:
+                    end = max(cuts)
+                    break
+
+        windows.append(WindowChunk(source, context_start, end, start - context_start))
+        start = end
+
+    return windows
+
+
+class Source:
+    """
+    UTF-8 source of a file shared by all its chunks,
+    points are (row, byte column) as reported by tree-sitter
+    """
+
+    __slots__ = ("data", "line_starts")
+
+    def __init__(self, code: str):
+        self.data = code.encode("utf-8")
+        self.line_starts = [0]
+        start = self.data.find(b"\n")
+        while start != -1:
+            self.line_starts.append(start + 1)
+            start = self.data.find(b"\n", start + 1)
+
+    def offset(self, point) -> int:
+        return self.line_starts[point[0]] + point[1]
+
+    def line_end(self, row) -> int:
+        """
+        Offset of the end of `row` without its newline
+        """
+        if row + 1 < len(self.line_starts):
+            return self.line_starts[row + 1] - 1
+        return len(self.data)
+
+    def line(self, row) -> str:
+        return self.data[self.line_starts[row] : self.line_end(row)].decode("utf-8")
+
+    def text(self, start, end) -> str:
+        return self.data[start:end].decode("utf-8")
 
-        if not node.children:
-            base_chunk.consume(node.end_point)
-            declaration_chunk.consume(node.end_point)
-        else:
-            for child in node.children:
-                chunk(child)
 
-    chunk(node)
+class Chunk:
+    """
+    Text assembled from spans of the shared source and tags,
+    materialized only when converted to `str`
+    """
 
-    return identifier, declaration_chunk
+    __slots__ = ("_source", "_chunk_start", "_parts", "_ptr", "_text")
 
+    # Leading lines repeated from the previous chunk of a split declaration
+    context_lines = 0
 
-class Chunk:
-    def __init__(self, code_lines, chunk_start=(0, 0)):
-        self._code_lines = code_lines
+    def __init__(self, source, chunk_start=(0, 0)):
+        # Plain tuples, tree-sitter points do not survive pickling
+        chunk_start = (chunk_start[0], chunk_start[1])
+        self._source = source
         self._chunk_start = chunk_start
-        self._chunk_str = ""
+        # (start, end) offsets into the source or literal strings
+        self._parts = []
         self._ptr = chunk_start
+        self._text = None
 
-    def consume(self, until_point):
-        if self._ptr[0] == until_point[0]:
-            self._chunk_str += self._code_lines[self._ptr[0]][
-                self._ptr[1] : until_point[1]
-            ] + ("\n" if until_point[1] == len(self._code_lines[self._ptr[0]]) else "")
-            self._ptr = until_point
+    def _append_span(self, start, end):
+        if start >= end:
             return
+        self._text = None
+        if self._parts and type(self._parts[-1]) is tuple and self._parts[-1][1] == start:
+            self._parts[-1] = (self._parts[-1][0], end)
+        else:
+            self._parts.append((start, end))
 
-        self._chunk_str += self._code_lines[self._ptr[0]][self._ptr[1] :] + "\n"
-
-        for i in range(self._ptr[0] + 1, until_point[0]):
-            self._chunk_str += self._code_lines[i] + "\n"
+    def _append_text(self, text):
+        self._text = None
+        self._parts.append(text)
 
-        self._chunk_str += self._code_lines[until_point[0]][: until_point[1]]
-        self._ptr = until_point
+    def consume(self, until_point):
+        """
+        Append the source from the current position to `until_point`
+        """
+        start = self._source.offset(self._ptr)
+        self._ptr = (until_point[0], until_point[1])
+        self._append_span(start, self._source.offset(self._ptr))
 
     def add_tag(self, tag):
-        self._chunk_str += tag
+        self._append_text(tag)
 
     def fork(self):
-        return Chunk(self._code_lines, self._ptr)
+        return Chunk(self._source, self._ptr)
 
     def skip(self, until_point):
-        self._ptr = until_point
+        self._ptr = (until_point[0], until_point[1])
 
     def __str__(self):
-        return self._chunk_str
+        if self._text is None:
+            self._text = "".join(
+                part if type(part) is str else self._source.text(*part)
+                for part in self._parts
+            )
+        return self._text
 
     def to_json(self, path: Path):
         path.parent.mkdir(parents=True, exist_ok=True)
         with open(path, "w") as f:
             f.write(
-                json.dumps(
-                    {"start_line": self._chunk_start[0], "code": self._chunk_str}
-                )
+                json.dumps({"start_line": self._chunk_start[0], "code": str(self)})
             )
 
     def get_start_line(self):
         return self._chunk_start[0]
+
+
+class WindowChunk(Chunk):
+    """
+    Whole source lines `[start_line, end_line)` of a split declaration,
+    the first `context_lines` of them belong to the previous window
+    """
+
+    __slots__ = ("context_lines",)
+
+    def __init__(self, source, start_line, end_line, context_lines=0):
+        super().__init__(source, (start_line, 0))
+        self._append_span(
+            source.line_starts[start_line],
+            source.line_end(min(end_line, len(source.line_starts)) - 1),
+        )
+        self._ptr = (end_line, 0)
+        self.context_lines = context_lines
@@ -1,9 +1,11 @@
 from src.review.parsers.language import LANGUAGE
 from src.review.parsers.make_chunks import chunk_code
 
+import time
+from argparse import ArgumentParser
 from pathlib import Path
 
-from typing import Tuple, Dict, Union
+from typing import Optional, Tuple, Dict, Union
 
 
 def parse_file(file_path: Union[str, Path]) -> Tuple[str, Dict]:
@@ -16,7 +18,7 @@ def parse_file(file_path: Union[str, Path]) -> Tuple[str, Dict]:
     if type(file_path) == str:
         file_path = Path(file_path)
 
-    exension = file_path.suffix[1:]
+    exension = file_path.suffix[1:].lower()
 
     if exension not in LANGUAGE:
         return "", {}
@@ -27,3 +29,46 @@ def parse_file(file_path: Union[str, Path]) -> Tuple[str, Dict]:
     base_chunk, declarations = chunk_code(code, exension)
 
     return base_chunk, declarations
+
+
+def benchmark(paths: list[Path], repeat: int = 3) -> dict:
+    """
+    Parse time of every supported file under `paths`, best of `repeat` runs
+    """
+    files = [
+        file
+        for path in paths
+        for file in ([path] if path.is_file() else sorted(path.rglob("*")))
+        if file.is_file() and file.suffix[1:] in LANGUAGE
+    ]
+    size = sum(file.stat().st_size for file in files)
+
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for file in files:
+            try:
+                parse_file(file)
+            except UnicodeDecodeError:
+                pass
+        best = min(best, time.perf_counter() - start)
+
+    return {
+        "files": len(files),
+        "mb": round(size / 2**20, 2),
+        "seconds": round(best, 3),
+        "mb_per_second": round(size / 2**20 / best, 2) if best else None,
+    }
+
+
+def main(args: Optional[list[str]] = None) -> None:
+    parser = ArgumentParser(description="Benchmark code chunking")
+    parser.add_argument("paths", type=Path, nargs="+", help="Files or directories")
+    parser.add_argument("--repeat", type=int, default=3)
+    parsed = parser.parse_args(args)
+
+    print(benchmark(parsed.paths, parsed.repeat))
+
+
+if __name__ == "__main__":
+    main()
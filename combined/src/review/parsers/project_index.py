@@ -0,0 +1,364 @@
+import os
+import posixpath
+import re
+from bisect import bisect_right
+from concurrent.futures import Executor
+from pathlib import Path, PurePosixPath
+from typing import Iterable, Optional
+
+import numpy as np
+
+from src.review.parsers.language import LANGUAGE, get_parser
+from src.review.parsers.make_chunks import query_code
+
+
+# Signatures of symbols from other files added to the prompt of a chunk
+CONTEXT_SIGNATURES = int(os.getenv("CONTEXT_SIGNATURES", 8))
+# Longest declaration header kept in the index
+SIGNATURE_MAX_CHARS = 300
+# Member headers kept in the signature of a class
+SIGNATURE_MAX_MEMBERS = 8
+# Files indexed per task of the executor
+INDEX_CHUNK_FILES = 16
+
+IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+
+def _text(data: bytes, node) -> str:
+    return data[node.start_byte : node.end_byte].decode("utf-8", "replace")
+
+
+def index_file(path: Path) -> dict:
+    """
+    Symbols, imported modules and declared namespaces of one file,
+    runs in the parse worker processes; only parses the file, without chunking
+
+    Returns a dict of:
+    - "symbols" -- (name, signature) of every top-level declaration,
+    the signature is the header with the headers of its members
+    - "modules" -- (module, imported name or None) as written in the file
+    - "namespaces" -- namespaces declared by the file
+    """
+    extension = path.suffix[1:].lower()
+    if extension not in LANGUAGE:
+        return empty_index()
+    try:
+        data = path.read_bytes()
+    except OSError:
+        return empty_index()
+
+    tree = get_parser(extension).parse(data)
+    return index_tree(data, query_code(tree.root_node, extension))
+
+
+def empty_index() -> dict:
+    return {"symbols": [], "modules": [], "namespaces": []}
+
+
+def index_tree(data: bytes, found: dict) -> dict:
+    """
+    `index_file` of a parsed file, `found` is `query_code` of its root
+    """
+    index = empty_index()
+
+    # The header of a declaration ends where its body or first member starts
+    bodies = sorted(
+        found["bodies"] + found["members"], key=lambda body: body.start_byte
+    )
+    body_starts = [body.start_byte for body in bodies]
+
+    def header(node) -> str:
+        end = node.end_byte
+        i = bisect_right(body_starts, node.start_byte)
+        # A python class body starts with its first member, skip enclosing ones
+        while i < len(bodies) and bodies[i].start_byte < node.end_byte:
+            if bodies[i].end_byte <= node.end_byte:
+                end = bodies[i].start_byte
+                break
+            i += 1
+        text = data[node.start_byte : end].decode("utf-8", "replace")
+        return " ".join(text.split()).rstrip(" {")[:SIGNATURE_MAX_CHARS]
+
+    names = {node.id: name for node, name in found["declarations"]}
+    nodes = {node.id: node for node in found["members"]}
+    nodes.update((node.id, node) for node, _ in found["declarations"])
+
+    # (end byte, symbol) of the declarations and members enclosing the current one
+    stack = []
+    symbols = []
+    for node in sorted(nodes.values(), key=lambda node: (node.start_byte, -node.end_byte)):
+        while stack and stack[-1][0] <= node.start_byte:
+            stack.pop()
+        parent = node.parent
+        if (
+            parent is not None
+            and parent.type == "decorated_definition"
+            and parent.id in nodes
+        ):
+            # Definition inside its decorated definition, indexed as the latter
+            continue
+        if not stack:
+            if node.id in names:
+                symbols.append((_text(data, names[node.id]), header(node), []))
+                stack.append((node.end_byte, len(symbols) - 1))
+            continue
+        members = symbols[stack[0][1]][2]
+        if len(stack) == 1 and len(members) < SIGNATURE_MAX_MEMBERS:
+            members.append(header(node))
+        stack.append((node.end_byte, stack[0][1]))
+
+    index["symbols"] = [
+        (name, "\n".join([signature, *(f"    {member}" for member in members)]))
+        for name, signature, members in symbols
+    ]
+    index["modules"] = [
+        (_text(data, module), _text(data, imported) if imported else None)
+        for module, imported in found["modules"]
+    ]
+    index["namespaces"] = [_text(data, node) for node in found["namespaces"]]
+    return index
+
+
+def _python_modules(files: list[str]) -> dict[str, int]:
+    """
+    Dotted module names of the python files
+    """
+    modules = {}
+    for i, file in enumerate(files):
+        if not file.endswith(".py"):
+            continue
+        parts = list(PurePosixPath(file).with_suffix("").parts)
+        if parts[-1] == "__init__":
+            parts = parts[:-1]
+        if not parts:
+            continue
+        modules.setdefault(".".join(parts), i)
+        if parts[0] == "src" and len(parts) > 1:
+            # src layout, imported without the prefix
+            modules.setdefault(".".join(parts[1:]), i)
+    return modules
+
+
+def _resolve_python(
+    file: str, module: str, imported: Optional[str], modules: dict[str, int]
+) -> list[int]:
+    if module.startswith("."):
+        level = len(module) - len(module.lstrip("."))
+        package = list(PurePosixPath(file).parent.parts)
+        package = package[: len(package) - (level - 1)] if level > 1 else package
+        rest = module[level:]
+        module = ".".join(package + ([rest] if rest else []))
+
+    candidates = [module]
+    if imported:
+        # `from package import module`
+        candidates.append(f"{module}.{imported}" if module else imported)
+    return [modules[candidate] for candidate in candidates if candidate in modules]
+
+
+def _resolve_typescript(file: str, module: str, paths: dict[str, int]) -> list[int]:
+    # Packages from node_modules are not part of the project
+    if not module.startswith("."):
+        return []
+    path = posixpath.normpath(posixpath.join(posixpath.dirname(file), module))
+    stem = re.sub(r"\.(js|jsx|ts|tsx)$", "", path)
+    for candidate in (
+        path,
+        f"{stem}.ts",
+        f"{stem}.tsx",
+        f"{stem}.d.ts",
+        f"{stem}/index.ts",
+        f"{stem}/index.tsx",
+    ):
+        if candidate in paths:
+            return [paths[candidate]]
+    return []
+
+
+def _csr(
+    rows: np.ndarray, values: np.ndarray, n_rows: int
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Offsets and values grouped by row, values of row i are
+    `values[offsets[i] : offsets[i + 1]]`
+    """
+    order = np.argsort(rows, kind="stable")
+    offsets = np.concatenate(
+        [[0], np.cumsum(np.bincount(rows, minlength=n_rows))]
+    ).astype(np.int64)
+    return offsets, values[order]
+
+
+class ProjectIndex:
+    """
+    Symbols with their signatures and the module dependency graph
+    of a project, kept in flat arrays
+
+    Symbols named `names[i]` are
+    `name_symbols[name_offsets[i] : name_offsets[i + 1]]`, files imported
+    by file `f` are `dependencies[dependency_offsets[f] : dependency_offsets[f + 1]]`
+    (ids from `len(files)` on are namespaces, see `_dependency_edges`).
+    Signature of symbol `s` is `signatures[signature_offsets[s] : signature_offsets[s + 1]]`.
+    """
+
+    def __init__(self, files: list[str], file_indexes: list[dict]):
+        """
+        `files` -- paths relative to the project root
+        `file_indexes` -- `index_file` of every file
+        """
+        self.files = files
+        self.file_ids = {file: i for i, file in enumerate(files)}
+
+        self.names = []
+        self.name_ids = {}
+        symbol_names = []
+        symbol_files = []
+        signatures = bytearray()
+        signature_offsets = [0]
+        for file_id, file_index in enumerate(file_indexes):
+            for name, signature in file_index["symbols"]:
+                if name not in self.name_ids:
+                    self.name_ids[name] = len(self.names)
+                    self.names.append(name)
+                symbol_names.append(self.name_ids[name])
+                symbol_files.append(file_id)
+                signatures += signature.encode("utf-8")
+                signature_offsets.append(len(signatures))
+
+        self.symbol_names = np.asarray(symbol_names, dtype=np.int32)
+        self.symbol_files = np.asarray(symbol_files, dtype=np.int32)
+        self.signatures = bytes(signatures)
+        self.signature_offsets = np.asarray(signature_offsets, dtype=np.int64)
+        self.name_offsets, self.name_symbols = _csr(
+            self.symbol_names,
+            np.arange(len(self.symbol_names), dtype=np.int32),
+            len(self.names),
+        )
+
+        sources, targets = self._dependency_edges(file_indexes)
+        self.dependency_offsets, self.dependencies = _csr(
+            sources, targets, len(files) + len(self.namespaces)
+        )
+
+    def _dependency_edges(
+        self, file_indexes: list[dict]
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Edges of the graph over files and, after them, namespaces:
+        a file points to the files and namespaces it imports,
+        a namespace points to the files declaring it
+        """
+        python_modules = _python_modules(self.files)
+        self.namespaces = {}
+        for file_index in file_indexes:
+            for namespace in file_index["namespaces"]:
+                self.namespaces.setdefault(namespace, len(self.files) + len(self.namespaces))
+
+        edges = set()
+        for source, (file, file_index) in enumerate(zip(self.files, file_indexes)):
+            extension = file.rsplit(".", 1)[-1]
+            targets = []
+            if extension == "py":
+                for module, imported in file_index["modules"]:
+                    targets += _resolve_python(file, module, imported, python_modules)
+            elif extension in ("ts", "tsx"):
+                for module, _ in file_index["modules"]:
+                    targets += _resolve_typescript(file, module, self.file_ids)
+            elif extension == "cs":
+                for namespace in file_index["namespaces"]:
+                    edges.add((self.namespaces[namespace], source))
+                    # Types of the own namespace are visible without `using`
+                    targets.append(self.namespaces[namespace])
+                for module, _ in file_index["modules"]:
+                    if module in self.namespaces:
+                        targets.append(self.namespaces[module])
+            edges.update((source, target) for target in targets if target != source)
+
+        edges = np.asarray(sorted(edges), dtype=np.int32).reshape(-1, 2)
+        return edges[:, 0], edges[:, 1]
+
+    def signature(self, symbol: int) -> str:
+        start, end = self.signature_offsets[symbol], self.signature_offsets[symbol + 1]
+        return self.signatures[start:end].decode("utf-8")
+
+    def _targets(self, node: int) -> np.ndarray:
+        start, end = self.dependency_offsets[node], self.dependency_offsets[node + 1]
+        return self.dependencies[start:end]
+
+    def imported_files(self, file: str) -> np.ndarray:
+        """
+        Files whose declarations `file` can use
+        """
+        file_id = self.file_ids.get(file)
+        if file_id is None:
+            return np.zeros(0, dtype=np.int32)
+
+        targets = self._targets(file_id)
+        is_namespace = targets >= len(self.files)
+        if not is_namespace.any():
+            return targets
+        imported = np.unique(
+            np.concatenate(
+                [targets[~is_namespace]]
+                + [self._targets(namespace) for namespace in targets[is_namespace]]
+            )
+        )
+        # A namespace also points back to the files of `file` itself
+        return imported[imported != file_id]
+
+    def related_signatures(
+        self, file: str, code: str, limit: int = CONTEXT_SIGNATURES
+    ) -> list[str]:
+        """
+        Signatures of the symbols used in `code` and declared in the files
+        imported by `file`, in the order of their first use
+        """
+        imported = self.imported_files(file)
+        if limit <= 0 or len(imported) == 0:
+            return []
+
+        related = []
+        for identifier in dict.fromkeys(IDENTIFIER.findall(code)):
+            name_id = self.name_ids.get(identifier)
+            if name_id is None:
+                continue
+            symbols = self.name_symbols[
+                self.name_offsets[name_id] : self.name_offsets[name_id + 1]
+            ]
+            symbols = symbols[np.isin(self.symbol_files[symbols], imported)]
+            if len(symbols):
+                symbol = symbols[0]
+                related.append(
+                    f"{self.files[self.symbol_files[symbol]]}\n{self.signature(symbol)}"
+                )
+                if len(related) >= limit:
+                    break
+        return related
+
+
+def build_project_index(
+    project_path: Path, files: Iterable[Path], executor: Optional[Executor] = None
+) -> ProjectIndex:
+    """
+    Index `files` of the project, in parallel when `executor` is given
+
+    `files` may be a generator, e.g. of files being extracted from an archive,
+    with an executor the first files are indexed while the rest arrive
+    """
+    listed = []
+
+    def listing():
+        for file in files:
+            listed.append(file)
+            yield file
+
+    if executor is None:
+        file_indexes = list(map(index_file, listing()))
+    else:
+        file_indexes = list(
+            executor.map(index_file, listing(), chunksize=INDEX_CHUNK_FILES)
+        )
+
+    return ProjectIndex(
+        [file.relative_to(project_path).as_posix() for file in listed], file_indexes
+    )
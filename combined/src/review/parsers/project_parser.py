@@ -1,32 +1,177 @@
-from pathlib import Path
-from typing import Union
+import os
+from collections import Counter
+from pathlib import Path, PurePosixPath
+from typing import Iterable, Optional, Union
 
-def parse_project_structure(root_path: Union[str, Path]) -> str:
+
+# Lines of the project tree at most, deeper directories are collapsed to fit
+STRUCTURE_MAX_LINES = int(os.getenv("STRUCTURE_MAX_LINES", 300))
+# Directories with more files show the counts per extension instead of the names
+STRUCTURE_DIR_FILES = 20
+# Subdirectories listed per directory, the rest are summed up in one line
+STRUCTURE_DIR_ENTRIES = 30
+# Dependencies and build output, shown but not expanded
+VENDORED_DIRECTORIES = {"node_modules", "venv", "env", "bin", "obj", "dist", "build"}
+IGNORED = {"__pycache__"}
+
+
+class _Directory:
+    __slots__ = ("name", "dirs", "files", "counts", "vendored", "depth")
+
+    def __init__(self, name: str, vendored: bool = False):
+        self.name = name
+        self.dirs = []
+        self.files = []
+        # Files per extension in the whole subtree
+        self.counts = Counter()
+        self.vendored = vendored
+        # Levels of subdirectories below
+        self.depth = 0
+
+
+def is_skipped_directory(name: str) -> bool:
+    """
+    Vendored, hidden (.git, .venv) and cache directories, their files are not reviewed
+    """
+    return name in VENDORED_DIRECTORIES or name in IGNORED or name.startswith(".")
+
+
+def _extension(name: str) -> str:
+    suffix = Path(name).suffix
+    return suffix if suffix else "other"
+
+
+def _summary(counts: Counter) -> str:
+    total = sum(counts.values())
+    if not total:
+        return "empty"
+    by_extension = ", ".join(
+        f"{count} {extension}" for extension, count in counts.most_common(5)
+    )
+    if len(counts) > 5:
+        by_extension += ", ..."
+    return f"{total} files: {by_extension}"
+
+
+def _scan(path: Path, name: str) -> _Directory:
+    directory = _Directory(name)
+    try:
+        items = sorted(os.scandir(path), key=lambda x: (not x.is_dir(), x.name))
+    except OSError:
+        return directory
+
+    for item in items:
+        if item.name in IGNORED:
+            continue
+        if item.is_dir(follow_symlinks=False):
+            # Hidden directories (.git, .idea) say nothing about the structure
+            if item.name.startswith("."):
+                continue
+            if item.name in VENDORED_DIRECTORIES:
+                directory.dirs.append(_Directory(item.name, vendored=True))
+                continue
+            child = _scan(Path(item.path), item.name)
+            directory.dirs.append(child)
+            directory.counts.update(child.counts)
+            directory.depth = max(directory.depth, child.depth + 1)
+        elif item.is_file(follow_symlinks=False):
+            directory.files.append(item.name)
+            directory.counts[_extension(item.name)] += 1
+    return directory
+
+
+def _from_paths(name: str, paths: Iterable[str]) -> _Directory:
+    """
+    Same tree as `_scan` from file paths relative to the root
+    """
+    # name -> node of a directory, None for vendored ones
+    tree = {}
+    files = {}
+    for path in paths:
+        *parts, file_name = PurePosixPath(path).parts
+        node, node_files = tree, files
+        for part in parts:
+            if part in IGNORED or part.startswith("."):
+                break
+            if part in VENDORED_DIRECTORIES:
+                node.setdefault(part, None)
+                break
+            child = node.setdefault(part, ({}, {}))
+            if child is None:
+                break
+            node, node_files = child
+        else:
+            if file_name not in IGNORED:
+                node_files[file_name] = None
+    return _build(name, tree, files)
+
+
+def _build(name: str, tree: dict, files: dict) -> _Directory:
+    directory = _Directory(name)
+    for child_name in sorted(tree):
+        if tree[child_name] is None:
+            directory.dirs.append(_Directory(child_name, vendored=True))
+            continue
+        child = _build(child_name, *tree[child_name])
+        directory.dirs.append(child)
+        directory.counts.update(child.counts)
+        directory.depth = max(directory.depth, child.depth + 1)
+    for file_name in sorted(files):
+        directory.files.append(file_name)
+        directory.counts[_extension(file_name)] += 1
+    return directory
+
+
+def _render(directory: _Directory, max_depth: int, level: int, lines: list[str]) -> None:
+    prefix = "-" * (level + 1)
+    for child in directory.dirs[:STRUCTURE_DIR_ENTRIES]:
+        if child.vendored:
+            lines.append(f"{prefix}{child.name}/ (not expanded)")
+        elif level >= max_depth and child.counts:
+            lines.append(f"{prefix}{child.name}/ ({_summary(child.counts)})")
+        else:
+            lines.append(f"{prefix}{child.name}/")
+            _render(child, max_depth, level + 1, lines)
+
+    rest = directory.dirs[STRUCTURE_DIR_ENTRIES:]
+    if rest:
+        counts = sum((child.counts for child in rest), Counter())
+        lines.append(f"{prefix}... {len(rest)} more directories ({_summary(counts)})")
+
+    if len(directory.files) <= STRUCTURE_DIR_FILES:
+        lines.extend(f"{prefix}{name}" for name in directory.files)
+    else:
+        counts = Counter(_extension(name) for name in directory.files)
+        lines.append(f"{prefix}... {_summary(counts)}")
+
+
+def parse_project_structure(
+    root_path: Union[str, Path],
+    max_lines: int = STRUCTURE_MAX_LINES,
+    files: Optional[Iterable[str]] = None,
+) -> str:
     """
     Parse project directory structure and return formatted string representation.
 
+    Long directories are collapsed to the file counts per extension, and
+    the deepest levels are collapsed until the tree fits into `max_lines`.
+
     Args:
         root_path: Path to project root directory
+        max_lines: Lines of the result at most
+        files: Paths of the project files relative to the root, e.g. the members
+            of an archive that was extracted only in part; the directory
+            is scanned when omitted
 
     Returns:
         Formatted string showing directory structure with dashes as indentation
     """
     root = Path(root_path)
-    result = [root.name]
-    ignored = ["__pycache__"]  # TODO: add
-
-    def process_directory(directory: Path, depth: int = 0):
-        items = sorted(directory.iterdir(), key=lambda x: (not x.is_dir(), x.name))
-
-        for item in items:
-            if item.name.startswith(".") or item.name in ignored:
-                continue
-
-            prefix = "-" * (depth + 1)
-            result.append(f"{prefix}{item.name}")
-
-            if item.is_dir():
-                process_directory(item, depth + 1)
+    tree = _scan(root, root.name) if files is None else _from_paths(root.name, files)
 
-    process_directory(root)
-    return "\n".join(result)
+    for max_depth in range(tree.depth, -1, -1):
+        lines = [f"{root.name}/ ({_summary(tree.counts)})"]
+        _render(tree, max_depth, 0, lines)
+        if len(lines) <= max_lines:
+            break
+    return "\n".join(lines[:max_lines])
@@ -0,0 +1,37 @@
+; Declarations reviewed as separate chunks, nested ones stay in the outer chunk
+(class_declaration
+  name: (identifier) @name) @declaration
+
+(struct_declaration
+  name: (identifier) @name) @declaration
+
+(record_declaration
+  name: (identifier) @name) @declaration
+
+(interface_declaration
+  name: (identifier) @name) @declaration
+
+(method_declaration
+  name: (identifier) @name) @declaration
+
+(local_function_statement
+  name: (identifier) @name) @declaration
+
+; Bodies replaced with a tag in the outline of the file
+(block) @body
+
+; Where an oversized declaration can be split
+(declaration_list (_) @member)
+(block (_) @statement)
+
+(using_directive) @import
+
+; Imported namespaces and namespaces declared by the file for the project index
+(using_directive (qualified_name) @module)
+(using_directive (identifier) @module)
+
+(namespace_declaration
+  name: (_) @namespace)
+
+(file_scoped_namespace_declaration
+  name: (_) @namespace)
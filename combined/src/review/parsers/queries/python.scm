@@ -0,0 +1,45 @@
+; Declarations reviewed as separate chunks, nested ones stay in the outer chunk
+(class_definition
+  name: (identifier) @name) @declaration
+
+(function_definition
+  name: (identifier) @name) @declaration
+
+(decorated_definition
+  definition: (class_definition
+    name: (identifier) @name)) @declaration
+
+(decorated_definition
+  definition: (function_definition
+    name: (identifier) @name)) @declaration
+
+; Bodies replaced with a tag in the outline of the file
+(block) @body
+
+; Where an oversized declaration can be split
+(block (_) @statement)
+
+(import_statement) @import
+(import_from_statement) @import
+(future_import_statement) @import
+
+; Imported modules, and names imported from them, for the project index
+(import_statement
+  name: (dotted_name) @module)
+
+(import_statement
+  name: (aliased_import
+    name: (dotted_name) @module))
+
+(import_from_statement
+  module_name: (_) @module
+  name: (dotted_name) @imported)
+
+(import_from_statement
+  module_name: (_) @module
+  name: (aliased_import
+    name: (dotted_name) @imported))
+
+(import_from_statement
+  module_name: (_) @module
+  (wildcard_import))
@@ -0,0 +1,41 @@
+; Declarations reviewed as separate chunks, nested ones stay in the outer chunk
+(class_declaration
+  name: (type_identifier) @name) @declaration
+
+(abstract_class_declaration
+  name: (type_identifier) @name) @declaration
+
+(function_declaration
+  name: (identifier) @name) @declaration
+
+(generator_function_declaration
+  name: (identifier) @name) @declaration
+
+(interface_declaration
+  name: (type_identifier) @name) @declaration
+
+(type_alias_declaration
+  name: (type_identifier) @name) @declaration
+
+(variable_declarator
+  name: (identifier) @name
+  value: (arrow_function)) @declaration
+
+; Bodies replaced with a tag in the outline of the file
+(statement_block) @body
+(interface_body) @body
+
+; Where an oversized declaration can be split
+(class_body (_) @member)
+(interface_body (_) @member)
+(object_type (_) @member)
+(statement_block (_) @statement)
+
+(import_statement) @import
+
+; Imported modules for the project index
+(import_statement
+  source: (string (string_fragment) @module))
+
+(export_statement
+  source: (string (string_fragment) @module))
@@ -1,4 +1,5 @@
 from pathlib import Path
+from typing import Optional
 
 from src.review.utils import (
     language_from_file_extension,
@@ -38,21 +39,115 @@ JSON должен быть корректным, то есть ключи дол
 - Не повторяй комментарии для одинаковых ошибок.
 """
 
-    def generate_user_prompt(self, chunk: Chunk, relative_path: Path) -> str:
+    def generate_user_prompt(
+        self, chunk: Chunk, relative_path: Path, related: Optional[list[str]] = None
+    ) -> str:
+        """
+        `related` -- signatures of declarations from other files used by the chunk
+        """
         code = add_line_numbers(str(chunk), chunk.get_start_line())
-        return f"{relative_path}\n{code}"
+        return f"{relative_path}\n{code}" + self._related_declarations(related)
+
+    def generate_packed_user_prompt(
+        self,
+        chunks: list[Chunk],
+        relative_path: Path,
+        related: Optional[list[str]] = None,
+    ) -> str:
+        """
+        One prompt for several chunks of the same file, lines keep
+        their numbers in the file so the answer can be split by chunk
+        """
+        codes = [
+            add_line_numbers(str(chunk), chunk.get_start_line()) for chunk in chunks
+        ]
+        return (
+            f"{relative_path}\n"
+            + "\n...\n".join(codes)
+            + self._related_declarations(related)
+        )
+
+    def _related_declarations(self, related: Optional[list[str]]) -> str:
+        # Commented out and without line numbers, so they are not reviewed
+        if not related:
+            return ""
+        lines = [
+            f"{self.comment_symbol} Для справки, не проверяй: объявления из других файлов проекта, используемые во фрагменте"
+        ]
+        for signature in related:
+            lines.extend(f"{self.comment_symbol} {line}" for line in signature.split("\n"))
+        return "\n\n" + "\n".join(lines)
+
+    @staticmethod
+    def generate_structure_system_prompt(rules: list[str]) -> str:
+        """
+        `rules` -- `project_structure` styleguide prompts of the project languages
+        """
+        rules_text = "\n".join(rule.strip() for rule in rules)
+        return f"""
+Отвечай на русском языке.
+Ты – опытный инженер-программист и профессиональный код-ревьюер.
+Твоя задача – проверить структуру проекта на соответствие правилам:
+{rules_text}
+
+Структура дана деревом, уровень вложенности обозначен дефисами, каталоги заканчиваются на /.
+Большие каталоги свернуты до количества файлов по расширениям, не считай это ошибкой.
+Ответ должен быть строго в формате JSON, где:
+- Ключ – номер строки дерева, к которой относится замечание.
+- Значение – комментарий ревьюера с кратким описанием проблемы и предложением возможного ее решения.
+JSON должен быть корректным, то есть ключи должны быть в двойных кавычках.
+Если нарушений нет, верни пустой JSON.
+"""
+
+    @staticmethod
+    def generate_structure_user_prompt(project_structure: str) -> str:
+        return add_line_numbers(project_structure, 0)
 
     def generate_context(self, code: str) -> dict[str, list[str]]:
         """
         Returns a dictionary with the following keys:
         - "user" -- list of previous user messages
         - "assistant" -- list of previous assistant messages
+        - "ids" -- ids of the review examples used for the messages
+        """
+
+        return self.generate_contexts([code])[0]
+
+    def generate_contexts(self, codes: list[str]) -> list[dict[str, list[str]]]:
+        """
+        Same as `generate_context` for many chunks with one batched retrieval
         """
 
-        examples = self.data.get_review(code, extension=self.file_extension, n_results=7)
-        # print(examples)
+        examples = self.data.get_reviews(codes, extension=self.file_extension, n_results=7)
 
-        return {
-            "user": [ex["query"] for ex in examples],
-            "assistant": [ex["answer"] for ex in examples],
-        }
+        return [
+            {
+                "user": [ex["query"] for ex in chunk_examples],
+                "assistant": [ex["answer"] for ex in chunk_examples],
+                "ids": [ex["id"] for ex in chunk_examples],
+            }
+            for chunk_examples in examples
+        ]
+
+    @staticmethod
+    def merge_contexts(
+        contexts: list[dict[str, list[str]]], n_results: int = 7
+    ) -> dict[str, list[str]]:
+        """
+        Context of a packed prompt: best examples of every chunk in turn,
+        without duplicates, at most `n_results`
+        """
+        merged = {"user": [], "assistant": [], "ids": []}
+        seen = set()
+        for rank in range(max((len(c["user"]) for c in contexts), default=0)):
+            for context in contexts:
+                if rank >= len(context["user"]) or len(merged["user"]) >= n_results:
+                    continue
+                example_id = context["ids"][rank]
+                if example_id in seen:
+                    continue
+                seen.add(example_id)
+                merged["user"].append(context["user"][rank])
+                merged["assistant"].append(context["assistant"][rank])
+                merged["ids"].append(example_id)
+        return merged
@@ -1,70 +1,140 @@
-from chromadb import Client
+from chromadb import Client, PersistentClient
 from chromadb.utils.embedding_functions import huggingface_embedding_function
 
-from typing import Dict
+from typing import Dict, Optional
 
 from pathlib import Path
-import json
+import threading
 
-from transformers import AutoModel
-import numpy as np
+from src.review.corpus import REVIEW_LANGUAGES, Corpus, load_corpus
+from src.review.embeddings import MyEmbeddingFunction
+from src.review.retrievers import Retriever, make_retriever
 
-from chromadb import Documents, EmbeddingFunction, Embeddings
-class MyEmbeddingFunction(EmbeddingFunction):
-    def __init__(self):
-        self.model = AutoModel.from_pretrained('jinaai/jina-embeddings-v2-base-code', trust_remote_code=True)
 
+class Data:
+    def __init__(
+        self,
+        path_to_data: Path,
+        index_path: Optional[Path] = None,
+        retriever: str = "exact",
+    ):
+        """
+        `retriever` -- search implementation, one of `RETRIEVERS`
+        `index_path` -- directory of a persistent Chroma index, used only by
+        the "chroma" retriever. The index is built once from the precomputed
+        embeddings of the corpus (see `load_corpus`) and rebuilt only when
+        the corpus changes. Without it an in-memory index is built on every start.
+        """
+        self.client = None
+        if retriever == "chroma":
+            if index_path is not None:
+                index_path.mkdir(parents=True, exist_ok=True)
+                self.client = PersistentClient(path=str(index_path))
+            else:
+                self.client = Client()
 
-    def __call__(self, input: Documents) -> Embeddings:
-        # embed the documents somehow
+        self.retrievers: Dict[str, Retriever] = dict()
+        self.corpora: Dict[str, Corpus] = dict()
+        self.path_to_data = path_to_data
+        self.embedding_fn = MyEmbeddingFunction()
 
-        embeddings = np.array(self.model.encode(input))
-        return embeddings
+        for language in sorted(set(REVIEW_LANGUAGES.values())):
+            corpus = load_corpus(self.path_to_data, language)
+            self.corpora[language] = corpus
+            self.retrievers[language] = make_retriever(
+                retriever, corpus, language, self.client
+            )
 
+    def get_reviews(
+        self, codes: list[str], extension: str, n_results: int = 3
+    ) -> list[list[dict]]:
+        """
+        Top `n_results` examples for every code chunk
 
-class Data:
-    def __init__(self, path_to_data: Path):
-        self.client = Client()
+        All chunks are embedded in batches of `embedding_fn.batch_size`
+        and searched with a single query.
+        """
+        if not codes:
+            return []
 
-        self.reviews = dict()
-        self.path_to_data = path_to_data
-        self.embedding_fn = MyEmbeddingFunction()
+        language = REVIEW_LANGUAGES[extension]
+        corpus = self.corpora[language]
 
-        self._init_review_collections()
-
-    def _init_review_collections(self) -> None:
-        for ext in ["py", "ts", "tsx", "cs"]:
-            try:
-                # Try to get existing collection first
-                self.reviews[ext] = self.client.get_collection(
-                    name=f"{ext}_reviews",
-                    embedding_function=self.embedding_fn
-                )
-            except Exception:  # Collection doesn't exist
-                # Create new collection only if it doesn't exist
-                self.reviews[ext] = self.client.create_collection(
-                    name=f"{ext}_reviews",
-                    embedding_function=self.embedding_fn
-                )
-            self._load_reviews(ext, self.client)
-
-    def _load_reviews(self, ext: str, client) -> None:
-        # Only load reviews if collection is empty
-        if len(self.reviews[ext].get()['ids']) == 0:
-            reviews_path = self.path_to_data / f"{ext}_reviews.json"
-            if reviews_path.exists():
-                with open(reviews_path, "r") as f:
-                    reviews = json.load(f)
-                    if reviews:  # Only add if there are reviews to add
-                        self.reviews[ext].add(
-                            documents=[r["query"] + "\n" + r["answer"] for r in reviews],
-                            metadatas=[{"type": "review"} for _ in reviews],
-                            ids=[str(i) for i in range(len(reviews))]
-                        )
+        query_embeddings = self.embedding_fn(codes)
+        indices = self.retrievers[language].search(query_embeddings, n_results)
+        return [[corpus.example(i) for i in chunk_indices] for chunk_indices in indices]
 
     def get_review(self, code: str, extension: str, n_results: int = 3) -> list:
-        if extension == "tsx":
-            extension = "ts"
-        review_collection = self.reviews[extension]
+        return self.get_reviews([code], extension, n_results)[0]
+
+
+class LazyData:
+    """
+    `Data` built on first use, or in the background after `warm_up`
+
+    Attribute access is forwarded to the built `Data` and blocks until
+    it is ready, so tools that never retrieve examples don't pay for it.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._args = args
+        self._kwargs = kwargs
+        self._data: Optional[Data] = None
+        self._error: Optional[Exception] = None
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def get(self) -> Data:
+        if self._data is not None:
+            return self._data
+
+        with self._lock:
+            if self._data is None:
+                try:
+                    self._data = Data(*self._args, **self._kwargs)
+                    self._error = None
+                except Exception as e:
+                    self._error = e
+                    raise
+                self._ready.set()
+        return self._data
+
+    def _warm_up(self) -> None:
+        try:
+            self.get()
+        except Exception:
+            # Kept in `self._error`, the next `get` retries
+            pass
+
+    def warm_up(self) -> None:
+        """
+        Start building `Data` in a background thread
+        """
+        with self._lock:
+            if self._data is not None or (
+                self._thread is not None and self._thread.is_alive()
+            ):
+                return
+            self._thread = threading.Thread(
+                target=self._warm_up, name="data-warm-up", daemon=True
+            )
+            self._thread.start()
+
+    def is_ready(self) -> bool:
+        return self._ready.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._ready.wait(timeout)
+
+    def status(self) -> str:
+        if self.is_ready():
+            return "ready"
+        if self._error is not None:
+            return "failed"
+        if self._thread is not None and self._thread.is_alive():
+            return "loading"
+        return "idle"
 
-        return review_collection.query(query_texts=[code], n_results=n_results)['metadatas'][0]
+    def __getattr__(self, name: str):
+        return getattr(self.get(), name)
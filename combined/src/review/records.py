@@ -0,0 +1,47 @@
+import re
+from dataclasses import dataclass
+from typing import Optional
+
+
+# `file` of the project structure findings, in `FileReview` and `ReviewRecord`
+STRUCTURE_FILE = "."
+
+
+@dataclass(frozen=True, slots=True)
+class ReviewRecord:
+    """
+    One review comment with the code around the commented line
+    """
+
+    file: str
+    # 1-based commented line
+    line: int
+    # First and last line of `snippet`, 1-based and inclusive
+    span: tuple[int, int]
+    comment: str
+    snippet: str
+
+    @property
+    def suggested_code(self) -> Optional[str]:
+        # Suggested code is quoted with backticks in the comment
+        code_match = re.search(r"`(.*?)`", self.comment)
+        return code_match.group(1) if code_match else None
+
+    def to_dict(self) -> dict:
+        return {
+            "file": self.file,
+            "line": self.line,
+            "span": list(self.span),
+            "comment": self.comment,
+            "snippet": self.snippet,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ReviewRecord":
+        return cls(
+            file=data["file"],
+            line=data["line"],
+            span=tuple(data["span"]),
+            comment=data["comment"],
+            snippet=data["snippet"],
+        )
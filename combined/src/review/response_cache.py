@@ -0,0 +1,86 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import Optional
+
+from src.review.cache import DiskCache
+from src.review.embeddings import normalize_chunk
+from src.review.utils import shift_line_numbers
+
+
+# Model responses are cached by chunk content, empty path disables the cache
+RESPONSE_CACHE_PATH = os.getenv(
+    "RESPONSE_CACHE_PATH",
+    str(Path(tempfile.gettempdir()) / "telegram-review-bot" / "responses.sqlite3"),
+)
+RESPONSE_CACHE_TTL_HOURS = float(os.getenv("RESPONSE_CACHE_TTL_HOURS", 24 * 7))
+RESPONSE_CACHE_MB = int(os.getenv("RESPONSE_CACHE_MB", 256))
+# Set to skip cached responses, fresh responses are still stored
+RESPONSE_CACHE_BYPASS = os.getenv("RESPONSE_CACHE_BYPASS", "false").lower() == "true"
+
+
+class ResponseCache:
+    """
+    Parsed model responses keyed by everything that shapes them:
+    chunk text, file extension, system prompt, retrieved examples,
+    model and temperature
+
+    Line numbers are stored relative to the chunk start, so a response
+    is reused when the chunk moves inside the file.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        ttl_hours: float = RESPONSE_CACHE_TTL_HOURS,
+        max_bytes: int = RESPONSE_CACHE_MB * 1024 * 1024,
+    ):
+        self.disk = DiskCache(path, max_bytes, ttl=ttl_hours * 3600)
+
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(
+        chunk: str,
+        extension: str,
+        system_prompt: str,
+        example_ids: list[str],
+        model: str,
+        temperature: float,
+    ) -> str:
+        system_prompt_hash = hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()
+        parts = [
+            normalize_chunk(chunk),
+            extension,
+            system_prompt_hash,
+            "\n".join(example_ids),
+            model,
+            repr(temperature),
+        ]
+        return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+    def get(self, key: str, start_line: int) -> Optional[dict]:
+        value = self.disk.get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return shift_line_numbers(json.loads(value), start_line)
+
+    def put(self, key: str, review: dict, start_line: int) -> None:
+        relative = shift_line_numbers(review, -start_line)
+        self.disk.put(key, json.dumps(relative, ensure_ascii=False).encode("utf-8"))
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "items": len(self.disk)}
+
+
+RESPONSE_CACHE = (
+    ResponseCache(Path(RESPONSE_CACHE_PATH)) if RESPONSE_CACHE_PATH else None
+)
@@ -0,0 +1,272 @@
+import time
+from abc import ABC, abstractmethod
+from argparse import ArgumentParser
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from src.review.corpus import REVIEW_LANGUAGES, Corpus, load_corpus
+
+
+RETRIEVERS = ["exact", "ivf", "chroma"]
+
+# Chroma rejects larger `add` calls
+ADD_BATCH_SIZE = 1000
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.clip(norms, 1e-12, None)
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Indices of the `k` highest scores of every row, best first
+    """
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.zeros((scores.shape[0], 0), dtype=np.int64)
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+    return np.take_along_axis(top, order, axis=1)
+
+
+class Retriever(ABC):
+    """
+    Cosine similarity search over the embeddings of one corpus
+    """
+
+    @abstractmethod
+    def search(self, query_embeddings: np.ndarray, k: int) -> list[list[int]]:
+        """
+        Indices of the `k` nearest corpus examples for every query
+        """
+
+
+class ExactRetriever(Retriever):
+    """
+    Brute force search with one matrix multiply for the whole batch
+
+    The corpus matrix is used as is (it can stay memory-mapped),
+    scores are divided by the precomputed norms instead.
+    """
+
+    def __init__(self, embeddings: np.ndarray):
+        self.embeddings = embeddings
+        self.inv_norms = 1 / np.clip(
+            np.linalg.norm(np.asarray(embeddings, dtype=np.float32), axis=1),
+            1e-12,
+            None,
+        )
+
+    def search(self, query_embeddings: np.ndarray, k: int) -> list[list[int]]:
+        if len(self.inv_norms) == 0:
+            return [[] for _ in range(len(query_embeddings))]
+
+        queries = _normalize(query_embeddings)
+        scores = (queries @ np.asarray(self.embeddings, dtype=np.float32).T) * self.inv_norms
+        return _top_k(scores, k).tolist()
+
+
+class IVFRetriever(Retriever):
+    """
+    Inverted file index: examples are clustered with spherical k-means and
+    only the `n_probe` clusters closest to a query are searched exactly
+    """
+
+    def __init__(
+        self,
+        embeddings: np.ndarray,
+        n_lists: Optional[int] = None,
+        n_probe: int = 8,
+        n_iter: int = 10,
+        seed: int = 0,
+    ):
+        vectors = _normalize(embeddings)
+        n_lists = n_lists or max(1, int(np.sqrt(len(vectors))))
+        n_lists = max(1, min(n_lists, len(vectors)))
+
+        self.vectors = vectors
+        self.n_probe = n_probe
+        self.centroids, assignment = self._kmeans(vectors, n_lists, n_iter, seed)
+
+        # Inverted lists in CSR layout: examples of list i are
+        # `list_items[list_offsets[i] : list_offsets[i + 1]]`
+        self.list_items = np.argsort(assignment, kind="stable")
+        self.list_offsets = np.concatenate(
+            [[0], np.cumsum(np.bincount(assignment, minlength=len(self.centroids)))]
+        )
+
+    @staticmethod
+    def _kmeans(
+        vectors: np.ndarray, n_lists: int, n_iter: int, seed: int
+    ) -> tuple[np.ndarray, np.ndarray]:
+        if len(vectors) == 0:
+            return np.zeros((0, vectors.shape[1]), dtype=np.float32), np.zeros(
+                0, dtype=np.int64
+            )
+
+        rng = np.random.default_rng(seed)
+        centroids = vectors[rng.choice(len(vectors), n_lists, replace=False)]
+        for _ in range(n_iter):
+            assignment = np.argmax(vectors @ centroids.T, axis=1)
+            for i in range(n_lists):
+                members = vectors[assignment == i]
+                if len(members):
+                    centroids[i] = members.sum(axis=0)
+            centroids = _normalize(centroids)
+        return centroids, np.argmax(vectors @ centroids.T, axis=1)
+
+    def search(self, query_embeddings: np.ndarray, k: int) -> list[list[int]]:
+        queries = _normalize(query_embeddings)
+        if len(self.vectors) == 0:
+            return [[] for _ in range(len(queries))]
+
+        probes = _top_k(queries @ self.centroids.T, self.n_probe)
+        results = []
+        for query, lists in zip(queries, probes):
+            candidates = np.concatenate(
+                [
+                    self.list_items[self.list_offsets[i] : self.list_offsets[i + 1]]
+                    for i in lists
+                ]
+            )
+            scores = self.vectors[candidates] @ query
+            top = _top_k(scores[None, :], k)[0]
+            results.append(candidates[top].tolist())
+        return results
+
+
+class ChromaRetriever(Retriever):
+    """
+    Search in a Chroma collection, kept for comparison with the
+    persistent index built by previous versions
+    """
+
+    def __init__(self, client, name: str, corpus: Corpus):
+        self.corpus = corpus
+
+        try:
+            # Try to get existing collection first
+            collection = client.get_collection(name=name)
+            metadata = collection.metadata or {}
+            if (
+                metadata.get("corpus_hash") != corpus.version
+                or metadata.get("hnsw:space") != "cosine"
+            ):
+                # Corpus has changed since the index was built
+                client.delete_collection(name=name)
+                collection = None
+        except Exception:  # Collection doesn't exist
+            collection = None
+
+        if collection is None:
+            collection = client.create_collection(
+                name=name,
+                metadata={"corpus_hash": corpus.version, "hnsw:space": "cosine"},
+            )
+            self._load_reviews(collection, corpus)
+
+        self.collection = collection
+
+    @staticmethod
+    def _load_reviews(collection, corpus: Corpus) -> None:
+        # Reuse shipped embeddings instead of running the model over the corpus
+        for start in range(0, len(corpus), ADD_BATCH_SIZE):
+            end = min(start + ADD_BATCH_SIZE, len(corpus))
+            collection.add(
+                ids=corpus.ids[start:end],
+                embeddings=np.asarray(corpus.embeddings[start:end], dtype=np.float32),
+                metadatas=[{"type": "review"} for _ in range(start, end)],
+            )
+
+    def search(self, query_embeddings: np.ndarray, k: int) -> list[list[int]]:
+        if len(self.corpus) == 0:
+            return [[] for _ in range(len(query_embeddings))]
+
+        ids = self.collection.query(
+            query_embeddings=np.asarray(query_embeddings, dtype=np.float32),
+            n_results=min(k, len(self.corpus)),
+        )["ids"]
+        return [[self.corpus.index(id_) for id_ in chunk_ids] for chunk_ids in ids]
+
+
+def make_retriever(
+    name: str, corpus: Corpus, language: str, chroma_client=None
+) -> Retriever:
+    if name == "exact":
+        return ExactRetriever(corpus.embeddings)
+    if name == "ivf":
+        return IVFRetriever(corpus.embeddings)
+    if name == "chroma":
+        return ChromaRetriever(chroma_client, f"{language}_reviews", corpus)
+    raise ValueError(f"Unknown retriever {name}, expected one of {RETRIEVERS}")
+
+
+def benchmark(
+    path_to_data: Path, k: int = 7, n_queries: int = 256, seed: int = 0
+) -> list[dict]:
+    """
+    Latency and recall@k against exact search for every retriever
+
+    Queries are corpus embeddings with gaussian noise.
+    """
+    from chromadb import Client
+
+    rng = np.random.default_rng(seed)
+    chroma_client = Client()
+    results = []
+
+    for language in sorted(set(REVIEW_LANGUAGES.values())):
+        corpus = load_corpus(path_to_data, language)
+        if len(corpus) == 0:
+            continue
+
+        embeddings = np.asarray(corpus.embeddings, dtype=np.float32)
+        queries = embeddings[rng.integers(0, len(corpus), n_queries)]
+        queries = queries + rng.normal(0, queries.std(), queries.shape).astype(np.float32)
+
+        expected = None
+        for name in RETRIEVERS:
+            start = time.perf_counter()
+            retriever = make_retriever(name, corpus, language, chroma_client)
+            build_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            found = retriever.search(queries, k)
+            search_time = time.perf_counter() - start
+
+            if expected is None:
+                expected = found
+            recall = np.mean(
+                [len(set(a) & set(b)) / len(b) for a, b in zip(found, expected)]
+            )
+            results.append(
+                {
+                    "language": language,
+                    "retriever": name,
+                    "examples": len(corpus),
+                    "build_ms": round(build_time * 1000, 2),
+                    "query_ms": round(search_time * 1000 / n_queries, 4),
+                    "recall": round(float(recall), 4),
+                }
+            )
+
+    return results
+
+
+def main(args: Optional[list[str]] = None) -> None:
+    parser = ArgumentParser(description="Benchmark review example retrievers")
+    parser.add_argument("-d", "--data", type=str, help="Path to data directory", required=True)
+    parser.add_argument("-k", type=int, default=7)
+    parser.add_argument("--queries", type=int, default=256)
+    parsed = parser.parse_args(args)
+
+    for result in benchmark(Path(parsed.data).resolve(), parsed.k, parsed.queries):
+        print(result)
+
+
+if __name__ == "__main__":
+    main()
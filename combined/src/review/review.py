@@ -1,24 +1,55 @@
+import hashlib
 import json
+import multiprocessing
+import os
 import re
 import threading
 import time
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator, Optional
 from tqdm import tqdm
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+from concurrent.futures.process import BrokenProcessPool
 
 from pathlib import Path
+from src.review.embeddings import normalize_chunk
 from src.review.utils import (
     get_file_extension,
     merge_json_responses,
+    shift_line_numbers,
     get_styleguide_by_language,
     language_from_file_extension,
 )
 from src.review.prompt import PromptGenerator
+from src.review.records import STRUCTURE_FILE, ReviewRecord
 from src.review.parsers.parser import parse_file
 from src.review.parsers.project_parser import parse_project_structure
-from src.review.rag import Data
+from src.review.parsers.project_index import (
+    CONTEXT_SIGNATURES,
+    ProjectIndex,
+    build_project_index,
+)
+from src.review.rag import LazyData
+
+from src.review.engine import ENGINE
+from src.review.packer import (
+    chunk_line_range,
+    drop_context_comments,
+    pack_chunks,
+    split_review,
+)
 
-from src.review.api import get_response
-# from src.review.gemma_api import get_response
+from src.review.response_cache import RESPONSE_CACHE, RESPONSE_CACHE_BYPASS
+
+from src.review.api import CLIENT, ENDPOINT, MODEL, TEMPERATURE, get_response
+# from src.review.gemma_api import CLIENT, ENDPOINT, MODEL, TEMPERATURE, get_response
 
 
 FILE_EXTENSIONS = ["py", "cs", "ts", "tsx", "css", "scss"]
@@ -26,13 +57,157 @@ FILE_EXTENSIONS = ["py", "cs", "ts", "tsx", "css", "scss"]
 
 DATA_PATH = Path(__file__).parent.parent.parent.parent / "data"
 
-DATA = Data(DATA_PATH)
+# exact, ivf or chroma, see `src.review.retrievers`
+RETRIEVER = os.getenv("RETRIEVER", "exact")
+
+# Persistent vector index of the chroma retriever, built once from the shipped embeddings
+INDEX_PATH = Path(os.getenv("REVIEW_INDEX_PATH", DATA_PATH / "index"))
+
+# Built on first retrieval, call `DATA.warm_up()` to load it in the background
+DATA = LazyData(DATA_PATH, INDEX_PATH, retriever=RETRIEVER)
+
+# Files parsed and retrieved together before their reviews start
+RETRIEVAL_BATCH_FILES = int(os.getenv("RETRIEVAL_BATCH_FILES", 32))
+
+# Processes parsing and chunking project files, 0 parses in the reviewing process
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", os.cpu_count() or 1))
+# Files of a project reviewed at the same time, model requests
+# are limited separately by `LLM_CONCURRENCY`
+REVIEW_WORKERS = int(os.getenv("REVIEW_WORKERS", 4))
+# Files between the start of their parsing and the end of their review,
+# parsing waits when reviews fall behind
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", 2 * RETRIEVAL_BATCH_FILES))
+
+# Parse process pools by size, shared by all reviews
+_parse_pools: dict[int, ProcessPoolExecutor] = {}
+_parse_pools_lock = threading.Lock()
+
+
+def parse_pool(workers: int) -> ProcessPoolExecutor:
+    with _parse_pools_lock:
+        if workers not in _parse_pools:
+            # Forking the bot with its running threads is unsafe
+            _parse_pools[workers] = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _parse_pools[workers]
+
+
+def discard_parse_pool(workers: int) -> None:
+    """
+    Drop a pool after a worker died, the next parse starts a new one
+    """
+    with _parse_pools_lock:
+        pool = _parse_pools.pop(workers, None)
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def parse_review_json(response: str) -> Optional[dict]:
+    """
+    JSON object of a model response, None when there is none
+    """
+    try:
+        review = json.loads(response[response.index("{") : response.rindex("}") + 1])
+    except (ValueError, json.JSONDecodeError):
+        return None
+    return review if isinstance(review, dict) else None
+
+
+def comment_line_index(line_num: str, lines_count: int) -> int:
+    """
+    0-based line of a review comment keyed by the model as "<line>..."
+    """
+    match = re.match(r"^\d+", line_num)
+    line_idx = int(match.group() if match else "1") - 1
+    return max(0, min(line_idx, lines_count - 1))
+
+
+def review_records(
+    review_comments: dict, lines: list[str], file: str
+) -> list[ReviewRecord]:
+    """
+    Records of the review comments keyed by line, `lines` are the reviewed lines
+    """
+    records = []
+    for line_num, comment in review_comments.items():
+        line_idx = comment_line_index(line_num, len(lines))
+        start, end = max(0, line_idx - 3), min(len(lines), line_idx + 2)
+        records.append(
+            ReviewRecord(
+                file=file,
+                line=line_idx + 1,
+                span=(start + 1, max(start + 1, end)),
+                comment=comment.strip(),
+                snippet="".join(lines[start:end]),
+            )
+        )
+    return records
+
+
+def write_annotated(
+    path: Path, lines: list[str], records: list[ReviewRecord], comment_sign: str
+) -> None:
+    """
+    Export a copy of the reviewed file with every comment
+    in a `<REVIEW>` tag above its line
+    """
+    lines = list(lines)
+    for record in records:
+        if not lines:
+            break
+        line_idx = record.line - 1
+        lines[line_idx] = (
+            f"{comment_sign} <REVIEW>{record.comment}</REVIEW>\n{lines[line_idx]}"
+        )
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        f.writelines(lines)
+
+
+def declaration_hash(chunk) -> str:
+    return hashlib.sha256(normalize_chunk(str(chunk)).encode("utf-8")).hexdigest()
+
+
+@dataclass
+class FileReview:
+    """
+    Review records of one finished file and the progress of the project
+    """
+
+    file: Path
+    items: list[ReviewRecord]
+    done: int
+    total: int
 
 
 class FileReviewer:
-    def __init__(self, file_path: Path, result_path: Path) -> None:
+    def __init__(
+        self,
+        file_path: Path,
+        result_path: Optional[Path] = None,
+        report_path: Optional[Path] = None,
+        use_cache: bool = not RESPONSE_CACHE_BYPASS,
+        previous: Optional[dict] = None,
+        index: Optional[ProjectIndex] = None,
+    ) -> None:
+        """
+        `result_path` -- where to export the file annotated with the review,
+        nothing is written when omitted
+        `report_path` -- file path shown in review records, file name by default
+        `use_cache` -- reuse cached model responses for unchanged chunks
+        `previous` -- `manifest` of the file from the last review, declarations
+        with the same hash keep their findings and are not reviewed again
+        `index` -- index of the project, signatures of the declarations
+        a chunk uses from other files are added to its prompt
+        """
         self.file_path = file_path
+        self.index = index
+        self.use_cache = use_cache
+        self.previous = previous or {}
         self.result_path = result_path
+        self.report_path = report_path or Path(file_path.name)
 
         try:
             # Find the 'src' part in the path and get everything after it
@@ -41,10 +216,7 @@ class FileReviewer:
         except ValueError:
             self.relative_path = file_path
 
-        self.result_path.parent.mkdir(parents=True, exist_ok=True)
-        self.result_path.touch(exist_ok=True)
-
-        self.extension = file_path.name.split(".")[-1]
+        self.extension = file_path.name.split(".")[-1].lower()
         self.comment_sign = "#" if self.extension == "py" else "//"
         self.styleguide_prompts = get_styleguide_by_language(
             language_from_file_extension(self.extension)
@@ -52,103 +224,508 @@ class FileReviewer:
 
         self.prompt_generator = PromptGenerator(DATA, self.extension)
 
+        self.base_chunks = None
+        self.declarations = None
+        # Declarations changed since the previous review
+        self.to_review = None
+        # Declarations unchanged since the previous review with their manifest entry
+        self.carried_over = None
+        # Hash and findings (relative to the declaration start) of every reviewed declaration
+        self.manifest = {}
+
     def _review_interface(self, base_chunks: str) -> str:
         # TODO: add prompt
         pass
 
-    def _save_result(self, review_comments: dict) -> None:
-        with open(self.file_path, "r") as original:
-            lines = original.readlines()
+    def parse(self, parsed: Optional[tuple] = None) -> dict:
+        """
+        `parsed` -- result of `parse_file` for the file computed elsewhere,
+        e.g. in a parse worker process
+        """
+        if parsed is None:
+            parsed = parse_file(self.file_path)
+        self.base_chunks, self.declarations = parsed
 
-        for line_num, comment in review_comments.items():
-            match = re.match(r"^\d+", line_num)
-            line_idx = int(match.group() if match else "1") - 1
-            line_idx = min(line_idx, len(lines) - 1)
-            lines[line_idx] = (
-                f"{self.comment_sign} <REVIEW>{comment}</REVIEW>\n{lines[line_idx]}"
-            )
+        self.to_review = {}
+        self.carried_over = {}
+        for identifier, chunk in self.declarations.items():
+            entry = self.previous.get(identifier)
+            if entry is not None and entry["hash"] == declaration_hash(chunk):
+                self.carried_over[identifier] = entry
+            else:
+                self.to_review[identifier] = chunk
 
-        with open(self.result_path, "w") as f:
-            f.writelines(lines)
+        return self.declarations
 
-    def review(self) -> None:
+    def review(self, contexts: Optional[list[dict]] = None) -> list[ReviewRecord]:
+        """
+        `contexts` -- precomputed contexts for every declaration in `to_review`,
+        retrieved for the whole file in one batch when omitted
+
+        Returns review records of the file
+        """
         print(f"Reviewing {self.file_path}")
         print()
 
-        base_chunks, declarations = parse_file(self.file_path)
-        json_responses = []
+        if self.declarations is None:
+            self.parse()
+        identifiers = list(self.to_review)
+        chunks = list(self.to_review.values())
+
+        if contexts is None:
+            contexts = self.prompt_generator.generate_contexts(
+                [str(chunk) for chunk in chunks]
+            )
+        system_prompt = self.prompt_generator.generate_system_prompt()
+        related = [
+            self.index.related_signatures(self.report_path.as_posix(), str(chunk))
+            if self.index is not None
+            else []
+            for chunk in chunks
+        ]
+        user_prompts = [
+            self.prompt_generator.generate_user_prompt(
+                chunk, self.relative_path, chunk_related
+            )
+            for chunk, chunk_related in zip(chunks, related)
+        ]
+
+        # Unchanged chunks reuse the stored response instead of calling the model
+        json_responses = [None] * len(chunks)
+        cache_keys = [None] * len(chunks)
+        if RESPONSE_CACHE is not None:
+            for i, (chunk, context) in enumerate(zip(chunks, contexts)):
+                # Signatures from other files change the answer as well
+                cache_keys[i] = RESPONSE_CACHE.key(
+                    "\n".join([str(chunk), *related[i]]),
+                    self.extension,
+                    system_prompt,
+                    context.get("ids", []),
+                    MODEL,
+                    TEMPERATURE,
+                )
+                if self.use_cache:
+                    json_responses[i] = RESPONSE_CACHE.get(
+                        cache_keys[i], chunk.get_start_line()
+                    )
+        missing = [i for i, response in enumerate(json_responses) if response is None]
 
-        for chunk in declarations.values():
-            system_prompt = self.prompt_generator.generate_system_prompt()
-            user_prompt = self.prompt_generator.generate_user_prompt(
-                chunk, self.relative_path
+        # Small declarations share one request up to the token budget
+        packs = pack_chunks(chunks, missing)
+        pack_prompts = [
+            user_prompts[pack[0]]
+            if len(pack) == 1
+            else self.prompt_generator.generate_packed_user_prompt(
+                [chunks[i] for i in pack],
+                self.relative_path,
+                list(dict.fromkeys(s for i in pack for s in related[i]))[
+                    :CONTEXT_SIGNATURES
+                ],
             )
-            context = self.prompt_generator.generate_context(str(chunk))
+            for pack in packs
+        ]
+        pack_contexts = [
+            contexts[pack[0]]
+            if len(pack) == 1
+            else PromptGenerator.merge_contexts([contexts[i] for i in pack])
+            for pack in packs
+        ]
 
-            review_json = get_response(system_prompt, user_prompt, context)
-            review_json = review_json[
-                review_json.index("{") : review_json.rindex("}") + 1
-            ]
+        # Packs are reviewed concurrently, responses keep their order
+        futures = ENGINE.map(
+            ENDPOINT,
+            get_response,
+            [system_prompt] * len(packs),
+            pack_prompts,
+            pack_contexts,
+        )
+
+        for pack, future in zip(packs, futures):
+            try:
+                review_json = future.result()
+            except Exception as e:
+                # Retries are exhausted, keep the reviews of the other chunks
+                print(f"Error reviewing chunk of {self.file_path}: {str(e)}")
+                continue
 
             print(review_json)
             print()
 
-            try:
-                json_responses.append(json.loads(review_json))
-            except json.JSONDecodeError:
+            review = parse_review_json(review_json)
+            if review is None:
                 print(
                     "!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!JSONDecodeError!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!"
                 )
+                continue
+
+            pack_reviews = split_review(
+                review, [chunk_line_range(chunks[i]) for i in pack]
+            )
+            for i, chunk_review in zip(pack, pack_reviews):
+                json_responses[i] = chunk_review
+                if cache_keys[i] is not None:
+                    RESPONSE_CACHE.put(
+                        cache_keys[i], chunk_review, chunks[i].get_start_line()
+                    )
+
+        # Windows of a split declaration repeat lines already reviewed
+        json_responses = [
+            None if response is None else drop_context_comments(response, chunk)
+            for chunk, response in zip(chunks, json_responses)
+        ]
+
+        self.manifest = {}
+        for identifier, chunk, response in zip(identifiers, chunks, json_responses):
+            if response is not None:
+                self.manifest[identifier] = {
+                    "hash": declaration_hash(chunk),
+                    "findings": shift_line_numbers(response, -chunk.get_start_line()),
+                }
+
+        # Findings of unchanged declarations move with the declaration
+        for identifier, entry in self.carried_over.items():
+            self.manifest[identifier] = entry
+            json_responses.append(
+                shift_line_numbers(
+                    entry["findings"], self.declarations[identifier].get_start_line()
+                )
+            )
+
+        json_responses = [response for response in json_responses if response is not None]
+        review_comments = merge_json_responses(json_responses)
+        with open(self.file_path, "r") as original:
+            lines = original.readlines()
 
-        self._save_result(merge_json_responses(json_responses))
-        # print(f"Saved result to {self.result_path}")
+        records = review_records(review_comments, lines, str(self.report_path))
+        if self.result_path is not None:
+            write_annotated(self.result_path, lines, records, self.comment_sign)
+        return records
 
 
 class ProjectReviewer:
     def __init__(
-        self, project_path: Path, result_path: Path, max_workers: int = 1
+        self,
+        project_path: Path,
+        result_path: Optional[Path] = None,
+        max_workers: int = REVIEW_WORKERS,
+        use_cache: bool = not RESPONSE_CACHE_BYPASS,
+        previous_manifest: Optional[dict] = None,
+        parse_workers: int = PARSE_WORKERS,
+        queue_size: int = PIPELINE_QUEUE_SIZE,
+        files: Optional[Iterable[Path]] = None,
+        project_files: Optional[list[str]] = None,
     ) -> None:
+        """
+        `result_path` -- directory to export the annotated files to, see `FileReviewer`
+        `max_workers` -- files reviewed at the same time
+        `previous_manifest` -- `manifest` of the last review of the project,
+        only declarations changed since then are reviewed
+        `parse_workers` -- processes parsing files, 0 parses in this process
+        `queue_size` -- files parsed ahead of their reviews at most
+        `files` -- files to review, all files with `FILE_EXTENSIONS` in the project
+        by default; may be a generator, e.g. of files being extracted from an archive
+        `project_files` -- paths of all project files relative to `project_path`
+        for the structure review, e.g. the members of an archive extracted
+        only in part; the project directory is scanned by default
+        """
         self.project_path = project_path
+        self.use_cache = use_cache
+        self.previous_manifest = (previous_manifest or {}).get("files", {})
+        # Declaration hashes and findings of every reviewed file, see `FileReviewer.manifest`
+        self.manifest = {"files": {}}
         self.result_path = result_path
-        self.result_path.mkdir(parents=True, exist_ok=True)
         self.max_workers = max_workers
+        self.parse_workers = parse_workers
+        self.queue_size = max(1, queue_size)
+        self.files = files
+        self.project_files = project_files
         self.print_lock = threading.Lock()
+        # Symbols and imports of the project, built before the reviews start
+        self.index: Optional[ProjectIndex] = None
 
-    def _review_structure(self) -> None:
-        project_structure = parse_project_structure(self.project_path)
-        # TODO: review project structure
-        pass
+    def _structure_rules(self, files: list[Path]) -> list[str]:
+        """
+        `project_structure` styleguide prompts of the languages of `files`
+        """
+        rules = []
+        for extension in sorted({get_file_extension(file) for file in files}):
+            rule = get_styleguide_by_language(
+                language_from_file_extension(extension)
+            ).get("project_structure")
+            if rule and rule not in rules:
+                rules.append(rule)
+        return rules
+
+    def _review_structure(self, rules: list[str]) -> list[ReviewRecord]:
+        """
+        Review the project tree against `rules` in one model request,
+        the tree is compressed to at most `STRUCTURE_MAX_LINES` lines
+        """
+        project_structure = parse_project_structure(
+            self.project_path, files=self.project_files
+        )
+        system_prompt = PromptGenerator.generate_structure_system_prompt(rules)
+
+        review = None
+        cache_key = None
+        if RESPONSE_CACHE is not None:
+            cache_key = RESPONSE_CACHE.key(
+                project_structure, "structure", system_prompt, [], MODEL, TEMPERATURE
+            )
+            if self.use_cache:
+                review = RESPONSE_CACHE.get(cache_key, 0)
 
-    def _review_file(self, file: Path) -> None:
+        if review is None:
+            review_json = get_response(
+                system_prompt,
+                PromptGenerator.generate_structure_user_prompt(project_structure),
+                {"user": [], "assistant": [], "ids": []},
+            )
+            review = parse_review_json(review_json)
+            if review is None:
+                print(f"Invalid structure review of {self.project_path}: {review_json}")
+                return []
+            if cache_key is not None:
+                RESPONSE_CACHE.put(cache_key, review, 0)
+
+        lines = [f"{line}\n" for line in project_structure.split("\n")]
+        return review_records(review, lines, STRUCTURE_FILE)
+
+    def _submit_parse(self, file: Path) -> Future:
+        if self.parse_workers > 0:
+            return parse_pool(self.parse_workers).submit(parse_file, file)
+
+        future = Future()
+        try:
+            future.set_result(parse_file(file))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def _parsed(self, file: Path, future: Future) -> Optional[FileReviewer]:
         try:
             relative_path = file.relative_to(self.project_path)
-            file_reviewer = FileReviewer(file, self.result_path / relative_path)
-            file_reviewer.review()
+            file_reviewer = FileReviewer(
+                file,
+                self.result_path / relative_path if self.result_path else None,
+                report_path=relative_path,
+                use_cache=self.use_cache,
+                previous=self.previous_manifest.get(str(relative_path)),
+                index=self.index,
+            )
+            file_reviewer.parse(future.result())
+            return file_reviewer
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                discard_parse_pool(self.parse_workers)
+            with self.print_lock:
+                print(f"Error parsing {file}: {str(e)}")
+            return None
+
+    def _retrieve_contexts(
+        self, file_reviewers: list[FileReviewer]
+    ) -> dict[FileReviewer, list[dict]]:
+        """
+        Retrieve examples for the declarations of all files,
+        one batched retrieval per file extension
+        """
+        by_extension = defaultdict(list)
+        for file_reviewer in file_reviewers:
+            if file_reviewer.to_review:
+                by_extension[file_reviewer.extension].append(file_reviewer)
+
+        contexts = {}
+        for extension, reviewers in by_extension.items():
+            codes = [
+                str(chunk)
+                for file_reviewer in reviewers
+                for chunk in file_reviewer.to_review.values()
+            ]
+            extension_contexts = PromptGenerator(DATA, extension).generate_contexts(
+                codes
+            )
+
+            start = 0
+            for file_reviewer in reviewers:
+                end = start + len(file_reviewer.to_review)
+                contexts[file_reviewer] = extension_contexts[start:end]
+                start = end
+
+        return contexts
+
+    def _review_file(
+        self, file_reviewer: FileReviewer, contexts: Optional[list[dict]]
+    ) -> list[ReviewRecord]:
+        try:
+            return file_reviewer.review(contexts)
         except Exception as e:
             with self.print_lock:
-                print(f"Error reviewing {file}: {str(e)}")
+                print(f"Error reviewing {file_reviewer.file_path}: {str(e)}")
+            return []
         # time.sleep(1)
 
-    def review(self) -> None:
-        files_to_review = [
-            file
-            for file in self.project_path.rglob("*")
-            if file.is_file() and get_file_extension(file) in FILE_EXTENSIONS
-        ]
+    def _build_index(self, files: Iterable[Path]) -> Optional[ProjectIndex]:
+        try:
+            executor = parse_pool(self.parse_workers) if self.parse_workers > 0 else None
+            return build_project_index(self.project_path, files, executor)
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                discard_parse_pool(self.parse_workers)
+            # Reviews go on without the signatures from other files
+            print(f"Error indexing {self.project_path}: {str(e)}")
+            return None
+
+    def _start_structure_review(self, files: list[Path]) -> Optional[Future]:
+        rules = self._structure_rules(files)
+        return ENGINE.submit(ENDPOINT, self._review_structure, rules) if rules else None
+
+    def iter_review(self) -> Iterator[FileReview]:
+        """
+        Yield review records of every file as soon as the file is reviewed
+
+        The project is indexed first, see `ProjectIndex`: a pass in the
+        `parse_workers` processes that only parses the files, running while
+        they are still being listed or extracted (see `files`). Then files
+        go through two stages: parsing and chunking in `parse_workers`
+        processes, then retrieval in batches of `RETRIEVAL_BATCH_FILES` and
+        review in `max_workers` threads. At most `queue_size` files are
+        between the stages, so parsing waits for slow reviews.
+
+        The project structure is reviewed meanwhile as one more model request,
+        its findings are yielded with `file` set to `STRUCTURE_FILE`
+        """
+        if self.files is None:
+            files = [
+                file
+                for file in self.project_path.rglob("*")
+                if file.is_file() and get_file_extension(file) in FILE_EXTENSIONS
+            ]
+        else:
+            files = iter(self.files)
+
+        # The languages of the structure rules are known up front
+        # unless `files` is a generator without `project_files`
+        structure = None
+        if isinstance(files, list):
+            structure = self._start_structure_review(files)
+        elif self.project_files is not None:
+            structure = self._start_structure_review(
+                [
+                    Path(path)
+                    for path in self.project_files
+                    if get_file_extension(Path(path)) in FILE_EXTENSIONS
+                ]
+            )
+        structure_started = isinstance(files, list) or self.project_files is not None
 
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            future_to_file = {
-                executor.submit(self._review_file, file): file
-                for file in files_to_review
-            }
-
-            # Process completed reviews with progress bar
-            with tqdm(total=len(files_to_review)) as pbar:
-                for future in as_completed(future_to_file):
-                    file = future_to_file[future]
-                    try:
-                        future.result()  # This will raise any exceptions that occurred
-                    except Exception as e:
-                        with self.print_lock:
-                            print(f"Review failed for {file}: {str(e)}")
+        files_to_review = []
+
+        def listing() -> Iterator[Path]:
+            for file in files:
+                files_to_review.append(file)
+                yield file
+
+        if CONTEXT_SIGNATURES > 0:
+            self.index = self._build_index(listing())
+        # Files left when the index is disabled or failed part way
+        files_to_review.extend(files)
+        if not structure_started:
+            structure = self._start_structure_review(files_to_review)
+
+        total = len(files_to_review)
+        done = 0
+        pending = iter(files_to_review)
+
+        # future -> file
+        parsing = {}
+        # Parsed files waiting for retrieval
+        ready = []
+        # future -> FileReviewer
+        reviewing = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor, tqdm(
+            total=total
+        ) as pbar:
+            while True:
+                while len(parsing) + len(ready) + len(reviewing) < self.queue_size:
+                    file = next(pending, None)
+                    if file is None:
+                        break
+                    parsing[self._submit_parse(file)] = file
+
+                # Retrieve a full batch, or whatever is parsed when parsing stalls
+                if ready and (len(ready) >= RETRIEVAL_BATCH_FILES or not parsing):
+                    contexts = self._retrieve_contexts(ready)
+                    for file_reviewer in ready:
+                        future = executor.submit(
+                            self._review_file,
+                            file_reviewer,
+                            contexts.get(file_reviewer, []),
+                        )
+                        reviewing[future] = file_reviewer
+                    ready = []
+
+                if not parsing and not reviewing and structure is None:
+                    break
+
+                finished, _ = wait(
+                    [*parsing, *reviewing, *([structure] if structure else [])],
+                    return_when=FIRST_COMPLETED,
+                )
+                for future in finished:
+                    if future is structure:
+                        structure = None
+                        try:
+                            items = future.result()
+                        except Exception as e:
+                            print(
+                                f"Error reviewing structure of {self.project_path}: {str(e)}"
+                            )
+                            items = []
+                        yield FileReview(
+                            file=Path(STRUCTURE_FILE), items=items, done=done, total=total
+                        )
+                        continue
+
+                    if future in parsing:
+                        file_reviewer = self._parsed(parsing.pop(future), future)
+                        if file_reviewer is not None:
+                            ready.append(file_reviewer)
+                        else:
+                            # Files that failed to parse have nothing to review
+                            done += 1
+                            pbar.update(1)
+                        continue
+
+                    file_reviewer = reviewing.pop(future)
+                    relative_path = file_reviewer.file_path.relative_to(
+                        self.project_path
+                    )
+                    self.manifest["files"][str(relative_path)] = file_reviewer.manifest
+                    done += 1
                     pbar.update(1)
+                    yield FileReview(
+                        file=relative_path,
+                        items=future.result(),
+                        done=done,
+                        total=total,
+                    )
+
+        print(f"Model requests: {CLIENT.metrics()}")
+        if RESPONSE_CACHE is not None:
+            print(f"Response cache: {RESPONSE_CACHE.stats()}")
+
+    def review(
+        self, on_result: Optional[Callable[[FileReview], None]] = None
+    ) -> list[ReviewRecord]:
+        """
+        `on_result` -- called with the review of every file as soon as it is done
+
+        Returns review records of the whole project
+        """
+        records = []
+        for file_review in self.iter_review():
+            records.extend(file_review.items)
+            if on_result is not None:
+                on_result(file_review)
+        return records
@@ -1,4 +1,3 @@
-from asyncio.log import logger
 from pathlib import Path
 from collections import defaultdict
 from src.review.styleguide.py_styleguide import py_styleguide_prompts
@@ -8,7 +7,7 @@ import re
 
 
 def get_file_extension(file_path: Path) -> str:
-    return file_path.suffix[1:]
+    return file_path.suffix[1:].lower()
 
 
 def language_from_file_extension(file_extension: str) -> str:
@@ -47,6 +46,27 @@ def merge_json_responses(json_responses: list[dict]) -> str:
     return result
 
 
+def shift_line_numbers(review: dict, shift: int) -> dict:
+    """
+    Shift the leading line number of every review key by `shift`
+    """
+    shifted = {}
+    for key, comment in review.items():
+        match = re.match(r"^\d+", key)
+        if match:
+            key = str(int(match.group()) + shift) + key[match.end() :]
+        shifted[key] = comment
+    return shifted
+
+
+# Rough ratio for code, the model tokenizer is not available locally
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
 def add_line_numbers(code: str, start_line: int) -> str:
     return "\n".join(
         [f"{start_line + i + 1} {line}" for i, line in enumerate(code.split("\n"))]
@@ -61,49 +81,3 @@ def get_styleguide_by_language(language: str) -> dict[str, str]:
     }
     return styleguide_prompts.get(language, {})
 
-
-def parse_review_tags(review_dir: Path) -> list[dict]:
-    """Parse review tags and their context from reviewed files."""
-    diffs = []
-
-    for file_path in review_dir.rglob("*"):
-        if not file_path.is_file():
-            continue
-
-        try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                content = f.read()
-
-            # Get original file path from review output
-            original_file = str(file_path).replace(str(review_dir), "").lstrip("/")
-
-            # Find all review blocks
-            review_blocks = re.finditer(
-                r"//<REVIEW>(.*?)</REVIEW>\s*\n(.*?)(?=\n|$)", content, re.DOTALL
-            )
-
-            for match in review_blocks:
-                review_comment = match.group(1).strip()
-                affected_code = match.group(2).strip()
-
-                # Try to determine the language for syntax highlighting
-                try:
-                    language = language_from_file_extension(file_path.suffix[1:])
-                except KeyError:
-                    language = "text"
-
-                diffs.append(
-                    {
-                        "file": original_file,
-                        "line_number": content[: match.start()].count("\n") + 1,
-                        "review": review_comment,
-                        "original": affected_code,
-                        "replacement": "# TODO: Implement suggested changes",
-                        "language": language,
-                    }
-                )
-
-        except Exception as e:
-            logger.error(f"Error parsing review file {file_path}: {e}")
-
-    return diffs
@@ -0,0 +1,61 @@
+import zipfile
+
+import pytest
+
+pytest.importorskip("py7zr")
+
+import src.bot.utils as utils
+from src.bot.utils import ArchiveLimitError, ProjectArchive
+
+
+def make_zip(path, members: dict[str, bytes], compression=zipfile.ZIP_STORED):
+    with zipfile.ZipFile(path, "w", compression=compression) as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+    return str(path)
+
+
+def test_members_escaping_the_extraction_directory_are_skipped(tmp_path):
+    file_path = make_zip(
+        tmp_path / "project.zip",
+        {
+            "project/app.py": b"x = 1\n",
+            "project/App.PY": b"y = 2\n",
+            "../evil.py": b"import os\n",
+            "/etc/evil.py": b"import os\n",
+            "project/../../evil.py": b"import os\n",
+        },
+    )
+
+    with ProjectArchive(file_path) as archive:
+        assert sorted(archive.selected) == ["project/App.PY", "project/app.py"]
+        extracted = list(archive.extract(tmp_path / "extracted"))
+
+    assert sorted(path.name for path in extracted) == ["App.PY", "app.py"]
+    assert not (tmp_path / "evil.py").exists()
+
+
+@pytest.mark.parametrize(
+    "limit, value",
+    [("ARCHIVE_MAX_FILES", 2), ("ARCHIVE_MAX_MB", 0), ("ARCHIVE_MAX_RATIO", 10)],
+)
+def test_archives_over_a_limit_are_refused(tmp_path, monkeypatch, limit, value):
+    monkeypatch.setattr(utils, limit, value)
+    file_path = make_zip(
+        tmp_path / "project.zip",
+        {f"project/{i}.py": b"x = 1\n" * 10_000 for i in range(3)},
+        compression=zipfile.ZIP_DEFLATED,
+    )
+
+    with pytest.raises(ArchiveLimitError):
+        ProjectArchive(file_path)
+
+
+def test_archive_within_the_limits_is_accepted(tmp_path):
+    file_path = make_zip(
+        tmp_path / "project.zip",
+        {f"project/{i}.py": b"x = 1\n" * 10_000 for i in range(3)},
+    )
+
+    with ProjectArchive(file_path) as archive:
+        assert len(archive.selected) == 3
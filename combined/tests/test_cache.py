@@ -0,0 +1,27 @@
+from src.review.cache import DiskCache
+
+
+def test_eviction_counts_entries_of_other_processes(tmp_path):
+    path = tmp_path / "cache.sqlite3"
+    first = DiskCache(path, max_bytes=300)
+    second = DiskCache(path, max_bytes=300)
+
+    first.put("a", b"x" * 100)
+    second.put("b", b"x" * 100)
+    first.put("c", b"x" * 100)
+    second.put("d", b"x" * 100)
+
+    assert len(first) == 3
+    assert first.get("a") is None
+
+
+def test_reads_keep_entries_until_written_back(tmp_path):
+    cache = DiskCache(tmp_path / "cache.sqlite3", max_bytes=200)
+
+    cache.put("a", b"x" * 100)
+    cache.put("b", b"x" * 100)
+    assert cache.get("a") == b"x" * 100
+    cache.put("c", b"x" * 100)
+
+    assert cache.get("a") is not None
+    assert cache.get("b") is None
@@ -0,0 +1,40 @@
+import pytest
+
+from src.review.client import ModelClient, RetryableError
+
+
+def make_client() -> ModelClient:
+    client = ModelClient("test", rate=1000, burst=1000, max_retries=0, base_delay=0)
+    client.breaker.reset_timeout = 0
+    return client
+
+
+def raising(error: Exception):
+    def request(timeout):
+        raise error
+
+    return request
+
+
+def test_non_retryable_error_in_trial_lets_the_next_call_through():
+    client = make_client()
+    for _ in range(client.breaker.failure_threshold):
+        with pytest.raises(RetryableError):
+            client.call(raising(RetryableError("down", 500)))
+    assert client.breaker.state == "half-open"
+
+    with pytest.raises(ValueError):
+        client.call(raising(ValueError("bad request")))
+
+    assert client.call(lambda timeout: "ok") == "ok"
+    assert client.breaker.state == "closed"
+
+
+def test_throttling_does_not_open_the_circuit():
+    client = make_client()
+    for _ in range(client.breaker.failure_threshold * 2):
+        with pytest.raises(RetryableError):
+            client.call(raising(RetryableError("slow down", 429, retry_after=0)))
+
+    assert client.breaker.state == "closed"
+    assert client.metrics()["rejected"] == 0
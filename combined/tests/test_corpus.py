@@ -0,0 +1,25 @@
+import json
+
+from src.review.corpus import convert_corpus, load_corpus
+
+
+def write_example(review_dir, name, query):
+    path = review_dir / "py" / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(
+        json.dumps({"query": query, "answer": "{}", "embedding": [1.0, 0.0]})
+    )
+
+
+def test_stale_corpus_falls_back_to_the_json_files(tmp_path):
+    review_dir = tmp_path / "review"
+    write_example(review_dir, "a.json", "x = 1")
+    convert_corpus(review_dir, tmp_path / "corpus")
+
+    assert load_corpus(tmp_path, "py").ids == ["a.json"]
+
+    write_example(review_dir, "b.json", "y = 2")
+    corpus = load_corpus(tmp_path, "py")
+
+    assert corpus.ids == ["a.json", "b.json"]
+    assert corpus.example(1)["query"] == "y = 2"
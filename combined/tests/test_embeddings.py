@@ -0,0 +1,19 @@
+import pytest
+
+pytest.importorskip("chromadb")
+pytest.importorskip("optimum.onnxruntime")
+
+from src.review.embeddings import ONNX_MODEL_PATH, check_parity
+from src.review.review import DATA_PATH
+
+
+def test_onnx_embeddings_match_the_shipped_corpus():
+    if not (ONNX_MODEL_PATH / "fp32" / "model.onnx").exists():
+        pytest.skip(f"No ONNX export in {ONNX_MODEL_PATH}")
+    if not (DATA_PATH / "corpus").exists() and not (DATA_PATH / "review").exists():
+        pytest.skip(f"No review examples in {DATA_PATH}")
+
+    result = check_parity(DATA_PATH, "onnx", limit=16)
+
+    assert result["count"] > 0
+    assert result["min"] >= 0.99
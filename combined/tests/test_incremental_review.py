@@ -0,0 +1,36 @@
+import src.review.review as review
+from src.review.review import FileReviewer
+
+
+class NoExamples:
+    def get_reviews(self, codes, extension, n_results=3):
+        return [[] for _ in codes]
+
+
+def test_unchanged_function_keeps_its_findings_after_inserted_lines(
+    tmp_path, monkeypatch
+):
+    requests = []
+
+    def answer(system_prompt, user_prompt, context):
+        requests.append(user_prompt)
+        return '{"2": "Вынеси 1 в константу"}'
+
+    monkeypatch.setattr(review, "DATA", NoExamples())
+    monkeypatch.setattr(review, "get_response", answer)
+    monkeypatch.setattr(review, "RESPONSE_CACHE", None)
+    path = tmp_path / "app.py"
+    path.write_text("def helper(x):\n    return x + 1\n")
+
+    first = FileReviewer(path, use_cache=False)
+    records = first.review()
+    assert [record.line for record in records] == [2]
+    assert len(requests) == 1
+
+    path.write_text("import os\n\n\ndef helper(x):\n    return x + 1\n")
+    second = FileReviewer(path, use_cache=False, previous=first.manifest)
+    records = second.review()
+
+    assert [record.line for record in records] == [5]
+    assert [record.comment for record in records] == ["Вынеси 1 в константу"]
+    assert len(requests) == 1
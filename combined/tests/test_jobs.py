@@ -0,0 +1,44 @@
+import time
+
+from src.bot.jobs import ReviewJob, SQLiteJobBackend
+
+
+def make_job() -> ReviewJob:
+    return ReviewJob(
+        user_id=1,
+        chat_id=1,
+        file_name="project.zip",
+        upload_object="uploads/1/project.zip",
+        file_type="archive",
+        status_message_id=1,
+    )
+
+
+def test_stale_worker_cannot_extend_or_finish_a_reclaimed_job(tmp_path):
+    backend = SQLiteJobBackend(tmp_path / "jobs.sqlite3")
+    job = make_job()
+    backend.put(job)
+
+    assert backend.claim("a", lease=0.01).id == job.id
+    time.sleep(0.05)
+    assert backend.claim("b").id == job.id
+
+    assert not backend.heartbeat(job.id, "a")
+    assert not backend.complete(job.id, "a", "results/stale.json")
+    assert backend.heartbeat(job.id, "b")
+    assert backend.complete(job.id, "b", "results/fresh.json")
+    assert backend.get(job.id)["result_object"] == "results/fresh.json"
+
+
+def test_sweep_returns_jobs_out_of_attempts(tmp_path):
+    backend = SQLiteJobBackend(tmp_path / "jobs.sqlite3", max_attempts=1)
+    job = make_job()
+    backend.put(job)
+
+    assert backend.claim("a", lease=0.01).id == job.id
+    time.sleep(0.05)
+
+    assert backend.claim("b") is None
+    assert [swept.id for swept in backend.sweep()] == [job.id]
+    assert backend.get(job.id)["status"] == "failed"
+    assert backend.sweep() == []
@@ -0,0 +1,22 @@
+from src.review.parsers.make_chunks import chunk_code
+from src.review.utils import estimate_tokens
+
+
+def test_oversized_line_is_not_repeated_as_context():
+    long_line = "    data = [" + ", ".join(str(i) for i in range(5000)) + "]\n"
+    code = (
+        "def handler(request):\n"
+        + "".join(f"    value_{i} = request.get({i})\n" for i in range(20))
+        + long_line
+        + "".join(f"    result_{i} = value_{i} * 2\n" for i in range(20))
+        + "    return data\n"
+    )
+
+    _, declarations = chunk_code(code, "py", max_tokens=50)
+
+    windows = list(declarations.values())
+    assert len(windows) > 1
+    assert sum(str(window).count("data = [") for window in windows) == 1
+    for window in windows:
+        if "data = [" not in str(window):
+            assert estimate_tokens(str(window)) <= 50
@@ -0,0 +1,25 @@
+from src.review.packer import split_review
+
+
+def test_split_review_assigns_lines_between_declarations():
+    # Declarations on lines 3-5, 9-12 and 15-20
+    ranges = [(3, 5), (9, 12), (15, 20)]
+    review = {
+        "1": "Before the first declaration",
+        "4": "Inside the first",
+        "7": "Between the first and the second",
+        "10-11": "Inside the second",
+        "13": "Between the second and the third",
+        "16": "Inside the third",
+        "25": "After the last",
+    }
+
+    assert split_review(review, ranges) == [
+        {
+            "1": "Before the first declaration",
+            "4": "Inside the first",
+            "7": "Between the first and the second",
+        },
+        {"10-11": "Inside the second", "13": "Between the second and the third"},
+        {"16": "Inside the third", "25": "After the last"},
+    ]
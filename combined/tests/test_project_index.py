@@ -0,0 +1,55 @@
+from src.review.parsers.project_index import build_project_index, index_file
+
+
+def test_index_keeps_every_method_of_a_class(tmp_path):
+    path = tmp_path / "models.py"
+    path.write_text(
+        "class Foo:\n"
+        "    def a(self):\n"
+        "        pass\n"
+        "\n"
+        "    @property\n"
+        "    def b(self):\n"
+        "        return 1\n"
+        "\n"
+        "    def c(self, x):\n"
+        "        return x\n"
+        "\n"
+        "\n"
+        "@decorator\n"
+        "def top(x):\n"
+        "    return x\n"
+    )
+
+    symbols = dict(index_file(path)["symbols"])
+
+    assert symbols["Foo"].split("\n") == [
+        "class Foo:",
+        "    def a(self):",
+        "    @property def b(self):",
+        "    def c(self, x):",
+    ]
+    assert symbols["top"] == "@decorator def top(x):"
+
+
+
+def test_csharp_namespace_imports_other_files_only(tmp_path):
+    (tmp_path / "Store.cs").write_text(
+        "namespace App.Data\n{\n    public class Store\n    {\n    }\n}\n"
+    )
+    (tmp_path / "Cache.cs").write_text(
+        "namespace App.Data\n{\n    public class Cache\n    {\n    }\n}\n"
+    )
+    (tmp_path / "Service.cs").write_text(
+        "using App.Data;\n\n"
+        "namespace App.Services\n{\n    public class Service\n    {\n    }\n}\n"
+    )
+    index = build_project_index(
+        tmp_path, [tmp_path / "Store.cs", tmp_path / "Cache.cs", tmp_path / "Service.cs"]
+    )
+
+    def imported(file):
+        return sorted(index.files[i] for i in index.imported_files(file))
+
+    assert imported("Store.cs") == ["Cache.cs"]
+    assert imported("Service.cs") == ["Cache.cs", "Store.cs"]
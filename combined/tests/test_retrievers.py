@@ -0,0 +1,31 @@
+import numpy as np
+
+from src.review.retrievers import ExactRetriever, IVFRetriever
+
+
+def random_embeddings(seed: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    corpus = rng.standard_normal((500, 32)).astype(np.float32)
+    queries = rng.standard_normal((20, 32)).astype(np.float32)
+    return corpus, queries
+
+
+def brute_force(corpus: np.ndarray, queries: np.ndarray, k: int) -> list[list[int]]:
+    corpus = corpus / np.linalg.norm(corpus, axis=1, keepdims=True)
+    queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    return np.argsort(-(queries @ corpus.T), axis=1)[:, :k].tolist()
+
+
+def test_exact_retriever_matches_brute_force():
+    corpus, queries = random_embeddings()
+
+    assert ExactRetriever(corpus).search(queries, 5) == brute_force(
+        corpus, queries, 5
+    )
+
+
+def test_ivf_retriever_probing_every_list_is_exact():
+    corpus, queries = random_embeddings()
+    retriever = IVFRetriever(corpus, n_lists=16, n_probe=16)
+
+    assert retriever.search(queries, 5) == ExactRetriever(corpus).search(queries, 5)
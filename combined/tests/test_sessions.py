@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta
+
+from src.bot.sessions import SessionStore
+from src.review.records import ReviewRecord
+
+
+def stored_results(created_at: datetime) -> dict:
+    record = ReviewRecord(
+        file="a.py", line=1, span=(1, 1), comment="Rename", snippet="x = 1"
+    )
+    return {
+        "user_id": 1,
+        "file_name": "a.py",
+        "created_at": created_at.isoformat(),
+        "reviews": [record.to_dict()],
+    }
+
+
+def test_expired_results_are_not_stored_again(tmp_path):
+    loads = []
+
+    def loader(job_id):
+        loads.append(job_id)
+        return stored_results(datetime.now() - timedelta(hours=2))
+
+    store = SessionStore(loader=loader, ttl_hours=1, path=tmp_path / "sessions.sqlite3")
+
+    assert store.get("job") is None
+    assert store.get("job") is None
+    assert store.stats()["sessions"] == 0
+    assert store.disk.get("job") is None
+    assert loads == ["job", "job"]
+
+
+def test_valid_results_are_loaded_once():
+    loads = []
+
+    def loader(job_id):
+        loads.append(job_id)
+        return stored_results(datetime.now())
+
+    store = SessionStore(loader=loader, ttl_hours=1)
+
+    assert store.get("job").records()[0].comment == "Rename"
+    assert store.get("job").total == 1
+    assert loads == ["job"]
@@ -0,0 +1,47 @@
+from pathlib import Path
+
+import src.review.review as review
+from src.review.review import STRUCTURE_FILE, ProjectReviewer
+
+
+class NoExamples:
+    def get_reviews(self, codes, extension, n_results=3):
+        return [[] for _ in codes]
+
+
+def answer(system_prompt, user_prompt, context):
+    if "структур" in system_prompt:
+        return '{"2": "Модули лучше сложить в пакет"}'
+    return "{}"
+
+
+def test_structure_findings_use_the_structure_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(review, "DATA", NoExamples())
+    monkeypatch.setattr(review, "get_response", answer)
+    monkeypatch.setattr(review, "RESPONSE_CACHE", None)
+    (tmp_path / "app.py").write_text("def main():\n    return 1\n")
+
+    reviewer = ProjectReviewer(tmp_path, parse_workers=0, use_cache=False)
+    structure = [
+        file_review
+        for file_review in reviewer.iter_review()
+        if file_review.file == Path(STRUCTURE_FILE)
+    ]
+
+    assert len(structure) == 1
+    assert [record.file for record in structure[0].items] == [STRUCTURE_FILE]
+
+
+def test_review_returns_the_records_passed_to_on_result(tmp_path, monkeypatch):
+    monkeypatch.setattr(review, "DATA", NoExamples())
+    monkeypatch.setattr(review, "get_response", answer)
+    monkeypatch.setattr(review, "RESPONSE_CACHE", None)
+    (tmp_path / "app.py").write_text("def main():\n    return 1\n")
+
+    streamed = []
+    records = ProjectReviewer(tmp_path, parse_workers=0, use_cache=False).review(
+        lambda file_review: streamed.extend(file_review.items)
+    )
+
+    assert records == streamed
+    assert [record.file for record in records] == [STRUCTURE_FILE]